@@ -0,0 +1,223 @@
+"""
+Evaluación incremental de alertas.
+
+En vez de recorrer todos los módulos tras cada inserción, AlertEngine evalúa solo
+las lecturas recién ingresadas. Los umbrales y la hora de la última alerta por
+(modulo, tipo) viven en memoria: una lectura que no supera ningún umbral no hace
+ninguna consulta. Se mantiene el debounce de 60 s y la misma lógica de prioridad
+(>= valor_grave -> critical, >= valor_alto -> warning).
+
+DirectAlertEvaluator corre el mismo AlertEngine dentro del suscriptor en modo db,
+sobre las filas recién confirmadas y sin pasar por la API.
+"""
+from datetime import datetime
+import threading
+import os
+
+from api_avicola.models import db, Alerta
+from api_avicola.cache import ALERTS_VERSION_NAME, next_version
+
+# environment variables
+# Lecturas cuya evaluación falló que se guardan para reintentar con el lote siguiente
+ALERT_RETRY_MAX_ROWS = int(os.getenv('ALERT_RETRY_MAX_ROWS', '5000'))
+
+# Debounce: no crear otra alerta del mismo tipo/módulo antes de este tiempo
+ALERT_DEBOUNCE_SECONDS = 60
+
+# Nombres legibles para mensajes
+NOMBRES_VARIABLE = {
+    'temperatura': 'Temperatura',
+    'humedad': 'Humedad',
+    'co': 'CO',
+    'co2': 'CO₂',
+    'amoniaco': 'Amoniaco'
+}
+
+# (variable, unidad) evaluadas en cada lectura
+VARIABLES = [
+    ('temperatura', '°C'),
+    ('humedad', '%'),
+    ('co', 'ppm'),
+    ('co2', 'ppm'),
+    ('amoniaco', 'ppm')
+]
+
+
+def _value(lectura, field):
+    """Read a field from a Lectura object or a row dict"""
+    if isinstance(lectura, dict):
+        return lectura.get(field)
+    return getattr(lectura, field, None)
+
+
+class AlertEngine:
+    """Per-reading threshold evaluation with in-memory thresholds and debounce state"""
+
+    def __init__(self, threshold_store, alert_stats=None, debounce_seconds=ALERT_DEBOUNCE_SECONDS):
+        self.threshold_store = threshold_store
+        self.alert_stats = alert_stats
+        self.debounce_seconds = debounce_seconds
+        self._lock = threading.Lock()
+        self._umbrales = (None, {})  # (versión del store, variable -> (valor_alto, valor_grave))
+        self._last_alert = {}        # (modulo, tipo) -> timestamp de la última alerta
+
+    # ------------------------------------------------------------------
+    # Estado en memoria
+    # ------------------------------------------------------------------
+    def thresholds(self):
+        """(valor_alto, valor_grave) by variable, rebuilt only when the store version changes"""
+        version = self.threshold_store.version()
+        cached_version, umbrales = self._umbrales
+        if cached_version != version:
+            umbrales = {variable: (item['valor_alto'], item['valor_grave'])
+                        for variable, item in self.threshold_store.by_variable().items()}
+            self._umbrales = (version, umbrales)
+        return umbrales
+
+    def reset_debounce(self):
+        """Forget last-alert times (e.g. after deleting every alert)"""
+        with self._lock:
+            self._last_alert.clear()
+
+    def _recently_alerted(self, modulo, tipo, now):
+        """Debounce check: memory first, one DB lookup only when memory allows a new alert"""
+        key = (modulo, tipo)
+        with self._lock:
+            last = self._last_alert.get(key)
+        if last and (now - last).total_seconds() < self.debounce_seconds:
+            return last
+
+        # Otro proceso pudo haber creado una alerta desde entonces
+        last_alert = Alerta.query.filter_by(
+            tipo=tipo,
+            modulo=modulo
+        ).order_by(Alerta.timestamp.desc()).first()
+        if last_alert and last_alert.timestamp:
+            with self._lock:
+                self._last_alert[key] = last_alert.timestamp
+            if (now - last_alert.timestamp).total_seconds() < self.debounce_seconds:
+                return last_alert.timestamp
+        return None
+
+    # ------------------------------------------------------------------
+    # Evaluación
+    # ------------------------------------------------------------------
+    def evaluate(self, lecturas):
+        """Evaluate freshly ingested readings (latest one per module) and commit any new alerts"""
+        latest = {}
+        for lectura in lecturas:
+            modulo = _value(lectura, 'modulo')
+            hora = _value(lectura, 'hora')
+            current = latest.get(modulo)
+            if current is None or (hora is not None and _value(current, 'hora') is not None
+                                   and hora >= _value(current, 'hora')):
+                latest[modulo] = lectura
+
+        nuevas = []
+        for modulo, lectura in latest.items():
+            nuevas.extend(self._evaluate_one(modulo, lectura))
+
+        if nuevas:
+            # Se leen antes del commit, que expira los atributos
+            created = [(alerta.modulo, alerta.tipo, alerta.timestamp, alerta.prioridad) for alerta in nuevas]
+            version = next_version(ALERTS_VERSION_NAME)
+            for alerta in nuevas:
+                alerta.version = version
+            db.session.add_all(nuevas)
+            db.session.commit()
+            with self._lock:
+                for modulo, tipo, timestamp, _ in created:
+                    self._last_alert[(modulo, tipo)] = timestamp
+            if self.alert_stats:
+                self.alert_stats.created(prioridad for _, _, _, prioridad in created)
+        return nuevas
+
+    def _evaluate_one(self, modulo, lectura):
+        umbrales = self.thresholds()
+        nuevas = []
+        for variable, unidad in VARIABLES:
+            valor = _value(lectura, variable)
+            if valor is None:
+                continue
+
+            umbral = umbrales.get(variable)
+            if not umbral:
+                continue
+            valor_alto, valor_grave = umbral
+
+            # Determine priority (sin consultas si no se supera ningún umbral)
+            nombre_legible = NOMBRES_VARIABLE.get(variable, variable.title())
+            if valor >= valor_grave:
+                prioridad = 'critical'
+                umbral_valor = valor_grave
+                mensaje = (
+                    f"{nombre_legible} en {modulo} superó el umbral CRÍTICO: "
+                    f"{valor:.2f} {unidad} (umbral {valor_grave:.2f} {unidad})"
+                )
+            elif valor >= valor_alto:
+                prioridad = 'warning'
+                umbral_valor = valor_alto
+                mensaje = (
+                    f"{nombre_legible} en {modulo} superó el umbral ALTO: "
+                    f"{valor:.2f} {unidad} (umbral {valor_alto:.2f} {unidad})"
+                )
+            else:
+                continue
+
+            # Throttling / Debounce
+            now = datetime.utcnow()
+            last = self._recently_alerted(modulo, variable, now)
+            if last:
+                print(f"Skipping alert for {variable} in {modulo}: too recent ({int((now - last).total_seconds())}s ago)")
+                continue
+
+            nuevas.append(Alerta(
+                tipo=variable,
+                prioridad=prioridad,
+                mensaje=mensaje,
+                modulo=modulo,
+                valor_actual=valor,
+                umbral=umbral_valor,
+                sensor=f"{variable.title()} Sensor #{modulo}",
+                timestamp=now
+            ))
+        return nuevas
+
+
+class DirectAlertEvaluator:
+    """Alert evaluation for rows committed by the subscriber's direct DB writer
+
+    Used as DatabaseSink.after_write: runs AlertEngine in a small Flask app bound to
+    the same database. The API notices the new alerts through the 'alertas' counter.
+    A failed evaluation is logged and its rows are retried with the next batch.
+    """
+
+    def __init__(self, database_url, max_retry_rows=ALERT_RETRY_MAX_ROWS):
+        from flask import Flask
+        from api_avicola.cache import ThresholdStore
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 1, 'pool_pre_ping': True}
+        db.init_app(self.app)
+        self.alert_engine = AlertEngine(ThresholdStore())
+        self.max_retry_rows = max_retry_rows
+        self._retry = []
+        self.failures = 0
+
+    def __call__(self, rows):
+        rows = self._retry + list(rows)
+        self._retry = []
+        try:
+            with self.app.app_context():
+                try:
+                    self.alert_engine.evaluate(rows)
+                except Exception:
+                    db.session.rollback()
+                    raise
+        except Exception as e:
+            self.failures += 1
+            # Solo cuenta la última lectura por módulo: alcanza con guardar las más nuevas
+            self._retry = rows[-self.max_retry_rows:]
+            print(f"❌ Error evaluando alertas de {len(rows)} lecturas (se reintenta con el próximo lote): {e}")
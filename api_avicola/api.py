@@ -1,10 +1,10 @@
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 import os
 from datetime import datetime, timedelta
+import itertools
 import threading
 import time
 import math
@@ -15,9 +15,19 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+from api_avicola.models import db, Lectura, User, Umbral, Alerta, AlertaEliminada, CacheVersion
+from api_avicola import migrations, historical, encoding, pagination
+from api_avicola.alert_engine import AlertEngine
+from api_avicola.cache import (ThresholdStore, LastValueCache, HistoricalCache, AlertStats, USERS_VERSION_NAME,
+                               ALERTS_VERSION_NAME, ALERTS_FLOOR_NAME, bump_version, next_version,
+                               read_version, has_late_rows, bump_versions_after_commit)
+from api_avicola.stream import EventStream, STREAM_EVENTS
+from api_avicola.rollups import update_rollups
+
 load_dotenv()
 app = Flask(__name__)
-CORS(app)
+# Headers de /api/alerts (cursor de la página siguiente, versión de cambios) legibles desde el navegador
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Alerts-Version'])
 
 # Security: Rate Limiting
 # We set a generous global limit but strict limits on sensitive endpoints (login/register)
@@ -25,7 +35,8 @@ limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["10000 per day", "2000 per hour"],
-    storage_uri="memory://"
+    # Compartido entre workers en producción (p. ej. redis://redis:6379)
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
 )
 
 @app.after_request
@@ -40,147 +51,82 @@ def add_security_headers(response):
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
-
-class Lectura(db.Model):
-    __tablename__ = 'lecturas'
-    id_lectura = db.Column(db.String, primary_key=True)
-    modulo = db.Column(db.String)
-    hora = db.Column(db.DateTime)  
-    temperatura = db.Column(db.Float)
-    humedad = db.Column(db.Float)
-    co = db.Column(db.Float)
-    co2 = db.Column(db.Float)
-    amoniaco = db.Column(db.Float)
-
-class User(db.Model):
-    __tablename__ = 'users'
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=False)
-    full_name = db.Column(db.String(120))
-    role = db.Column(db.String(50))
-    initials = db.Column(db.String(10))
-    profile_image_url = db.Column(db.String(500))
-    
-    def set_password(self, password):
-        """Hash the password and store it"""
-        self.password_hash = generate_password_hash(password)
-    
-    def check_password(self, password):
-        """Check if the provided password matches the hash"""
-        return check_password_hash(self.password_hash, password)
-
-class Umbral(db.Model):
-    __tablename__ = 'umbrales'
-    id = db.Column(db.Integer, primary_key=True)
-    variable = db.Column(db.String(50), unique=True, nullable=False)
-    valor_medio = db.Column(db.Float, nullable=False)
-    valor_alto = db.Column(db.Float, nullable=False)
-    valor_grave = db.Column(db.Float, nullable=False)
-
-class Alerta(db.Model):
-    __tablename__ = 'alertas'
-    id = db.Column(db.Integer, primary_key=True)
-    tipo = db.Column(db.String(50), nullable=False)  # temperature, humidity, co, co2, amoniaco
-    prioridad = db.Column(db.String(20), nullable=False)  # critical, warning, info
-    mensaje = db.Column(db.Text, nullable=False)
-    modulo = db.Column(db.String(50), nullable=False)
-    valor_actual = db.Column(db.Float)
-    umbral = db.Column(db.Float)
-    estado = db.Column(db.String(20), default='active')  # active, acknowledged, resolved
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    timestamp_resuelto = db.Column(db.DateTime)
-    sensor = db.Column(db.String(100))
-
-# Create tables if they don't exist 
+db.init_app(app)
+
+# Create/upgrade tables and indexes (see api_avicola/migrations.py)
+with app.app_context():
+    migrations.upgrade(db.engine)
+
+# Versioned thresholds cache, shared by the alert engine and GET /api/umbrales
+threshold_store = ThresholdStore()
+
+# Latest reading per module for /api/live-data and GET /lecturas
+live_cache = LastValueCache()
+
+# Closed /api/historical blocks (bounded LRU, see api_avicola/cache.py)
+historical_cache = HistoricalCache()
+
+# Warm the last-value cache so the first dashboard polls don't hit the DB
 with app.app_context():
-    db.create_all()
+    try:
+        live_cache.warm()
+    except Exception as e:
+        print(f"Error warming live data cache: {e}")
+
+# Alert counts for /api/alerts/stats, updated with deltas on every alert change
+alert_stats = AlertStats()
+
+# Incremental alert evaluation (thresholds + debounce kept in memory)
+alert_engine = AlertEngine(threshold_store, alert_stats)
 
 # Function to check and create alerts
 def check_and_create_alerts():
-    """Check latest readings and create alerts if thresholds are exceeded"""
-    umbrales = {u.variable: u for u in Umbral.query.all()}
-    
+    """Check the latest reading of every module and create alerts if thresholds are exceeded"""
     # Get latest reading for each module
     latest_readings = {}
     for lectura in Lectura.query.order_by(Lectura.hora.desc()).limit(100).all():
         if lectura.modulo not in latest_readings:
             latest_readings[lectura.modulo] = lectura
-    
-    for modulo, lectura in latest_readings.items():
-        # Nombres legibles para mensajes
-        nombres_variable = {
-            'temperatura': 'Temperatura',
-            'humedad': 'Humedad',
-            'co': 'CO',
-            'co2': 'CO₂',
-            'amoniaco': 'Amoniaco'
-        }
-
-        # Check each parameter
-        checks = [
-            ('temperatura', lectura.temperatura, '°C'),
-            ('humedad', lectura.humedad, '%'),
-            ('co', lectura.co, 'ppm'),
-            ('co2', lectura.co2, 'ppm'),
-            ('amoniaco', lectura.amoniaco, 'ppm')
-        ]
-        
-        for variable, valor, unidad in checks:
-            if valor is None:
-                continue
-                
-            umbral = umbrales.get(variable)
-            if not umbral:
-                continue
-            
-            # Check for recent alerts (Throttling / Debounce)
-            # Avoid creating a new alert if one was created recently for the same module/variable
-            last_alert = Alerta.query.filter_by(
-                tipo=variable,
-                modulo=modulo
-            ).order_by(Alerta.timestamp.desc()).first()
-            
-            if last_alert:
-                # Calculate time difference
-                time_diff = datetime.utcnow() - last_alert.timestamp
-                # If less than 60 seconds has passed, skip creating a new alert
-                if time_diff.total_seconds() < 60:
-                    print(f"Skipping alert for {variable} in {modulo}: too recent ({int(time_diff.total_seconds())}s ago)")
-                    continue
-
-            # Determine priority and create alert
-            nombre_legible = nombres_variable.get(variable, variable.title())
-
-            if valor >= umbral.valor_grave:
-                prioridad = 'critical'
-                mensaje = (
-                    f"{nombre_legible} en {modulo} superó el umbral CRÍTICO: "
-                    f"{valor:.2f} {unidad} (umbral {umbral.valor_grave:.2f} {unidad})"
-                )
-            elif valor >= umbral.valor_alto:
-                prioridad = 'warning'
-                mensaje = (
-                    f"{nombre_legible} en {modulo} superó el umbral ALTO: "
-                    f"{valor:.2f} {unidad} (umbral {umbral.valor_alto:.2f} {unidad})"
-                )
-            else:
-                continue
-            
-            nueva_alerta = Alerta(
-                tipo=variable,
-                prioridad=prioridad,
-                mensaje=mensaje,
-                modulo=modulo,
-                valor_actual=valor,
-                umbral=umbral.valor_alto if prioridad == 'warning' else umbral.valor_grave,
-                sensor=f"{variable.title()} Sensor #{modulo}"
-            )
-            
-            db.session.add(nueva_alerta)
-    
-    db.session.commit()
+
+    live_cache.update([{field: getattr(lectura, field) for field in LastValueCache.FIELDS}
+                       for lectura in latest_readings.values()], bumped=False)
+    return alert_engine.evaluate(latest_readings.values())
+
+# Columns every reading must carry (both single and batch ingest)
+LECTURA_FIELDS = ('id_lectura', 'modulo', 'hora', 'temperatura', 'humedad', 'co', 'co2', 'amoniaco')
+# Upper bound for a single POST /lecturas/batch request
+LECTURAS_BATCH_MAX = int(os.getenv('LECTURAS_BATCH_MAX', '1000'))
+
+def parse_lectura(data):
+    """Validate a reading payload and return the row dict for the lecturas table"""
+    if not isinstance(data, dict):
+        raise ValueError('reading must be a JSON object')
+
+    missing = [field for field in LECTURA_FIELDS if field not in data]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+
+    # Convert string to datetime if necessary
+    hora_data = data['hora']
+    if isinstance(hora_data, str):
+        hora_data = datetime.fromisoformat(hora_data.replace('Z', '+00:00'))
+    elif not isinstance(hora_data, datetime):
+        raise ValueError('hora must be an ISO 8601 string')
+    if hora_data.tzinfo is not None:
+        # La columna es timestamp sin zona: se guarda la hora tal como llega
+        hora_data = hora_data.replace(tzinfo=None)
+
+    row = {
+        'id_lectura': str(data['id_lectura']),
+        'modulo': str(data['modulo']),
+        'hora': hora_data
+    }
+    for field in ('temperatura', 'humedad', 'co', 'co2', 'amoniaco'):
+        valor = data[field]
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, (int, float))):
+            raise ValueError(f'{field} must be a number or null')
+        row[field] = float(valor) if valor is not None else None
+    return row
 
 # MQTT endpoint
 @app.route('/lecturas', methods=['POST'])
@@ -191,28 +137,24 @@ def insert_lectura():
         data = request.get_json()
         print(f"MQTT INSERT: {data}")
 
-        # Convert string to datetime if necessary
-        hora_data = data['hora']
-        if isinstance(hora_data, str):
-            hora_data = datetime.fromisoformat(hora_data.replace('Z', '+00:00'))
-
-        nueva_lectura = Lectura(
-            id_lectura=data['id_lectura'],
-            modulo=data['modulo'],
-            hora=hora_data,
-            temperatura=data['temperatura'],
-            humedad=data['humedad'],
-            co=data['co'],
-            co2=data['co2'],
-            amoniaco=data['amoniaco']
-        )
+        row = parse_lectura(data)
+        nueva_lectura = Lectura(**row)
 
         db.session.add(nueva_lectura)
+        update_rollups(db.session, [row], db.session.get_bind().dialect.name)
         db.session.commit()
-
-        # Después de insertar una nueva lectura, evaluar umbrales y generar alertas
+        # Lectura tardía: cambia bloques históricos ya cacheados
+        late = has_late_rows([row])
+        bumped = bump_versions_after_commit(LastValueCache.VERSION_NAME,
+                                            *([HistoricalCache.VERSION_NAME] if late else []))
+        live_cache.update([row], bumped)
+        if late:
+            historical_cache.invalidate()
+        event_stream.notify()
+
+        # Después de insertar una nueva lectura, evaluar umbrales solo para esa lectura
         try:
-            check_and_create_alerts()
+            alert_engine.evaluate([row])
         except Exception as e:
             # No romper la inserción de lecturas si falla la generación de alertas
             print(f"Error checking/creating alerts after MQTT insert: {e}")
@@ -225,6 +167,103 @@ def insert_lectura():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/lecturas/batch', methods=['POST'])
+@limiter.exempt
+def insert_lecturas_batch():
+    """Bulk MQTT insertions: validates every item, writes the valid ones in one multi-row INSERT"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return jsonify({'error': 'Expected a JSON array of readings'}), 400
+    if len(data) > LECTURAS_BATCH_MAX:
+        return jsonify({'error': f'Batch too large ({len(data)} > {LECTURAS_BATCH_MAX})'}), 413
+
+    results = []
+    rows = []
+    seen_ids = set()
+    for index, item in enumerate(data):
+        try:
+            row = parse_lectura(item)
+            if row['id_lectura'] in seen_ids:
+                raise ValueError('duplicate id_lectura in batch')
+            seen_ids.add(row['id_lectura'])
+            rows.append(row)
+            results.append({'index': index, 'id_lectura': row['id_lectura'], 'status': 'ok'})
+        except Exception as e:
+            id_lectura = item.get('id_lectura') if isinstance(item, dict) else None
+            results.append({'index': index, 'id_lectura': id_lectura, 'status': 'error', 'error': str(e)})
+
+    try:
+        if rows:
+            # Rechazar ids que ya existen en la BD (una sola consulta para todo el lote)
+            existing = set(db.session.scalars(
+                db.select(Lectura.id_lectura).where(Lectura.id_lectura.in_(seen_ids))
+            ))
+            if existing:
+                rows = [row for row in rows if row['id_lectura'] not in existing]
+                for result in results:
+                    if result['status'] == 'ok' and result['id_lectura'] in existing:
+                        result['status'] = 'error'
+                        result['error'] = 'id_lectura already exists'
+
+        if rows:
+            db.session.execute(db.insert(Lectura), rows)
+            update_rollups(db.session, rows, db.session.get_bind().dialect.name)
+            db.session.commit()
+            late = has_late_rows(rows)
+            bumped = bump_versions_after_commit(LastValueCache.VERSION_NAME,
+                                                *([HistoricalCache.VERSION_NAME] if late else []))
+            live_cache.update(rows, bumped)
+            if late:
+                historical_cache.invalidate()
+            event_stream.notify()
+
+            # Una sola evaluación de umbrales por lote (última lectura de cada módulo)
+            try:
+                alert_engine.evaluate(rows)
+            except Exception as e:
+                print(f"Error checking/creating alerts after MQTT batch insert: {e}")
+    except Exception as e:
+        print(f"Error Inserting MQTT BATCH: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    failed = len(results) - len(rows)
+    print(f"MQTT BATCH INSERTED in DB: {len(rows)} ok, {failed} failed")
+    status_code = 400 if failed and not rows else 200
+    return jsonify({'inserted': len(rows), 'failed': failed, 'results': results}), status_code
+
+def lectura_payload(row):
+    """Serialize a cached last-value row for /lecturas and /api/live-data"""
+    hora = row['hora']
+    return {
+        'id_lectura': row['id_lectura'],
+        'modulo': row['modulo'],
+        'timestamp': hora.isoformat() if hasattr(hora, 'isoformat') else str(hora),
+        'temperatura': row['temperatura'],
+        'humedad': row['humedad'],
+        'co': row['co'],
+        'co2': row['co2'],
+        'amoniaco': row['amoniaco'],
+        'tvoc': 0,  # TVOC no está en la BD, valor por defecto
+        'sync_time': datetime.now().isoformat()
+    }
+
+def last_value_response(modulo, wrap):
+    """Conditional response for the latest reading of a module (304 if unchanged)"""
+    row = live_cache.get(modulo)
+    if not row:
+        return jsonify([] if wrap else {})
+
+    etag = f"live-{row['modulo']}-{row['id_lectura']}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        data = lectura_payload(row)
+        response = jsonify([data] if wrap else data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # ENDPINT to get the last record  
 @app.route('/lecturas', methods=['GET'])
 def get_lecturas():
@@ -232,23 +271,7 @@ def get_lecturas():
     try:
         # Get module parameter, default to M1
         modulo = request.args.get('modulo', 'M1')
-        lectura = db.session.query(Lectura).where(Lectura.modulo == modulo).order_by(Lectura.hora.desc()).first()
-        if not lectura:
-            return jsonify([])
-
-        lista = [{
-            'id_lectura': lectura.id_lectura,
-            'modulo': lectura.modulo,
-            'timestamp': lectura.hora.isoformat() if hasattr(lectura.hora, 'isoformat') else str(lectura.hora),
-            'temperatura': lectura.temperatura,
-            'humedad': lectura.humedad,
-            'co': lectura.co,
-            'co2': lectura.co2,
-            'amoniaco': lectura.amoniaco,
-            'tvoc': 0,  # TVOC no está en la BD, valor por defecto
-            'sync_time': datetime.now().isoformat()
-        }]
-        return jsonify(lista)
+        return last_value_response(modulo, wrap=True)
     except Exception as e:
         print(f"Error getting last record: {e}")
         return jsonify({'error': str(e)}), 500
@@ -261,111 +284,117 @@ def get_live_data():
     try:
         # Get module parameter, default to M1
         modulo = request.args.get('modulo', 'M1')
-        lectura = db.session.query(Lectura).where(Lectura.modulo == modulo).order_by(Lectura.hora.desc()).first()
-        if not lectura:
-            return jsonify({})
-
-        data = {
-            'id_lectura': lectura.id_lectura,
-            'modulo': lectura.modulo,
-            'timestamp': lectura.hora.isoformat() if hasattr(lectura.hora, 'isoformat') else str(lectura.hora),
-            'temperatura': lectura.temperatura,
-            'humedad': lectura.humedad,
-            'co': lectura.co,
-            'co2': lectura.co2,
-            'amoniaco': lectura.amoniaco,
-            'tvoc': 0,  # TVOC no está en la BD, valor por defecto
-            'sync_time': datetime.now().isoformat()
-        }
-        return jsonify(data)
+        return last_value_response(modulo, wrap=False)
     except Exception as e:
         print(f"Error getting live data: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Push stream (SSE) of new readings and alerts
+@app.route('/api/stream', methods=['GET'])
+@limiter.exempt
+def stream_events():
+    """Server-Sent Events: 'lectura' and 'alerta' events, optionally filtered by modulo and ?events="""
+    modulo = request.args.get('modulo', 'all')
+    events = None
+    if request.args.get('events'):
+        events = [event.strip() for event in request.args['events'].split(',') if event.strip()]
+        unknown = [event for event in events if event not in STREAM_EVENTS]
+        if unknown:
+            return jsonify({'error': f"Unknown stream events: {', '.join(unknown)}"}), 400
+    subscription = event_stream.subscribe(modulo, events)
+    if subscription is None:
+        # Límite de streams del worker: el cliente sigue con polling
+        response = jsonify({'error': 'Too many open streams, use polling'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def generate():
+        try:
+            yield from subscription.frames()
+        finally:
+            event_stream.unsubscribe(subscription)
+
+    return app.response_class(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # nginx: no bufferizar el stream
+    })
+
 
 
 @app.route('/api/historical')
 @limiter.exempt
 def historical_data():
+    range_param = request.args.get('range', '24h')
+    house_param = request.args.get('house')
+    resolution = request.args.get('resolution', 'auto')
+    max_points = request.args.get('max_points', type=int)
     try:
-        from datetime import datetime, timedelta
-        
-        range_param = request.args.get('range', '24h')
-        from_date = request.args.get('from')
-        to_date = request.args.get('to')
-        house_param = request.args.get('house')
-        
-        # Calcular el tiempo límite según el rango
-        now = datetime.now()
-        if range_param == '1m':
-            limit_time = now - timedelta(minutes=1)
-        elif range_param == '10m':
-            limit_time = now - timedelta(minutes=10)
-        elif range_param == '30m':
-            limit_time = now - timedelta(minutes=30)
-        elif range_param == '1h':
-            limit_time = now - timedelta(hours=1)
-        elif range_param == '2h':
-            limit_time = now - timedelta(hours=2)
-        elif range_param == '12h':
-            limit_time = now - timedelta(hours=12)
-        elif range_param == '24h':
-            limit_time = now - timedelta(hours=24)
-        elif range_param == '3d':
-            limit_time = now - timedelta(days=3)
-        elif range_param == '7d':
-            limit_time = now - timedelta(days=7)
-        elif range_param == '30d':
-            limit_time = now - timedelta(days=30)
-        elif range_param == '90d':
-            limit_time = now - timedelta(days=90)
-        elif range_param == 'custom' and from_date and to_date:
-            # Parse datetime-local values (ISO format without timezone)
-            limit_time = datetime.fromisoformat(from_date)
-            to_time = datetime.fromisoformat(to_date)
-            query = Lectura.query.filter(
-                Lectura.hora >= limit_time,
-                Lectura.hora <= to_time
-            )
-        else:
-            # Por defecto últimas 24 horas
-            limit_time = now - timedelta(hours=24)
-            query = Lectura.query.filter(Lectura.hora >= limit_time)
-
-        # Si no es custom, inicializar query con el filtro de tiempo
-        if range_param != 'custom':
-            query = Lectura.query.filter(Lectura.hora >= limit_time)
-            
-        # Aplicar filtro de casa si existe
-        if house_param and house_param != 'all':
-            query = query.filter(Lectura.modulo == house_param)
-            
-        lecturas = query.order_by(Lectura.hora).all()
-        
-        print(f"Obteniendo {len(lecturas)} lecturas para rango: {range_param}, casa: {house_param}")
-        
-        if not lecturas:
+        args = dict(
+            range_param=range_param,
+            from_date=request.args.get('from'),
+            to_date=request.args.get('to'),
+            house=house_param,
+            resolution=resolution,
+            points=request.args.get('points', historical.HISTORICAL_TARGET_POINTS, type=int),
+            cache=historical_cache
+        )
+        method = request.args.get('downsample', 'lttb')
+        # Negociación: binario columnar (Accept o ?format=columnar) y gzip/brotli
+        content_encoding = encoding.choose_encoding(request.accept_encodings)
+        wants_columnar = request.args.get('format') == 'columnar' or (
+            request.accept_mimetypes.best_match(['application/json', encoding.MEDIA_TYPE]) == encoding.MEDIA_TYPE
+        )
+        headers = {'Vary': 'Accept, Accept-Encoding'}
+
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        if cursor is not None or limit is not None:
+            # Paginado por cursor: páginas de tamaño acotado, sin caché de bloques ni reducción
+            if max_points is not None:
+                raise ValueError('max_points cannot be combined with limit/cursor')
+            del args['cache']
+            data = historical.page_historical(**args, limit=limit or historical.HISTORICAL_PAGE_SIZE,
+                                              cursor=cursor, keep_epoch=wants_columnar)
+            if wants_columnar:
+                body = historical.encode_columnar(data)
+                mimetype = encoding.MEDIA_TYPE
+            else:
+                body = app.json.dumps(data)
+                mimetype = 'application/json'
+            if content_encoding and len(body) >= encoding.COMPRESS_MIN_BYTES:
+                body = encoding.compress(body if isinstance(body, bytes) else body.encode(), content_encoding)
+                headers['Content-Encoding'] = content_encoding
+            return app.response_class(body, mimetype=mimetype, headers=headers)
+
+        if wants_columnar:
+            body = historical.columnar_historical(**args, max_points=max_points, method=method)
+            if content_encoding and len(body) >= encoding.COMPRESS_MIN_BYTES:
+                body = encoding.compress(body, content_encoding)
+                headers['Content-Encoding'] = content_encoding
+            return app.response_class(body, mimetype=encoding.MEDIA_TYPE, headers=headers)
+
+        if max_points is None:
+            # Sin reducción: respuesta en streaming con memoria acotada
+            chunks = historical.stream_historical(**args)
+            first = next(chunks)  # ejecuta la consulta; los errores salen como respuesta normal
+            chunks = itertools.chain([first], chunks)
+            if content_encoding:
+                chunks = encoding.compress_stream(chunks, content_encoding)
+                headers['Content-Encoding'] = content_encoding
+            return app.response_class(stream_with_context(chunks), mimetype='application/json', headers=headers)
+
+        data = historical.query_historical(**args, max_points=max_points, method=method)
+        print(f"Obteniendo {len(data['timestamps'])} puntos ({data['resolution']}) para rango: {range_param}, casa: {house_param}")
+        if not data['timestamps']:
             print("⚠️ No hay lecturas en el rango solicitado")
-            return jsonify({
-                "timestamps": [],
-                "house": [],
-                "temperature": [],
-                "humidity": [],
-                "ammonia": [],
-                "co": [],
-                "co2": []
-            })
-        
-        data = {
-            "timestamps": [l.hora.isoformat() for l in lecturas],
-            "house": [l.modulo for l in lecturas],
-            "temperature": [l.temperatura for l in lecturas],
-            "humidity": [l.humedad for l in lecturas],
-            "ammonia": [l.amoniaco for l in lecturas],
-            "co": [l.co for l in lecturas],
-            "co2": [l.co2 for l in lecturas]
-        }
-        return jsonify(data)
+        response = jsonify(data)
+        response.headers.update(headers)
+        if content_encoding and response.content_length >= encoding.COMPRESS_MIN_BYTES:
+            response.set_data(encoding.compress(response.get_data(), content_encoding))
+            response.headers['Content-Encoding'] = content_encoding
+        return response
+    except ValueError as e:
+        return jsonify(dict(historical.empty_result(resolution), error=str(e))), 400
     except Exception as e:
         print(f"❌ Error en /api/historical: {e}")
         return jsonify({
@@ -378,6 +407,12 @@ def historical_data():
             "error": str(e)
         })
 
+@app.route('/api/historical/cache')
+@limiter.exempt
+def historical_cache_stats():
+    """Hit/miss ratio and memory of this worker's historical block cache"""
+    return jsonify(historical_cache.stats())
+
 # User Management Endpoints
 @app.route('/api/register', methods=['POST'])
 @limiter.limit("5 per hour")  # Restrict registration to prevent spam
@@ -396,6 +431,7 @@ def register_user():
         )
         user.set_password(data['password'])
         db.session.add(user)
+        bump_version(USERS_VERSION_NAME)
         db.session.commit()
         return jsonify({'msg': 'User registered successfully'}), 201
     except Exception as e:
@@ -447,6 +483,7 @@ def user_detail(user_id):
             if 'initials' in data: user.initials = data['initials']
             if 'profile_image_url' in data: user.profile_image_url = data['profile_image_url']
             
+            bump_version(USERS_VERSION_NAME)
             db.session.commit()
             return jsonify({'msg': 'User updated successfully'})
 
@@ -457,16 +494,15 @@ def user_detail(user_id):
 @app.route('/api/umbrales', methods=['GET'])
 def get_umbrales():
     try:
-        umbrales = Umbral.query.all()
-        result = []
-        for u in umbrales:
-            result.append({
-                'variable': u.variable,
-                'valor_medio': u.valor_medio,
-                'valor_alto': u.valor_alto,
-                'valor_grave': u.valor_grave
-            })
-        return jsonify(result)
+        result, etag = threshold_store.snapshot()
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(result)
+        response.set_etag(etag)
+        # Revalidar siempre (los umbrales pueden cambiar desde otro cliente)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -496,7 +532,9 @@ def update_umbrales():
                 )
                 db.session.add(umbral)
         
+        bump_version(ThresholdStore.VERSION_NAME)
         db.session.commit()
+        threshold_store.invalidate()
         return jsonify({'message': 'Thresholds updated successfully'}), 200
     except Exception as e:
         db.session.rollback()
@@ -532,7 +570,9 @@ def init_umbrales():
             )
             db.session.add(umbral)
         
+        bump_version(ThresholdStore.VERSION_NAME)
         db.session.commit()
+        threshold_store.invalidate()
         return jsonify({
             'message': f'Default thresholds created ({len(default_umbrales)} records)',
             'action': 'created',
@@ -562,60 +602,185 @@ def get_historical_data(range, from_date=None, to_date=None):
         print(f"Error obteniendo datos históricos: {e}")
         return None
 
+def alerta_payload(alert):
+    """Serialize an alert for /api/alerts and the event stream"""
+    # Devolver claves tanto en inglés como en español para compatibilidad
+    return {
+        # Identificador
+        'id': alert.id,
+
+        # Campos en inglés (usados por algunos clientes)
+        'priority': alert.prioridad,
+        'type': alert.tipo,
+        'message': alert.mensaje,
+        'house': alert.modulo,
+        'timestamp': alert.timestamp.isoformat(),
+        'status': alert.estado,
+        'value': alert.valor_actual,
+        'threshold': alert.umbral,
+        'sensor': alert.sensor,
+        'resolved_at': alert.timestamp_resuelto.isoformat() if alert.timestamp_resuelto else None,
+
+        # Alias en español para el dashboard actual
+        'prioridad': alert.prioridad,
+        'tipo': alert.tipo,
+        'mensaje': alert.mensaje,
+        'modulo': alert.modulo,
+        'estado': alert.estado,
+        'valor_actual': alert.valor_actual,
+        'umbral': alert.umbral,
+        'timestamp_resuelto': alert.timestamp_resuelto.isoformat() if alert.timestamp_resuelto else None,
+
+        # Versión del último cambio (GET /api/alerts?since=)
+        'version': alert.version,
+    }
+
+# fields= de /api/alerts: "en" o "es" eligen un solo juego de claves, o una lista de claves
+ALERT_FIELD_SETS = {
+    'en': ('id', 'priority', 'type', 'message', 'house', 'timestamp', 'status', 'value', 'threshold',
+           'sensor', 'resolved_at', 'version'),
+    'es': ('id', 'prioridad', 'tipo', 'mensaje', 'modulo', 'timestamp', 'estado', 'valor_actual', 'umbral',
+           'sensor', 'timestamp_resuelto', 'version'),
+}
+ALERT_FIELDS = set(ALERT_FIELD_SETS['en'] + ALERT_FIELD_SETS['es'])
+# Tope de alertas cambiadas por respuesta delta; con más, el cliente recarga todo
+ALERTS_DELTA_MAX = int(os.getenv('ALERTS_DELTA_MAX', '1000'))
+# Antigüedad máxima de las lápidas de alertas borradas; un since anterior recarga todo
+ALERTS_TOMBSTONE_RETENTION = timedelta(seconds=float(os.getenv('ALERTS_TOMBSTONE_RETENTION', str(7 * 24 * 3600))))
+
+def alert_fields(spec):
+    """Keys to keep from alerta_payload for a fields= value (None = all)"""
+    if not spec:
+        return None
+    if spec in ALERT_FIELD_SETS:
+        return ALERT_FIELD_SETS[spec]
+    fields = tuple(field.strip() for field in spec.split(',') if field.strip())
+    unknown = [field for field in fields if field not in ALERT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown alert fields: {', '.join(unknown)}")
+    return fields
+
+def project(payload, fields):
+    return payload if fields is None else {field: payload[field] for field in fields}
+
+def prune_alert_tombstones():
+    """Drop tombstones older than ALERTS_TOMBSTONE_RETENTION and raise the floor past them (caller commits)
+
+    Pruning whole versions keeps the floor exact: a client whose since is below
+    the last pruned version may have missed those deletions and gets a reset.
+    """
+    cutoff = datetime.utcnow() - ALERTS_TOMBSTONE_RETENTION
+    pruned = db.session.scalar(
+        db.select(db.func.max(AlertaEliminada.version)).where(AlertaEliminada.eliminada_en < cutoff)
+    )
+    if pruned is None:
+        return 0
+    removed = db.session.query(AlertaEliminada).filter(
+        AlertaEliminada.version <= pruned
+    ).delete(synchronize_session=False)
+    if pruned > read_version(ALERTS_FLOOR_NAME):
+        db.session.merge(CacheVersion(name=ALERTS_FLOOR_NAME, version=pruned))
+    return removed
+
+def alerts_delta(since, query, fields, version):
+    """Alerts created/changed and ids deleted after `since`; None when nothing changed"""
+    floor = read_version(ALERTS_FLOOR_NAME)
+    if since < floor:
+        # Los cambios anteriores a un borrado total no se pueden reconstruir
+        return {'version': version, 'reset': True, 'alerts': [], 'deleted': []}
+
+    changed = query.filter(Alerta.version > since, Alerta.version <= version).order_by(
+        Alerta.version, Alerta.id
+    ).limit(ALERTS_DELTA_MAX + 1).all()
+    if len(changed) > ALERTS_DELTA_MAX:
+        return {'version': version, 'reset': True, 'alerts': [], 'deleted': []}
+    deleted = [row[0] for row in db.session.query(AlertaEliminada.alerta_id).filter(
+        AlertaEliminada.version > since, AlertaEliminada.version <= version
+    ).order_by(AlertaEliminada.version)]
+    if not changed and not deleted:
+        return None
+    return {
+        'version': version,
+        'reset': False,
+        'alerts': [project(alerta_payload(alert), fields) for alert in changed],
+        'deleted': deleted,
+    }
+
 # Alerts API endpoints
 @app.route('/api/alerts', methods=['GET'])
 @limiter.exempt
 def get_alerts():
-    """Get all alerts with filtering options"""
+    """Get alerts with filtering options, newest first
+
+    Keyset pagination on (timestamp, id): each page carries the cursor of the next
+    one. With ?cursor (empty for the first page) the response is
+    {"alerts": [...], "next_cursor": ...}; without it, the plain list with the
+    cursor in the X-Next-Cursor header.
+
+    Delta polling: every response carries the current change version in
+    X-Alerts-Version. ?since=<version> returns only what changed after it,
+    {"version", "alerts", "deleted", "reset"}, or 204 with no body when nothing
+    did (apply "deleted" before "alerts"; "reset" means reload the full list).
+    The status filter does not apply to deltas, since a status change must reach
+    the client.
+
+    ?fields=es|en|key1,key2 keeps only those keys of each alert.
+    """
     try:
         priority = request.args.get('priority', 'all')
         status = request.args.get('status', 'all')
         modulo = request.args.get('modulo', 'all')
         limit = request.args.get('limit', 100, type=int)
+        cursor = request.args.get('cursor')
+        since = request.args.get('since', type=int)
+        if limit < 1:
+            return jsonify({'error': 'limit must be positive'}), 400
+        try:
+            fields = alert_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # Leída antes de consultar: lo que cambie después se vuelve a enviar en el próximo delta
+        version = read_version(ALERTS_VERSION_NAME)
+        headers = {'X-Alerts-Version': str(version)}
         
         query = Alerta.query
         
         if priority != 'all':
             query = query.filter_by(prioridad=priority)
-        if status != 'all':
-            query = query.filter_by(estado=status)
         if modulo != 'all':
             query = query.filter_by(modulo=modulo)
+
+        if since is not None:
+            if since >= version:
+                return app.response_class(status=204, headers=headers)
+            delta = alerts_delta(since, query, fields, version)
+            if delta is None:
+                return app.response_class(status=204, headers=headers)
+            return jsonify(delta), 200, headers
+
+        if status != 'all':
+            query = query.filter_by(estado=status)
+        if cursor:
+            try:
+                timestamp, last_id = pagination.decode_cursor(cursor, 2)
+                key = [pagination.parse_timestamp(timestamp), int(last_id)]
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(pagination.after([Alerta.timestamp, Alerta.id], key, descending=True))
         
-        alerts = query.order_by(Alerta.timestamp.desc()).limit(limit).all()
-
-        # Devolver claves tanto en inglés como en español para compatibilidad
-        result = []
-        for alert in alerts:
-            item = {
-                # Identificador
-                'id': alert.id,
-
-                # Campos en inglés (usados por algunos clientes)
-                'priority': alert.prioridad,
-                'type': alert.tipo,
-                'message': alert.mensaje,
-                'house': alert.modulo,
-                'timestamp': alert.timestamp.isoformat(),
-                'status': alert.estado,
-                'value': alert.valor_actual,
-                'threshold': alert.umbral,
-                'sensor': alert.sensor,
-                'resolved_at': alert.timestamp_resuelto.isoformat() if alert.timestamp_resuelto else None,
-
-                # Alias en español para el dashboard actual
-                'prioridad': alert.prioridad,
-                'tipo': alert.tipo,
-                'mensaje': alert.mensaje,
-                'modulo': alert.modulo,
-                'estado': alert.estado,
-                'valor_actual': alert.valor_actual,
-                'umbral': alert.umbral,
-                'timestamp_resuelto': alert.timestamp_resuelto.isoformat() if alert.timestamp_resuelto else None,
-            }
-            result.append(item)
-
-        return jsonify(result)
+        alerts = query.order_by(Alerta.timestamp.desc(), Alerta.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(alerts) > limit:
+            alerts = alerts[:limit]
+            next_cursor = pagination.encode_cursor(alerts[-1].timestamp, alerts[-1].id)
+
+        result = [project(alerta_payload(alert), fields) for alert in alerts]
+
+        if cursor is not None:
+            return jsonify({'alerts': result, 'next_cursor': next_cursor, 'version': version}), 200, headers
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        return jsonify(result), 200, headers
     except Exception as e:
         print(f"Error getting alerts: {e}")
         return jsonify({'error': str(e)}), 500
@@ -626,13 +791,19 @@ def update_alert(alert_id):
     try:
         alert = Alerta.query.get_or_404(alert_id)
         data = request.get_json()
+        prioridad, old_estado = alert.prioridad, alert.estado
         
         if 'estado' in data:
             alert.estado = data['estado']
             if data['estado'] == 'resolved':
                 alert.timestamp_resuelto = datetime.utcnow()
+        changed = 'estado' in data and data['estado'] != old_estado
+        if changed:
+            alert.version = next_version(ALERTS_VERSION_NAME)
         
         db.session.commit()
+        if changed:
+            alert_stats.changed(prioridad, old_estado, data['estado'])
         return jsonify({'message': 'Alert updated successfully'})
     except Exception as e:
         print(f"Error updating alert: {e}")
@@ -640,44 +811,147 @@ def update_alert(alert_id):
 
 @app.route('/api/alerts/stats', methods=['GET'])
 def get_alert_stats():
-    """Get alert statistics"""
+    """Get alert statistics (in-memory counters, see AlertStats)"""
     try:
-        critical = Alerta.query.filter_by(prioridad='critical', estado='active').count()
-        warning = Alerta.query.filter_by(prioridad='warning', estado='active').count()
-        info = Alerta.query.filter_by(prioridad='info', estado='active').count()
-        resolved = Alerta.query.filter_by(estado='resolved').count()
-        
-        return jsonify({
-            'critical': critical,
-            'warning': warning,
-            'info': info,
-            'resolved': resolved
-        })
+        return jsonify(alert_stats.summary())
     except Exception as e:
         print(f"Error getting alert stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Bulk alert lifecycle: action -> (new estado or None to delete, states it applies to)
+ALERT_BULK_ACTIONS = {
+    'acknowledge': ('acknowledged', ('active',)),
+    'resolve': ('resolved', ('active', 'acknowledged')),
+    'delete': (None, None),
+}
+ALERT_BULK_MAX_IDS = int(os.getenv('ALERT_BULK_MAX_IDS', '10000'))
+ALERT_FILTER_FIELDS = {'priority': Alerta.prioridad, 'modulo': Alerta.modulo, 'type': Alerta.tipo, 'status': Alerta.estado}
+
+def alert_conditions(data):
+    """WHERE conditions for a bulk operation from {"ids": [...]} or {"filter": {...}}"""
+    if 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError('ids must be a list of integers')
+        if len(ids) > ALERT_BULK_MAX_IDS:
+            raise ValueError(f'Too many ids ({len(ids)} > {ALERT_BULK_MAX_IDS})')
+        return [Alerta.id.in_(ids)]
+
+    filters = data.get('filter')
+    if not isinstance(filters, dict):
+        raise ValueError('Expected "ids" or "filter"')
+    unknown = set(filters) - set(ALERT_FILTER_FIELDS) - {'from', 'to'}
+    if unknown:
+        raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+    conditions = []
+    for field, column in ALERT_FILTER_FIELDS.items():
+        value = filters.get(field)
+        if value is None or value == 'all':
+            continue
+        values = value if isinstance(value, list) else [value]
+        conditions.append(column.in_([str(v) for v in values]))
+    bounds = {}
+    for field in ('from', 'to'):
+        if filters.get(field):
+            try:
+                bounds[field] = datetime.fromisoformat(str(filters[field]).replace('Z', '+00:00')).replace(tzinfo=None)
+            except ValueError:
+                raise ValueError(f'{field} must be an ISO 8601 string')
+    if 'from' in bounds:
+        conditions.append(Alerta.timestamp >= bounds['from'])
+    if 'to' in bounds:
+        conditions.append(Alerta.timestamp < bounds['to'])
+    return conditions
+
+def bulk_alert_action(action, conditions):
+    """Run one set-based UPDATE/DELETE over the matching alerts; return (affected, counts by priority)"""
+    new_estado, from_estados = ALERT_BULK_ACTIONS[action]
+    if from_estados:
+        conditions = conditions + [Alerta.estado.in_(from_estados)]
+    # Primero el contador: su fila queda bloqueada y ordena a los demás escritores de alertas
+    version = next_version(ALERTS_VERSION_NAME)
+
+    # Conteo agrupado en la misma transacción: respuesta por prioridad y deltas de AlertStats
+    counts = {(prioridad, estado): count for prioridad, estado, count in db.session.query(
+        Alerta.prioridad, Alerta.estado, db.func.count()
+    ).filter(*conditions).group_by(Alerta.prioridad, Alerta.estado)}
+    if not counts:
+        db.session.rollback()
+        return 0, {}
+
+    if new_estado is None:
+        # Lápidas para GET /api/alerts?since=, en la misma sentencia para todo el conjunto
+        db.session.execute(db.insert(AlertaEliminada).from_select(
+            ['alerta_id', 'version', 'eliminada_en'],
+            db.select(Alerta.id, db.literal(version), db.literal(datetime.utcnow())).where(*conditions)
+        ))
+        # Solo los borrados agregan lápidas: aquí se podan las vencidas (consulta indexada)
+        prune_alert_tombstones()
+        statement = db.delete(Alerta).where(*conditions)
+    else:
+        values = {'estado': new_estado, 'version': version}
+        if new_estado == 'resolved':
+            values['timestamp_resuelto'] = datetime.utcnow()
+        statement = db.update(Alerta).where(*conditions).values(**values)
+    affected = db.session.execute(statement, execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+
+    if affected == sum(counts.values()):
+        alert_stats.moved(counts, new_estado)
+    else:
+        # Otro proceso cambió alertas entre el conteo y el UPDATE: recontar
+        alert_stats.invalidate()
+    by_priority = {}
+    for (prioridad, _), count in counts.items():
+        by_priority[prioridad] = by_priority.get(prioridad, 0) + count
+    return affected, by_priority
+
+@app.route('/api/alerts/bulk', methods=['POST'])
+def bulk_alerts():
+    """Acknowledge, resolve or delete many alerts at once, by ids or by filter"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or data.get('action') not in ALERT_BULK_ACTIONS:
+        return jsonify({'error': f"Expected a JSON object with action in {', '.join(ALERT_BULK_ACTIONS)}"}), 400
+    try:
+        conditions = alert_conditions(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        affected, by_priority = bulk_alert_action(data['action'], conditions)
+        if data['action'] == 'delete' and affected:
+            alert_engine.reset_debounce()
+        return jsonify({'action': data['action'], 'affected': affected, 'by_priority': by_priority})
+    except Exception as e:
+        print(f"Error in bulk alert action: {e}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/alerts/mark-all', methods=['PUT'])
 def mark_all_alerts():
     """Mark all active alerts as acknowledged"""
     try:
-        alerts = Alerta.query.filter_by(estado='active').all()
-        for alert in alerts:
-            alert.estado = 'acknowledged'
-        
-        db.session.commit()
-        return jsonify({'message': f'Marked {len(alerts)} alerts as acknowledged'})
+        affected, _ = bulk_alert_action('acknowledge', [])
+        return jsonify({'message': f'Marked {affected} alerts as acknowledged', 'affected': affected})
     except Exception as e:
         print(f"Error marking all alerts: {e}")
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/alerts/all', methods=['DELETE'])
 def delete_all_alerts():
     """Delete all alerts"""
     try:
+        # Primero el contador, como en bulk_alert_action: mismo orden de bloqueos, sin deadlock
+        version = next_version(ALERTS_VERSION_NAME)
         num_deleted = db.session.query(Alerta).delete()
+        # Sin lápidas: los clientes con un since anterior recargan la lista completa
+        db.session.query(AlertaEliminada).delete()
+        db.session.merge(CacheVersion(name=ALERTS_FLOOR_NAME, version=version))
         db.session.commit()
-        return jsonify({'message': f'Se eliminaron {num_deleted} alertas correctamente'})
+        alert_engine.reset_debounce()
+        alert_stats.cleared()
+        return jsonify({'message': f'Se eliminaron {num_deleted} alertas correctamente', 'affected': num_deleted})
     except Exception as e:
         print(f"Error deleting all alerts: {e}")
         db.session.rollback()
@@ -693,7 +967,31 @@ def trigger_alert_check():
         print(f"Error checking alerts: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Fan-out of new readings/alerts to /api/stream clients
+event_stream = EventStream(app, live_cache, lectura_payload, alerta_payload, Alerta)
+
+@app.route('/health')
+@limiter.exempt
+def health():
+    """Health check for docker-compose: the worker answers and the database is reachable"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        print(f"❌ Health check: {e}")
+        return jsonify({'status': 'error', 'error': str(e)}), 503
+
+def after_fork():
+    """Drop the database connections inherited from the gunicorn master"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def on_shutdown():
+    """Graceful shutdown: end the open SSE streams so in-flight requests can finish"""
+    event_stream.close()
+
 def start(port=5000, host='0.0.0.0'):
+    """Development server (production: run_api.py, see serving.py)"""
     app.run(debug=True, port=port, host=host, use_reloader=False)
 
 if __name__ == '__main__':
@@ -0,0 +1,451 @@
+"""
+Cachés en proceso de la API.
+
+ThresholdStore: umbrales versionados. Cada escritura incrementa un contador en la
+tabla cache_versions dentro de la misma transacción; los demás workers lo consultan
+como mucho cada UMBRALES_CHECK_INTERVAL segundos (polling) y recargan solo si cambió.
+
+LastValueCache: última lectura por módulo para /api/live-data y GET /lecturas. Se
+actualiza en cada ingesta; solo vuelve a la BD cuando otro proceso insertó lecturas
+(contador 'lecturas' en cache_versions), y entonces lee únicamente las lecturas
+recientes. La consulta agrupada sobre toda la tabla corre una sola vez, al arrancar.
+
+HistoricalCache: bloques cerrados de /api/historical (LRU acotado en bytes). Un
+bloque cerrado no cambia salvo por lecturas tardías; la ingesta que trae lecturas
+más viejas que HISTORICAL_CACHE_SETTLE incrementa el contador 'historical' y todos
+los workers vacían su caché.
+
+AlertStats: conteos de alertas por (prioridad, estado) para /api/alerts/stats. Se
+cargan con una consulta agrupada y se mantienen con deltas en cada cambio de
+alertas; el contador 'alertas' avisa a los demás workers, y cada
+ALERT_STATS_RECONCILE segundos se reconcilian igual contra la BD.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+import time
+import os
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from api_avicola.models import db, Lectura, Umbral, Alerta, CacheVersion
+
+# environment variables
+UMBRALES_CHECK_INTERVAL = float(os.getenv('UMBRALES_CHECK_INTERVAL', '5'))
+LIVE_CHECK_INTERVAL = float(os.getenv('LIVE_CHECK_INTERVAL', '2'))
+# Puesta al día periódica aunque el contador no cambie (un incremento perdido no deja el caché viejo)
+LIVE_RESYNC_INTERVAL = float(os.getenv('LIVE_RESYNC_INTERVAL', '300'))
+LIVE_LATE_WINDOW = timedelta(seconds=float(os.getenv('LIVE_LATE_WINDOW', '300')))
+HISTORICAL_CACHE_MAX_BYTES = int(os.getenv('HISTORICAL_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+HISTORICAL_CACHE_CHECK_INTERVAL = float(os.getenv('HISTORICAL_CACHE_CHECK_INTERVAL', '5'))
+# Un bloque se considera cerrado cuando terminó hace más de esto (margen para lecturas tardías)
+HISTORICAL_CACHE_SETTLE = timedelta(seconds=float(os.getenv('HISTORICAL_CACHE_SETTLE', '300')))
+HISTORICAL_VERSION_NAME = 'historical'
+# Cambios en la tabla users; lo lee el caché de usuarios del dashboard
+USERS_VERSION_NAME = 'users'
+ALERT_STATS_CHECK_INTERVAL = float(os.getenv('ALERT_STATS_CHECK_INTERVAL', '5'))
+ALERT_STATS_RECONCILE = float(os.getenv('ALERT_STATS_RECONCILE', '300'))
+ALERTS_VERSION_NAME = 'alertas'
+# Versión desde la que hay historial de cambios de alertas (DELETE /api/alerts/all la adelanta)
+ALERTS_FLOOR_NAME = 'alertas_floor'
+
+
+def read_version(name):
+    """Current value of a cache version counter (0 if it was never bumped)"""
+    version = db.session.get(CacheVersion, name)
+    return version.version if version else 0
+
+
+def bump_statement(name, dialect_name):
+    """INSERT ... ON CONFLICT DO UPDATE that increments a counter (created at 1)
+
+    A single statement: with UPDATE-then-INSERT, two workers bumping a counter
+    that does not exist yet would both INSERT and one would fail.
+    """
+    dialect_insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    table = CacheVersion.__table__
+    stmt = dialect_insert(table).values(name=name, version=1)
+    return stmt.on_conflict_do_update(index_elements=['name'], set_={'version': table.c.version + 1})
+
+
+def bump_version(name):
+    """Increment a version counter in the current transaction (caller commits)"""
+    db.session.execute(bump_statement(name, db.session.get_bind().dialect.name))
+
+
+def bump_versions_after_commit(*names):
+    """Increment version counters in their own short transaction; False if it failed
+
+    Ingest calls this after committing its rows: the counter rows are shared by
+    every writer, and bumping them inside the ingest transaction would serialize
+    all ingest on their row locks.
+    """
+    try:
+        for name in names:
+            bump_version(name)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error bumping cache versions {names}: {e}")
+        return False
+
+
+def next_version(name):
+    """Increment a version counter and return its new value (caller commits)
+
+    The counter row stays locked until commit, so concurrent writers get their
+    versions in commit order.
+    """
+    bump_version(name)
+    return db.session.scalar(db.select(CacheVersion.version).where(CacheVersion.name == name))
+
+
+class ThresholdStore:
+    """Versioned in-process copy of the umbrales table"""
+
+    VERSION_NAME = 'umbrales'
+
+    def __init__(self, check_interval=UMBRALES_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._items = []           # [{'variable', 'valor_medio', 'valor_alto', 'valor_grave'}]
+        self._by_variable = {}
+        self._etag = None
+        self._checked_at = 0.0
+
+    def _load(self, version):
+        items = [{
+            'variable': u.variable,
+            'valor_medio': u.valor_medio,
+            'valor_alto': u.valor_alto,
+            'valor_grave': u.valor_grave
+        } for u in Umbral.query.order_by(Umbral.id).all()]
+        etag = hashlib.sha1(json.dumps(items, sort_keys=True).encode()).hexdigest()
+        self._items = items
+        self._by_variable = {item['variable']: item for item in items}
+        self._etag = f'umbrales-{etag[:16]}'
+        self._version = version
+
+    def _refresh(self):
+        """Reload if another worker bumped the version (checked at most every check_interval)"""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            version = read_version(self.VERSION_NAME)
+            if version != self._version:
+                self._load(version)
+            self._checked_at = now
+
+    def invalidate(self):
+        """Force a version check (and reload if needed) on the next access"""
+        with self._lock:
+            self._version = None
+
+    def snapshot(self):
+        """(items, etag) from the same load"""
+        self._refresh()
+        with self._lock:
+            return self._items, self._etag
+
+    def items(self):
+        self._refresh()
+        return self._items
+
+    def by_variable(self):
+        self._refresh()
+        return self._by_variable
+
+    def etag(self):
+        self._refresh()
+        return self._etag
+
+    def version(self):
+        self._refresh()
+        return self._version
+
+
+class LastValueCache:
+    """Latest reading per modulo, fed by ingest and re-read only when another process wrote"""
+
+    VERSION_NAME = 'lecturas'
+    FIELDS = ('id_lectura', 'modulo', 'hora', 'temperatura', 'humedad', 'co', 'co2', 'amoniaco')
+
+    def __init__(self, check_interval=LIVE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._rows = {}            # modulo -> row dict
+        self._version = None       # versión de 'lecturas' que refleja _rows
+        self._checked_at = 0.0
+        self._synced_at = 0.0
+
+    def _columns(self):
+        return [getattr(Lectura, field) for field in self.FIELDS]
+
+    def _merge(self, results):
+        for result in results:
+            row = dict(zip(self.FIELDS, result))
+            current = self._rows.get(row['modulo'])
+            if current is None or current['hora'] is None or (row['hora'] is not None and row['hora'] >= current['hora']):
+                self._rows[row['modulo']] = row
+
+    def warm(self):
+        """Load the latest reading of every module (one grouped query, at startup)"""
+        version = read_version(self.VERSION_NAME)
+        latest = db.select(Lectura.modulo, db.func.max(Lectura.hora).label('hora')) \
+            .group_by(Lectura.modulo).subquery()
+        query = db.select(*self._columns()).join(
+            latest, db.and_(Lectura.modulo == latest.c.modulo, Lectura.hora == latest.c.hora)
+        )
+        rows = {}
+        for result in db.session.execute(query):
+            row = dict(zip(self.FIELDS, result))
+            rows[row['modulo']] = row
+        with self._lock:
+            self._rows = rows
+            self._version = version
+            self._checked_at = self._synced_at = time.monotonic()
+
+    def _catch_up(self, version):
+        """Merge readings newer than what we hold (range seek on ix_lecturas_hora)"""
+        with self._lock:
+            horas = [row['hora'] for row in self._rows.values() if row['hora'] is not None]
+        if not horas:
+            return self.warm()
+        since = max(horas) - LIVE_LATE_WINDOW
+        results = db.session.execute(db.select(*self._columns()).where(Lectura.hora > since)).all()
+        with self._lock:
+            self._merge(results)
+            self._version = version
+            self._checked_at = self._synced_at = time.monotonic()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        if self._version is None:
+            return self.warm()
+        version = read_version(self.VERSION_NAME)
+        if version != self._version or now - self._synced_at >= LIVE_RESYNC_INTERVAL:
+            # Solo lecturas recientes (rango en ix_lecturas_hora), nunca toda la tabla
+            self._catch_up(version)
+        else:
+            self._checked_at = now
+
+    def update(self, rows, bumped=True):
+        """Apply freshly committed readings; bumped=True when the caller bumped the version once"""
+        with self._lock:
+            self._merge([tuple(row.get(field) for field in self.FIELDS) for row in rows])
+            if bumped and self._version is not None:
+                # Nuestro propio incremento no obliga a recargar
+                self._version += 1
+
+    def get(self, modulo):
+        self._refresh()
+        with self._lock:
+            return self._rows.get(modulo)
+
+    def snapshot(self):
+        """Copy of the latest row of every module"""
+        self._refresh()
+        with self._lock:
+            return dict(self._rows)
+
+
+def has_late_rows(rows, now=None):
+    """True if any reading falls in an already closed (cacheable) historical block"""
+    settled = (now or datetime.now()) - HISTORICAL_CACHE_SETTLE
+    return any(row['hora'] is not None and row['hora'] < settled for row in rows)
+
+
+class HistoricalCache:
+    """LRU of closed /api/historical blocks, bounded by their estimated size in bytes"""
+
+    VERSION_NAME = HISTORICAL_VERSION_NAME
+
+    def __init__(self, max_bytes=HISTORICAL_CACHE_MAX_BYTES, check_interval=HISTORICAL_CACHE_CHECK_INTERVAL):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._blocks = OrderedDict()   # key -> (block, nbytes)
+        self._bytes = 0
+        self._version = None
+        self._checked_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'open': 0, 'evictions': 0, 'invalidations': 0}
+
+    def settled(self, block_end, now=None):
+        """Whether a block ending at block_end can be cached"""
+        return self.max_bytes > 0 and block_end <= (now or datetime.now()) - HISTORICAL_CACHE_SETTLE
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        version = read_version(self.VERSION_NAME)
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    self._clear()
+                self._version = version
+            self._checked_at = now
+
+    def _clear(self):
+        self._blocks.clear()
+        self._bytes = 0
+        self._stats['invalidations'] += 1
+
+    def get(self, key):
+        self._refresh()
+        with self._lock:
+            entry = self._blocks.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._blocks.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, key, block, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._blocks.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._blocks[key] = (block, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._blocks.popitem(last=False)
+                self._bytes -= evicted
+                self._stats['evictions'] += 1
+
+    def count_open(self, n=1):
+        """Blocks recomputed because they are still open (the tail of the range)"""
+        with self._lock:
+            self._stats['open'] += n
+
+    def invalidate(self):
+        """Drop every block now (local late ingest); other workers follow the version"""
+        with self._lock:
+            self._clear()
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                hit_ratio=round(self._stats['hits'] / lookups, 4) if lookups else None,
+                entries=len(self._blocks),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+            )
+
+
+class AlertStats:
+    """Alert counts by (prioridad, estado), kept up to date with deltas"""
+
+    VERSION_NAME = ALERTS_VERSION_NAME
+
+    def __init__(self, check_interval=ALERT_STATS_CHECK_INTERVAL, reconcile_interval=ALERT_STATS_RECONCILE):
+        self.check_interval = check_interval
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._counts = {}          # (prioridad, estado) -> cantidad
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    def _load(self, version):
+        rows = db.session.query(Alerta.prioridad, Alerta.estado, db.func.count()).group_by(
+            Alerta.prioridad, Alerta.estado
+        ).all()
+        now = time.monotonic()
+        with self._lock:
+            self._counts = {(prioridad, estado): count for prioridad, estado, count in rows}
+            self._version = version
+            self._checked_at = now
+            self._loaded_at = now
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        version = read_version(self.VERSION_NAME)
+        if version != self._version or now - self._loaded_at >= self.reconcile_interval:
+            self._load(version)
+        else:
+            self._checked_at = now
+
+    def _apply(self, deltas, bumped):
+        with self._lock:
+            for key, delta in deltas.items():
+                count = self._counts.get(key, 0) + delta
+                if count > 0:
+                    self._counts[key] = count
+                else:
+                    self._counts.pop(key, None)
+            if bumped and self._version is not None:
+                # Nuestro propio incremento no obliga a recargar
+                self._version += 1
+
+    def created(self, prioridades, bumped=True):
+        """New active alerts were committed (one priority per alert)"""
+        deltas = {}
+        for prioridad in prioridades:
+            deltas[(prioridad, 'active')] = deltas.get((prioridad, 'active'), 0) + 1
+        self._apply(deltas, bumped)
+
+    def changed(self, prioridad, old_estado, new_estado, count=1, bumped=True):
+        """count alerts of one priority moved from old_estado to new_estado"""
+        if old_estado != new_estado:
+            self._apply({(prioridad, old_estado): -count, (prioridad, new_estado): count}, bumped)
+
+    def moved(self, counts, new_estado=None, bumped=True):
+        """Alerts counted by (prioridad, estado) moved to new_estado (None: deleted)"""
+        deltas = {}
+        for (prioridad, estado), count in counts.items():
+            if estado == new_estado:
+                continue
+            deltas[(prioridad, estado)] = deltas.get((prioridad, estado), 0) - count
+            if new_estado is not None:
+                deltas[(prioridad, new_estado)] = deltas.get((prioridad, new_estado), 0) + count
+        self._apply(deltas, bumped)
+
+    def cleared(self, bumped=True):
+        """Every alert was deleted"""
+        with self._lock:
+            deltas = {key: -count for key, count in self._counts.items()}
+        self._apply(deltas, bumped)
+
+    def invalidate(self):
+        """Reload from the database on the next read"""
+        with self._lock:
+            self._version = None
+
+    def counts(self):
+        """Copy of the (prioridad, estado) -> count map"""
+        self._refresh()
+        with self._lock:
+            return dict(self._counts)
+
+    def summary(self):
+        """Payload of /api/alerts/stats: active alerts by priority plus totals by status"""
+        counts = self.counts()
+        by_estado = {}
+        for (prioridad, estado), count in counts.items():
+            by_estado[estado] = by_estado.get(estado, 0) + count
+        return {
+            'critical': counts.get(('critical', 'active'), 0),
+            'warning': counts.get(('warning', 'active'), 0),
+            'info': counts.get(('info', 'active'), 0),
+            'acknowledged': by_estado.get('acknowledged', 0),
+            'resolved': by_estado.get('resolved', 0),
+            'total': sum(by_estado.values()),
+        }
@@ -0,0 +1,180 @@
+"""
+Escritura directa de lecturas en la tabla `lecturas` desde el suscriptor MQTT.
+
+Evita el salto MQTT -> HTTP JSON -> Flask: el forwarder entrega cada lote a
+DatabaseSink, que usa un engine con pool y un INSERT multi-fila (o COPY en
+PostgreSQL). El esquema es el mismo Lectura de api_avicola.models; los rollups
+(api_avicola/rollups.py) se actualizan en la misma transacción y los contadores
+de caché de la API justo después, como en la ingesta de la API.
+
+Los id_lectura que ya existen se omiten (ON CONFLICT DO NOTHING) y cuentan como
+rechazados, igual que en POST /lecturas/batch: reenviar un lote ya escrito (replay
+del spool tras un corte) no falla ni duplica los rollups.
+"""
+from datetime import datetime
+import csv
+import io
+import os
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError, InterfaceError
+
+from api_avicola.models import Lectura
+from api_avicola.forwarder import SinkError
+from api_avicola.rollups import update_rollups
+from api_avicola.cache import HISTORICAL_VERSION_NAME, has_late_rows, bump_statement
+
+# environment variables
+DATABASE_URL = os.getenv('DATABASE_URL')
+DB_WRITER_POOL_SIZE = int(os.getenv('DB_WRITER_POOL_SIZE', '2'))
+# Usar COPY ... FROM STDIN cuando la BD es PostgreSQL
+DB_WRITER_USE_COPY = os.getenv('DB_WRITER_USE_COPY', 'true').lower() in ('1', 'true', 'yes')
+
+LECTURA_COLUMNS = [column.name for column in Lectura.__table__.columns]
+NUMERIC_COLUMNS = ('temperatura', 'humedad', 'co', 'co2', 'amoniaco')
+# Contador que invalida el caché de última lectura de la API (ver api_avicola/cache.py)
+LECTURAS_VERSION_NAME = 'lecturas'
+
+
+def bump_counter(conn, name):
+    """Increment a cache version inside the caller's transaction"""
+    conn.execute(bump_statement(name, conn.dialect.name))
+
+
+def bump_lecturas_version(conn):
+    """Increment the 'lecturas' cache version inside the caller's transaction"""
+    bump_counter(conn, LECTURAS_VERSION_NAME)
+
+
+def to_row(lectura):
+    """Convert a forwarder reading (JSON-ready dict) into a lecturas row"""
+    hora = lectura['hora']
+    if isinstance(hora, str):
+        hora = datetime.fromisoformat(hora.replace('Z', '+00:00'))
+    if hora.tzinfo is not None:
+        hora = hora.replace(tzinfo=None)
+    row = {
+        'id_lectura': lectura['id_lectura'],
+        'modulo': lectura['modulo'],
+        'hora': hora
+    }
+    for column in NUMERIC_COLUMNS:
+        valor = lectura.get(column)
+        row[column] = float(valor) if valor is not None else None
+    return row
+
+
+class DatabaseSink:
+    """Forwarder sink that writes batches straight to the lecturas table"""
+
+    def __init__(self, database_url=DATABASE_URL, pool_size=DB_WRITER_POOL_SIZE, use_copy=DB_WRITER_USE_COPY):
+        if not database_url:
+            raise ValueError('DATABASE_URL is required for the direct database writer')
+        self.engine = create_engine(database_url, pool_size=pool_size, pool_pre_ping=True)
+        self.use_copy = use_copy and self.engine.dialect.name == 'postgresql'
+        # Hook opcional: recibe las filas ya confirmadas (p. ej. evaluación de alertas)
+        self.after_write = None
+
+    def send(self, batch):
+        """Write a batch in one transaction; return the number of readings skipped
+
+        Skipped = invalid readings, ids repeated in the batch and id_lectura already
+        in the table. Only a connection problem raises SinkError; a row the database
+        refuses (IntegrityError, DataError) raises the original error, since
+        retrying the same batch would fail the same way.
+        """
+        rows = []
+        seen_ids = set()
+        rejected = 0
+        for lectura in batch:
+            try:
+                row = to_row(lectura)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"❌ Lectura inválida descartada: {lectura} ({e})")
+                rejected += 1
+                continue
+            if row['id_lectura'] in seen_ids:
+                rejected += 1
+                continue
+            seen_ids.add(row['id_lectura'])
+            rows.append(row)
+        if not rows:
+            return rejected
+
+        try:
+            with self.engine.begin() as conn:
+                if self.use_copy:
+                    inserted = self._copy(conn, rows)
+                else:
+                    inserted = self._insert(conn, rows)
+                if len(inserted) < len(rows):
+                    print(f"⚠️ {len(rows) - len(inserted)} lecturas ya existían en la BD, omitidas")
+                    rows = [row for row in rows if row['id_lectura'] in inserted]
+                # Solo lo insertado suma en los rollups: un replay no cuenta dos veces
+                update_rollups(conn, rows, conn.dialect.name)
+        except (OperationalError, InterfaceError) as e:
+            raise SinkError(str(e)) from e
+        rejected += len(seen_ids) - len(rows)
+        if not rows:
+            return rejected
+
+        # Contadores de caché en su propia transacción corta, después del commit:
+        # dentro del lote bloquearían la misma fila en cada ingesta concurrente
+        try:
+            with self.engine.begin() as conn:
+                bump_lecturas_version(conn)
+                if has_late_rows(rows):
+                    # Lecturas tardías: invalidan bloques cerrados del caché histórico
+                    bump_counter(conn, HISTORICAL_VERSION_NAME)
+        except Exception as e:
+            print(f"Error bumping cache versions after direct DB write: {e}")
+
+        if self.after_write:
+            try:
+                self.after_write(rows)
+            except Exception as e:
+                print(f"Error after direct DB write: {e}")
+        return rejected
+
+    def _insert(self, conn, rows):
+        """Multi-row INSERT ... ON CONFLICT DO NOTHING; return the set of ids inserted"""
+        dialect_insert = postgresql.insert if conn.dialect.name == 'postgresql' else sqlite.insert
+        table = Lectura.__table__
+        stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=['id_lectura'])
+        return set(conn.scalars(stmt.returning(table.c.id_lectura), rows))
+
+    def _copy(self, conn, rows):
+        """COPY into a temp table, then INSERT ... ON CONFLICT DO NOTHING; return the ids inserted
+
+        COPY has no conflict handling, so it never writes to lecturas directly.
+        PostgreSQL only, inside the caller's transaction.
+        """
+        staging = f'{Lectura.__tablename__}_copy'
+        conn.execute(text(
+            f'CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {Lectura.__tablename__}) ON COMMIT DELETE ROWS'
+        ))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if row[c] is None else (row[c].isoformat() if c == 'hora' else row[c])
+                             for c in LECTURA_COLUMNS])
+        buffer.seek(0)
+
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {staging} ({', '.join(LECTURA_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+        columns = ', '.join(LECTURA_COLUMNS)
+        return set(conn.scalars(text(
+            f'INSERT INTO {Lectura.__tablename__} ({columns}) SELECT {columns} FROM {staging} '
+            f'ON CONFLICT (id_lectura) DO NOTHING RETURNING id_lectura'
+        )))
+
+    def close(self):
+        self.engine.dispose()
@@ -0,0 +1,161 @@
+"""
+Reducción de puntos para series de /api/historical (parámetro max_points).
+
+Dos métodos, ambos devuelven índices de puntos reales (nunca promedios, así los
+picos de alarma se conservan):
+
+- minmax: el mínimo y el máximo de cada bucket, totalmente vectorizado (los
+  buckets son filas de una matriz de ancho fijo).
+- lttb: Largest-Triangle-Three-Buckets. Por cada bucket elige el punto que forma
+  el triángulo más grande con el punto elegido antes y el promedio del bucket
+  siguiente. Como el paso es secuencial, primero se preseleccionan con minmax
+  LTTB_CANDIDATES puntos por bucket de salida (MinMaxLTTB) y el recorrido queda
+  sobre unos pocos miles de puntos en vez de millones.
+
+Las respuestas de la API son columnares con varias casas mezcladas, así que la
+selección se hace por casa y por variable, y se conservan las filas elegidas por
+cualquiera de las variables.
+"""
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+# Puntos preseleccionados por minmax por cada punto de salida de LTTB
+LTTB_CANDIDATES = 4
+
+
+def lttb(x, y, n_out):
+    """Indices of the n_out points picked by LTTB (first and last always kept)"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+
+    if n > LTTB_CANDIDATES * n_out:
+        # Preselección vectorizada: min y max de cada sub-bucket, más los extremos
+        candidates = np.union1d(minmax(x, y, LTTB_CANDIDATES * n_out), [0, n - 1])
+        return candidates[_lttb(x[candidates], y[candidates], n_out)]
+    return _lttb(x, y, n_out)
+
+
+def _lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    # Los extremos van fijos; el resto se reparte en n_out - 2 buckets
+    edges = (np.linspace(0, n - 2, n_out - 1).astype(np.int64) + 1).tolist()
+    xs = x.tolist()
+    ys = y.tolist()
+    selected = [0]
+    ax, ay = xs[0], ys[0]
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Tercer vértice: promedio del bucket siguiente (el último punto para el final)
+        if b == n_out - 3:
+            cx, cy = xs[-1], ys[-1]
+        else:
+            nxt = edges[b + 2]
+            cx = sum(xs[hi:nxt]) / (nxt - hi)
+            cy = sum(ys[hi:nxt]) / (nxt - hi)
+        best, best_area = lo, -1.0
+        for i in range(lo, hi):
+            # Doble del área del triángulo (a, i, c)
+            area = abs((ax - cx) * (ys[i] - ay) - (ax - xs[i]) * (cy - ay))
+            if area > best_area:
+                best, best_area = i, area
+        selected.append(best)
+        ax, ay = xs[best], ys[best]
+    selected.append(n - 1)
+    return np.array(selected, dtype=np.int64)
+
+
+def minmax(x, y, n_out):
+    """Indices of the min and max of each of n_out // 2 buckets"""
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    n_buckets = max(n_out // 2, 1)
+    # Buckets de igual ancho como matriz; el resto de la división va al último
+    width = n // n_buckets
+    body = (n_buckets - 1) * width
+    starts = np.arange(n_buckets - 1) * width
+    matrix = y[:body].reshape(n_buckets - 1, width)
+    tail = y[body:]
+    low = np.append(starts + matrix.argmin(axis=1), body + tail.argmin())
+    high = np.append(starts + matrix.argmax(axis=1), body + tail.argmax())
+    return np.unique(np.concatenate((low, high)))
+
+
+def select_indices(x, y, n_out, method='lttb'):
+    """Indices to keep from one series; None values (NaN) are ignored"""
+    pick = lttb if method == 'lttb' else minmax
+    missing = np.isnan(y)
+    if not missing.any():
+        return pick(x, y, n_out)
+    present = np.flatnonzero(~missing)
+    if len(present) <= n_out:
+        return present
+    return present[pick(x[present], y[present], n_out)]
+
+
+def downsample(data, max_points, series, x, groups=None, method='lttb'):
+    """Keep at most ~max_points rows per house in a column-oriented result (in place)
+
+    Columns may be lists or NumPy arrays; arrays are indexed directly, so a result
+    built from arrays is reduced without converting its rows to Python objects.
+    `x` is the time axis as epoch seconds, `series` are the keys of the value
+    columns and `groups` one code per row identifying its house (None when every
+    row belongs to the same house). Each variable gets an equal share of the
+    budget and the rows picked by any of them are kept, so every column stays
+    aligned.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}' (use one of {', '.join(METHODS)})")
+    n = len(data['timestamps'])
+    if not max_points or n <= max_points:
+        return data
+
+    x = np.asarray(x, dtype=np.float64)
+    # asarray: las columnas que ya son arrays float64 no se copian
+    columns = {key: np.asarray(data[key], dtype=np.float64) for key in series}
+    share = max(max_points // len(series), 3)
+    if groups is None:
+        partitions = [np.arange(n)]
+    else:
+        groups = np.asarray(groups)
+        if groups.dtype.kind in 'iu' and len(groups) and 0 <= groups.min() and groups.max() < 2 ** 16:
+            # Enteros chicos: argsort estable usa radix sort
+            groups = groups.astype(np.uint16)
+        order = np.argsort(groups, kind='stable')
+        partitions = np.split(order, np.flatnonzero(np.diff(groups[order])) + 1)
+
+    keep = []
+    for rows in partitions:
+        if len(rows) <= max_points:
+            keep.append(rows)
+            continue
+        rows_x = x[rows]
+        for key in series:
+            keep.append(rows[select_indices(rows_x, columns[key][rows], share, method)])
+    keep = np.unique(np.concatenate(keep))
+
+    for key, values in data.items():
+        if _is_column(values, n):
+            data[key] = _take(values, keep)
+        elif isinstance(values, dict):
+            # min/max de los rollups: {variable: columna}
+            for name, column in values.items():
+                values[name] = _take(column, keep)
+    data['downsampled'] = {'method': method, 'from': n, 'to': len(keep)}
+    return data
+
+
+def _is_column(values, n):
+    return isinstance(values, (list, np.ndarray)) and len(values) == n
+
+
+def _take(column, keep):
+    """Rows `keep` of a column; arrays stay arrays (no Python objects per row)"""
+    if isinstance(column, np.ndarray):
+        return column[keep]
+    return [column[i] for i in keep.tolist()]
@@ -0,0 +1,144 @@
+"""
+Formatos de respuesta para /api/historical: compresión y binario columnar.
+
+Compresión: según Accept-Encoding se usa brotli (si el módulo está instalado) o
+gzip, también sobre respuestas en streaming.
+
+Binario columnar (MEDIA_TYPE, pedido con Accept o ?format=columnar), little-endian:
+
+    'AVC1' | uint32 largo del header | header JSON (utf-8) | padding a 8 | columnas
+
+El header lleva rows, t0 (epoch ms de la primera fila), houses (diccionario de
+casas), meta (claves sueltas de la respuesta JSON: resolution, downsampled...) y
+columns: [{name, type, offset, length}], con offset relativo al inicio de las
+columnas (8 + largo del header, redondeado a múltiplo de 8). Tipos:
+
+    delta_int32   timestamps: diferencia en ms con la fila anterior (la 1a con t0)
+    float64       timestamps en epoch ms (si algún delta no entra en int32)
+    dict_uint8/16 house: índice en houses
+    float32       series (NaN = null); "min.temperature" = data.min.temperature
+    uint32        count de los rollups
+
+Las horas son de pared (la columna no tiene zona), igual que las cadenas ISO del JSON.
+Cada columna empieza alineada a 8 bytes para leerla como typed array sin copiar.
+"""
+import gzip
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se ofrece solo gzip
+    brotli = None
+
+MEDIA_TYPE = 'application/vnd.avicola.columnar'
+MAGIC = b'AVC1'
+
+# environment variables
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+# Respuestas más chicas que esto no se comprimen
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+
+def _align(size, to=8):
+    return -size % to
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None from a werkzeug Accept-Encoding header"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(offered)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterator of str/bytes chunks on the fly"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        # wbits=31: formato gzip (cabecera + CRC)
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class ColumnarBuilder:
+    """Accumulates rows block by block and encodes them in the columnar binary format"""
+
+    def __init__(self, names, meta=None):
+        # names: columnas float32/uint32 en orden de salida, p. ej. 'temperature', 'min.co'
+        self.names = list(names)
+        self.meta = dict(meta or {})
+        self.houses = {}
+        self._epoch = []
+        self._house = []
+        self._columns = {name: [] for name in self.names}
+
+    def add(self, epoch, houses, columns):
+        """One block: epoch seconds, house names and {name: values} (None allowed)"""
+        codes = self.houses
+        self._epoch.append(np.asarray(epoch, dtype=np.float64))
+        self._house.append(np.fromiter((codes.setdefault(h, len(codes)) for h in houses),
+                                       dtype=np.int64, count=len(houses)))
+        for name in self.names:
+            dtype = np.uint32 if name == 'count' else np.float32
+            self._columns[name].append(np.array(columns[name], dtype=np.float64).astype(dtype))
+
+    def to_bytes(self):
+        epoch_ms = np.round(np.concatenate(self._epoch or [np.empty(0)]) * 1000).astype(np.int64)
+        house = np.concatenate(self._house or [np.empty(0, dtype=np.int64)])
+        rows = len(epoch_ms)
+        t0 = int(epoch_ms[0]) if rows else 0
+
+        sections = []
+        deltas = np.diff(epoch_ms, prepend=t0)
+        if rows and (deltas.max() > np.iinfo(np.int32).max or deltas.min() < np.iinfo(np.int32).min):
+            sections.append(('timestamps', 'float64', epoch_ms.astype(np.float64)))
+        else:
+            sections.append(('timestamps', 'delta_int32', deltas.astype('<i4')))
+        if len(self.houses) <= 256:
+            sections.append(('house', 'dict_uint8', house.astype(np.uint8)))
+        else:
+            sections.append(('house', 'dict_uint16', house.astype('<u2')))
+        for name in self.names:
+            values = np.concatenate(self._columns[name]) if self._columns[name] else np.empty(0)
+            if name == 'count':
+                sections.append((name, 'uint32', values.astype('<u4')))
+            else:
+                sections.append((name, 'float32', values.astype('<f4')))
+
+        columns = []
+        blobs = []
+        offset = 0
+        for name, kind, values in sections:
+            blob = values.tobytes()
+            columns.append({'name': name, 'type': kind, 'offset': offset, 'length': len(blob)})
+            blobs.append(blob + b'\0' * _align(len(blob)))
+            offset += len(blob) + _align(len(blob))
+
+        header = json.dumps({
+            'rows': rows,
+            't0': t0,
+            'houses': list(self.houses),
+            'meta': self.meta,
+            'columns': columns,
+        }, separators=(',', ':')).encode('utf-8')
+        prefix = MAGIC + struct.pack('<I', len(header)) + header
+        return prefix + b'\0' * _align(len(prefix)) + b''.join(blobs)
@@ -0,0 +1,202 @@
+"""
+Envío asíncrono de lecturas desde el suscriptor MQTT.
+
+on_message solo encola (cola acotada en memoria); un hilo en segundo plano vacía la
+cola por tamaño o por tiempo y entrega cada lote a un "sink" (por defecto HttpSink,
+que usa POST /lecturas/batch con una sesión HTTP keep-alive reutilizada).
+"""
+from collections import deque
+import threading
+import time
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# environment variables
+FORWARD_QUEUE_MAX = int(os.getenv('FORWARD_QUEUE_MAX', '10000'))
+FORWARD_BATCH_SIZE = int(os.getenv('FORWARD_BATCH_SIZE', '200'))
+FORWARD_FLUSH_INTERVAL = float(os.getenv('FORWARD_FLUSH_INTERVAL', '1.0'))
+# drop_oldest | drop_newest | block
+FORWARD_DROP_POLICY = os.getenv('FORWARD_DROP_POLICY', 'drop_oldest')
+FORWARD_BLOCK_TIMEOUT = float(os.getenv('FORWARD_BLOCK_TIMEOUT', '0.5'))
+FORWARD_STATS_INTERVAL = float(os.getenv('FORWARD_STATS_INTERVAL', '60'))
+FORWARD_HTTP_TIMEOUT = float(os.getenv('FORWARD_HTTP_TIMEOUT', '10'))
+
+DROP_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class SinkError(Exception):
+    """The backend could not take the batch (connection error, timeout, 5xx)"""
+
+
+class HttpSink:
+    """Sends batches to POST /lecturas/batch over a pooled keep-alive session"""
+
+    def __init__(self, batch_url, timeout=FORWARD_HTTP_TIMEOUT, pool_size=4):
+        self.batch_url = batch_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, batch):
+        """Send a batch; return the number of readings the API rejected as invalid"""
+        try:
+            response = self.session.post(self.batch_url, json=batch, timeout=self.timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise SinkError(str(e)) from e
+
+        if response.status_code >= 500:
+            raise SinkError(f"HTTP {response.status_code}: {response.text[:200]}")
+        if response.status_code not in (200, 400):
+            # 413 u otro error de cliente: el lote completo es inválido
+            print(f"❌ Error API (HTTP {response.status_code}): {response.text[:200]}")
+            return len(batch)
+
+        body = response.json()
+        for result in body.get('results', []):
+            if result.get('status') != 'ok':
+                print(f"❌ Lectura rechazada por la API: {result}")
+        return body.get('failed', 0)
+
+    def close(self):
+        self.session.close()
+
+
+class Forwarder:
+    """Bounded queue fed by on_message and drained by a background sender thread"""
+
+    def __init__(self, sink, max_queue=FORWARD_QUEUE_MAX, batch_size=FORWARD_BATCH_SIZE,
+                 flush_interval=FORWARD_FLUSH_INTERVAL, drop_policy=FORWARD_DROP_POLICY,
+                 block_timeout=FORWARD_BLOCK_TIMEOUT, stats_interval=FORWARD_STATS_INTERVAL):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}' (use one of {', '.join(DROP_POLICIES)})")
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.stats_interval = stats_interval
+        # Hook opcional: recibe los lotes que el sink no pudo entregar
+        self.on_failure = None
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._counters = {
+            'enqueued': 0,
+            'sent': 0,
+            'rejected': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+        }
+        self._last_send_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Productor (hilo de red de paho)
+    # ------------------------------------------------------------------
+    def submit(self, lectura):
+        """Queue a reading without blocking on the backend; return False if it was dropped"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                if self.drop_policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self._counters['dropped'] += 1
+                elif self.drop_policy == 'block':
+                    # Backpressure: esperar a que el sender libere espacio
+                    self._cond.wait_for(lambda: len(self._queue) < self.max_queue or not self._running,
+                                        timeout=self.block_timeout)
+                    if len(self._queue) >= self.max_queue:
+                        self._counters['dropped'] += 1
+                        return False
+                else:
+                    self._counters['dropped'] += 1
+                    return False
+
+            self._queue.append(lectura)
+            self._counters['enqueued'] += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    # ------------------------------------------------------------------
+    # Consumidor (hilo en segundo plano)
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='mqtt-forwarder', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the sender after flushing what is still queued"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        close = getattr(self.sink, 'close', None)
+        if close:
+            close()
+
+    def _next_batch(self):
+        """Wait until there is a full batch or the oldest item is flush_interval old"""
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout=self.flush_interval)
+            if self._running and 0 < len(self._queue) < self.batch_size:
+                self._cond.wait_for(lambda: len(self._queue) >= self.batch_size or not self._running,
+                                    timeout=self.flush_interval)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            if batch:
+                # Despertar productores bloqueados por backpressure
+                self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        last_stats = time.monotonic()
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._deliver(batch)
+            elif not self._running:
+                break
+
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                print(f"📈 Forwarder stats: {self.stats()}")
+
+    def _deliver(self, batch):
+        start = time.perf_counter()
+        try:
+            rejected = self.sink.send(batch)
+        except Exception as e:
+            print(f"❌ ERROR enviando lote de {len(batch)} lecturas: {e}")
+            with self._cond:
+                self._counters['failed'] += len(batch)
+            if self.on_failure:
+                self.on_failure(batch)
+            return
+
+        with self._cond:
+            self._counters['batches'] += 1
+            self._counters['rejected'] += rejected or 0
+            self._counters['sent'] += len(batch) - (rejected or 0)
+            self._last_send_seconds = time.perf_counter() - start
+
+    def stats(self):
+        """Snapshot of queue depth and counters"""
+        with self._cond:
+            stats = dict(self._counters)
+            stats['queue_depth'] = len(self._queue)
+            stats['queue_max'] = self.max_queue
+            stats['drop_policy'] = self.drop_policy
+            stats['last_send_ms'] = round(self._last_send_seconds * 1000, 2)
+        return stats
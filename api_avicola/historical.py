@@ -0,0 +1,556 @@
+"""
+Capa de consulta de /api/historical.
+
+Traduce los parámetros del endpoint (range/from/to/house) a un intervalo de tiempo y
+elige la resolución: lecturas crudas o las tablas de rollup (1m, 15m, 1h). Con
+resolution=auto se usa la resolución más gruesa que todavía da al menos
+`points` puntos por serie en el intervalo pedido. Con max_points el resultado se
+reduce por casa y variable con LTTB o min/max (api_avicola/downsample.py).
+
+El intervalo se recorre en bloques de una grilla fija por resolución
+(BLOCK_SECONDS). Los bloques cerrados se guardan en un HistoricalCache
+(api_avicola/cache.py) y se reutilizan tal cual; solo los bloques abiertos (la cola
+del rango) y los que faltan se consultan, con una sola consulta por tramo de
+bloques consecutivos. Los rangos relativos se alinean al bucket de la resolución
+(al minuto en crudo), así dos requests del mismo minuto dan el mismo resultado.
+
+Las consultas leen solo las columnas necesarias con un cursor del lado del
+servidor (HISTORICAL_STREAM_CHUNK filas por vez). Sin max_points el JSON se arma en
+streaming (stream_historical): cada columna se escribe ya serializada a un archivo
+temporal (en memoria hasta HISTORICAL_SPOOL_BYTES) y luego se emite columna por
+columna, así la memoria no crece con el tamaño del rango.
+"""
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from operator import itemgetter
+import threading
+import tempfile
+import json
+import os
+
+import numpy as np
+
+from api_avicola.models import db, Lectura
+from api_avicola.rollups import ROLLUPS, bucket_start
+from api_avicola import downsample, pagination
+from api_avicola.encoding import ColumnarBuilder
+
+# environment variables
+HISTORICAL_TARGET_POINTS = int(os.getenv('HISTORICAL_TARGET_POINTS', '1000'))
+# Tope de max_points aceptado por request
+HISTORICAL_MAX_POINTS_LIMIT = int(os.getenv('HISTORICAL_MAX_POINTS_LIMIT', '20000'))
+# Filas por bloque leídas del cursor y bytes por columna antes de pasar a disco
+HISTORICAL_STREAM_CHUNK = int(os.getenv('HISTORICAL_STREAM_CHUNK', '5000'))
+HISTORICAL_SPOOL_BYTES = int(os.getenv('HISTORICAL_SPOOL_BYTES', str(1024 * 1024)))
+# Filas por página con cursor (por defecto y tope)
+HISTORICAL_PAGE_SIZE = int(os.getenv('HISTORICAL_PAGE_SIZE', '5000'))
+HISTORICAL_PAGE_MAX = int(os.getenv('HISTORICAL_PAGE_MAX', '50000'))
+
+RANGES = {
+    '1m': timedelta(minutes=1),
+    '10m': timedelta(minutes=10),
+    '30m': timedelta(minutes=30),
+    '1h': timedelta(hours=1),
+    '2h': timedelta(hours=2),
+    '12h': timedelta(hours=12),
+    '24h': timedelta(hours=24),
+    '3d': timedelta(days=3),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '90d': timedelta(days=90),
+}
+
+RESOLUTIONS = ('auto', 'raw') + tuple(ROLLUPS)
+
+# Segundos por bloque de caché, por resolución (~720-1440 filas por casa y bloque)
+BLOCK_SECONDS = {'raw': 3600, '1m': 86400, '15m': 7 * 86400, '1h': 30 * 86400}
+# Alineación del inicio de los rangos relativos en crudo
+RAW_ALIGN_SECONDS = 60
+# Columna interna de los bloques: código entero de la casa de cada fila
+HOUSE_CODE = ('_house_code',)
+EPOCH = datetime(1970, 1, 1)
+
+# Columna en la BD -> clave en la respuesta
+SERIES = (
+    ('temperatura', 'temperature'),
+    ('humedad', 'humidity'),
+    ('amoniaco', 'ammonia'),
+    ('co', 'co'),
+    ('co2', 'co2'),
+)
+
+
+def empty_result(resolution='raw'):
+    result = {'timestamps': [], 'house': []}
+    for _, key in SERIES:
+        result[key] = []
+    result['resolution'] = resolution
+    return result
+
+
+def resolve_range(range_param, from_date=None, to_date=None, now=None):
+    """(start, end) for the request; end is None for relative ranges (up to now)"""
+    now = now or datetime.now()
+    if range_param == 'custom' and from_date and to_date:
+        # Parse datetime-local values (ISO format without timezone)
+        return datetime.fromisoformat(from_date), datetime.fromisoformat(to_date)
+    # Por defecto últimas 24 horas
+    return now - RANGES.get(range_param, RANGES['24h']), None
+
+
+def choose_resolution(start, end, points=HISTORICAL_TARGET_POINTS, now=None):
+    """Coarsest rollup that still yields at least `points` buckets over [start, end]"""
+    span = ((end or now or datetime.now()) - start).total_seconds()
+    for name in reversed(tuple(ROLLUPS)):
+        if span / ROLLUPS[name][1] >= points:
+            return name
+    return 'raw'
+
+
+def _epoch(column):
+    """Seconds since the epoch as a float column (x axis for downsampling)"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.cast(db.func.extract('epoch', column), db.Float)
+    return (db.func.julianday(column) - 2440587.5) * 86400.0
+
+
+# Código entero de cada casa, estable dentro del proceso (los bloques cacheados lo guardan)
+_house_codes = {}
+_house_codes_lock = threading.Lock()
+
+
+def _house_code(house):
+    code = _house_codes.get(house)
+    if code is None:
+        with _house_codes_lock:
+            code = _house_codes.setdefault(house, len(_house_codes))
+    return code
+
+
+def align(value, seconds):
+    """Floor a naive datetime to a multiple of `seconds` since the epoch"""
+    return EPOCH + timedelta(seconds=(value - EPOCH).total_seconds() // seconds * seconds)
+
+
+def _raw_select(start, end, house):
+    """Raw readings with hora in [start, end) (end None = no upper bound)"""
+    columns = [Lectura.hora, Lectura.modulo] + [getattr(Lectura, column) for column, _ in SERIES]
+    query = db.select(*columns, _epoch(Lectura.hora)).where(Lectura.hora >= start)
+    if end is not None:
+        query = query.where(Lectura.hora < end)
+    # Aplicar filtro de casa si existe
+    if house and house != 'all':
+        query = query.where(Lectura.modulo == house)
+    return query.order_by(Lectura.hora)
+
+
+def _raw_columns():
+    """(path in the response, row -> value) for each column of a raw select"""
+    columns = [(('timestamps',), itemgetter(0)), (('house',), itemgetter(1))]
+    for i, (_, key) in enumerate(SERIES):
+        columns.append(((key,), itemgetter(i + 2)))
+    columns.append((('_epoch',), itemgetter(len(SERIES) + 2)))
+    return columns
+
+
+def _rollup_select(resolution, start, end, house):
+    table = ROLLUPS[resolution][0]
+    query = db.select(table, _epoch(table.c.bucket).label('epoch')).where(table.c.bucket >= start)
+    if end is not None:
+        query = query.where(table.c.bucket < end)
+    if house and house != 'all':
+        query = query.where(table.c.modulo == house)
+    return query.order_by(table.c.bucket, table.c.modulo)
+
+
+def _average(column):
+    total, count = f'{column}_sum', f'{column}_count'
+    return lambda row: row[total] / row[count] if row[count] else None
+
+
+def _rollup_columns():
+    """Averages as the main series plus min/max per variable (so peaks are not lost)"""
+    columns = [(('timestamps',), itemgetter('bucket')), (('house',), itemgetter('modulo'))]
+    columns += [((key,), _average(column)) for column, key in SERIES]
+    columns += [(('min', key), itemgetter(f'{column}_min')) for column, key in SERIES]
+    columns += [(('max', key), itemgetter(f'{column}_max')) for column, key in SERIES]
+    columns.append((('count',), itemgetter('n')))
+    columns.append((('_epoch',), itemgetter('epoch')))
+    return columns
+
+
+def _select(resolution, start, end, house):
+    if resolution == 'raw':
+        return _raw_select(start, end, house), _raw_columns()
+    return _rollup_select(resolution, start, end, house), _rollup_columns()
+
+
+def _execute(query, resolution, chunk_rows=HISTORICAL_STREAM_CHUNK):
+    # Core sobre la conexión de la sesión: sin la capa de carga de filas del ORM.
+    # yield_per implica stream_results (cursor del lado del servidor en PostgreSQL)
+    connection = db.session.connection().execution_options(yield_per=chunk_rows)
+    result = connection.execute(query)
+    return result if resolution == 'raw' else result.mappings()
+
+
+# ----------------------------------------------------------------------
+# Bloques: columnas como arrays NumPy, cacheables y recortables por tiempo
+# ----------------------------------------------------------------------
+def _to_array(path, values):
+    if path in (('timestamps',), ('house',)):
+        return np.array(values, dtype=object) if values else np.empty(0, dtype=object)
+    if path == ('count',):
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=np.float64)  # None -> NaN
+
+
+def _make_block(pending):
+    """Block arrays from the accumulated column values, plus the house codes"""
+    block = {path: _to_array(path, values) for path, values in pending.items()}
+    houses = pending[('house',)]
+    # Se calculan una vez por bloque: downsample agrupa por casa sin recorrer cadenas
+    block[HOUSE_CODE] = np.fromiter(map(_house_code, houses), dtype=np.int64, count=len(houses))
+    return block
+
+
+def _to_list(values):
+    """Array column back to JSON-ready values (NaN -> None)"""
+    if values.dtype == np.float64:
+        missing = np.isnan(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+    return values.tolist()
+
+
+# Costo fijo de una entrada del caché aunque el bloque esté vacío: clave, nodo del LRU
+# y dict del bloque (~400 B) más el encabezado de cada array (~112 B). Así el tope en
+# bytes también acota la cantidad de entradas.
+BLOCK_ENTRY_OVERHEAD = 400
+BLOCK_ARRAY_OVERHEAD = 112
+
+
+def _block_bytes(block):
+    # Arrays más los datetime de timestamps (las casas son cadenas compartidas)
+    data = sum(values.nbytes for values in block.values()) + 48 * len(block[('timestamps',)])
+    return BLOCK_ENTRY_OVERHEAD + BLOCK_ARRAY_OVERHEAD * len(block) + data
+
+
+def _slice(block, start, end):
+    """Rows of a block with start <= timestamp <= end (views, no copy)"""
+    timestamps = block[('timestamps',)]
+    lo = np.searchsorted(timestamps, start, 'left') if len(timestamps) else 0
+    hi = np.searchsorted(timestamps, end, 'right') if end is not None and len(timestamps) else len(timestamps)
+    if lo == 0 and hi == len(timestamps):
+        return block
+    return {path: values[lo:hi] for path, values in block.items()}
+
+
+def _fetch(resolution, house, run, open_end, columns, chunk_rows):
+    """Yield (block_start, block) for a run of consecutive grid blocks, in one query"""
+    size = timedelta(seconds=BLOCK_SECONDS[resolution])
+    boundaries = [block_start + size for block_start in run]
+    query, _ = _select(resolution, run[0], None if open_end else boundaries[-1], house)
+    result = _execute(query, resolution, chunk_rows)
+    current = 0
+    pending = {path: [] for path, _ in columns}
+    try:
+        for partition in result.partitions():
+            rows = list(partition)
+            timestamps = [columns[0][1](row) for row in rows]
+            offset = 0
+            while offset < len(rows):
+                # Filas de este bloque dentro de la partición (están ordenadas por tiempo)
+                cut = len(rows) if current == len(run) - 1 else bisect_left(timestamps, boundaries[current], offset)
+                for path, value in columns:
+                    pending[path].extend(value(row) for row in rows[offset:cut])
+                offset = cut
+                if offset < len(rows):
+                    yield run[current], _make_block(pending)
+                    pending = {path: [] for path, _ in columns}
+                    current += 1
+    finally:
+        result.close()
+    # Bloque en curso y los que quedaron sin filas
+    while current < len(run):
+        yield run[current], _make_block(pending)
+        pending = {path: [] for path, _ in columns}
+        current += 1
+
+
+def _blocks(resolution, start, end, house, cache=None, chunk_rows=HISTORICAL_STREAM_CHUNK):
+    """Column blocks (path -> array) covering [start, end], in time order"""
+    size = timedelta(seconds=BLOCK_SECONDS[resolution])
+    columns = _select(resolution, start, end, house)[1]
+    now = datetime.now()
+    last = align(end or now, size.total_seconds())
+    house_key = house if house and house != 'all' else 'all'
+
+    def load(run):
+        open_end = end is None and run[-1] == last
+        for block_start, block in _fetch(resolution, house, run, open_end, columns, chunk_rows):
+            if cache is not None:
+                if cache.settled(block_start + size, now):
+                    cache.put((resolution, house_key, block_start), block, _block_bytes(block))
+                else:
+                    cache.count_open()
+            yield _slice(block, start, end)
+
+    run = []
+    block_start = align(start, size.total_seconds())
+    while block_start <= last:
+        cached = None
+        if cache is not None and cache.settled(block_start + size, now):
+            cached = cache.get((resolution, house_key, block_start))
+        if cached is None:
+            run.append(block_start)
+        else:
+            if run:
+                yield from load(run)
+                run = []
+            yield _slice(cached, start, end)
+        block_start += size
+    if run:
+        yield from load(run)
+
+
+def plan(range_param='24h', from_date=None, to_date=None, resolution='auto', points=HISTORICAL_TARGET_POINTS):
+    """Validate the request and return (resolution, start, end)"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution '{resolution}' (use one of {', '.join(RESOLUTIONS)})")
+    start, end = resolve_range(range_param, from_date, to_date)
+    if resolution == 'auto':
+        resolution = choose_resolution(start, end, points)
+    if resolution != 'raw':
+        # Incluir el bucket que contiene `start` (queda parcialmente dentro del rango)
+        start = bucket_start(start, ROLLUPS[resolution][1])
+    elif end is None:
+        start = align(start, RAW_ALIGN_SECONDS)
+    return resolution, start, end
+
+
+def _output_paths(resolution):
+    columns = _raw_columns() if resolution == 'raw' else _rollup_columns()
+    return [path for path, _ in columns if path != ('_epoch',)]
+
+
+def query_historical(range_param='24h', from_date=None, to_date=None, house=None,
+                     resolution='auto', points=HISTORICAL_TARGET_POINTS,
+                     max_points=None, method='lttb', keep_epoch=False, cache=None):
+    """Column-oriented historical data at the requested (or automatically chosen) resolution
+
+    With keep_epoch the '_epoch' column (seconds, aligned with the others) stays in the result.
+    """
+    if max_points is not None and not 0 < max_points <= HISTORICAL_MAX_POINTS_LIMIT:
+        raise ValueError(f'max_points must be between 1 and {HISTORICAL_MAX_POINTS_LIMIT}')
+    if method not in downsample.METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}' (use one of {', '.join(downsample.METHODS)})")
+    resolution, start, end = plan(range_param, from_date, to_date, resolution, points)
+    blocks = list(_blocks(resolution, start, end, house, cache))
+
+    # Las columnas siguen como arrays hasta después de la reducción: solo las filas
+    # que quedan pasan a objetos de Python
+    data = empty_result(resolution)
+    paths = _output_paths(resolution) + [('_epoch',)]
+    for path in paths:
+        values = np.concatenate([block[path] for block in blocks]) if blocks else np.empty(0)
+        target = data
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = values
+    epoch = data['_epoch']
+
+    if max_points and len(epoch) > max_points:
+        # Con filtro de casa todas las filas son de la misma serie
+        groups = None if house and house != 'all' else np.concatenate([block[HOUSE_CODE] for block in blocks])
+        downsample.downsample(data, max_points, [key for _, key in SERIES], epoch, groups, method)
+    if not keep_epoch:
+        del data['_epoch']
+        paths.remove(('_epoch',))
+    for path in paths:
+        target = _lookup(data, path[:-1])
+        if path == ('timestamps',):
+            target[path[-1]] = [t.isoformat() for t in target[path[-1]]]
+        else:
+            target[path[-1]] = _to_list(target[path[-1]])
+    return data
+
+
+def stream_historical(range_param='24h', from_date=None, to_date=None, house=None,
+                      resolution='auto', points=HISTORICAL_TARGET_POINTS, cache=None,
+                      chunk_rows=HISTORICAL_STREAM_CHUNK):
+    """Same response as query_historical (without downsampling) as an iterator of JSON text
+
+    The request is validated right away (ValueError); the query runs on the first
+    next(), before anything is emitted, so database errors can still be reported
+    with a normal error response.
+    """
+    resolution, start, end = plan(range_param, from_date, to_date, resolution, points)
+    blocks = _blocks(resolution, start, end, house, cache, chunk_rows)
+    return _stream_columns(blocks, _output_paths(resolution), {'resolution': resolution})
+
+
+def _page_select(resolution, start, end, house, key, limit):
+    """Select for one page ordered by a unique key, after `key` (None = first page)"""
+    query, columns = _select(resolution, start, end, house)
+    if resolution == 'raw':
+        order = [Lectura.hora, Lectura.id_lectura]
+        query = query.add_columns(Lectura.id_lectura)
+        key_of = lambda row: (row[0], row[-1])
+    else:
+        table = ROLLUPS[resolution][0]
+        order = [table.c.bucket, table.c.modulo]
+        key_of = lambda row: (row['bucket'], row['modulo'])
+    if key is not None:
+        query = query.where(pagination.after(order, key))
+    return query.order_by(None).order_by(*order).limit(limit + 1), columns, key_of
+
+
+def page_historical(range_param='24h', from_date=None, to_date=None, house=None,
+                    resolution='auto', points=HISTORICAL_TARGET_POINTS,
+                    limit=HISTORICAL_PAGE_SIZE, cursor=None, keep_epoch=False):
+    """One page of query_historical's result (at most `limit` rows) plus 'next_cursor'
+
+    The cursor carries the resolution, so every page of a walk uses the same one.
+    """
+    if not 0 < limit <= HISTORICAL_PAGE_MAX:
+        raise ValueError(f'limit must be between 1 and {HISTORICAL_PAGE_MAX}')
+    key = None
+    if cursor:
+        resolution, hora, last = pagination.decode_cursor(cursor, 3)
+        if resolution not in ROLLUPS and resolution != 'raw':
+            raise ValueError('Invalid cursor')
+        key = (pagination.parse_timestamp(hora), last)
+    resolution, start, end = plan(range_param, from_date, to_date, resolution, points)
+
+    query, columns, key_of = _page_select(resolution, start, end, house, key, limit)
+    result = _execute(query, resolution)
+    try:
+        rows = list(result)
+    finally:
+        result.close()
+    next_cursor = pagination.encode_cursor(resolution, *key_of(rows[limit - 1])) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    data = empty_result(resolution)
+    for path, value in columns:
+        if path == ('_epoch',) and not keep_epoch:
+            continue
+        target = data
+        for name in path[:-1]:
+            target = target.setdefault(name, {})
+        target[path[-1]] = [value(row) for row in rows]
+    data['timestamps'] = [t.isoformat() for t in data['timestamps']]
+    data['next_cursor'] = next_cursor
+    return data
+
+
+def columnar_historical(range_param='24h', from_date=None, to_date=None, house=None,
+                        resolution='auto', points=HISTORICAL_TARGET_POINTS,
+                        max_points=None, method='lttb', cache=None, chunk_rows=HISTORICAL_STREAM_CHUNK):
+    """Same data as query_historical encoded in the columnar binary format (bytes)"""
+    if max_points:
+        return encode_columnar(query_historical(range_param, from_date, to_date, house, resolution, points,
+                                                max_points, method, keep_epoch=True, cache=cache))
+
+    resolution, start, end = plan(range_param, from_date, to_date, resolution, points)
+    paths = [path for path in _output_paths(resolution) if path not in (('timestamps',), ('house',))]
+    builder = ColumnarBuilder(['.'.join(path) for path in paths], {'resolution': resolution})
+    for block in _blocks(resolution, start, end, house, cache, chunk_rows):
+        builder.add(block[('_epoch',)], block[('house',)],
+                    {'.'.join(path): block[path] for path in paths})
+    return builder.to_bytes()
+
+
+def encode_columnar(data):
+    """An in-memory result (with '_epoch') in the columnar binary format"""
+    values = list(_value_columns(data))
+    builder = ColumnarBuilder([name for name, _ in values], _meta(data))
+    builder.add(data['_epoch'], data['house'], {name: _lookup(data, path) for name, path in values})
+    return builder.to_bytes()
+
+
+def _is_columns(value):
+    """A column (list) or a group of columns like min/max ({variable: list})"""
+    return isinstance(value, list) or (isinstance(value, dict) and
+                                       all(isinstance(column, list) for column in value.values()))
+
+
+def _value_columns(data):
+    """(name, path) of every value column of an in-memory result ('min.co' -> ('min', 'co'))"""
+    for key, value in data.items():
+        if key in ('timestamps', 'house', '_epoch') or not _is_columns(value):
+            continue
+        if isinstance(value, list):
+            yield key, (key,)
+        else:
+            for name in value:
+                yield f'{key}.{name}', (key, name)
+
+
+def _lookup(data, path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def _meta(data):
+    """Non-column keys of a result (resolution, downsampled...)"""
+    return {key: value for key, value in data.items() if not _is_columns(value)}
+
+
+def _json_fragment(path, values):
+    """Block column as JSON values without the brackets: '1.0,2.5,null'"""
+    if path == ('timestamps',):
+        return json.dumps([t.isoformat() for t in values])[1:-1]
+    return json.dumps(_to_list(values))[1:-1]
+
+
+def _stream_columns(blocks, paths, extra, read_size=64 * 1024):
+    spools = [tempfile.SpooledTemporaryFile(max_size=HISTORICAL_SPOOL_BYTES, mode='w+', encoding='utf-8')
+              for _ in paths]
+    try:
+        total = 0
+        for block in blocks:
+            rows = len(block[('timestamps',)])
+            if not rows:
+                continue
+            for path, spool in zip(paths, spools):
+                if total:
+                    spool.write(',')
+                spool.write(_json_fragment(path, block[path]))
+            total += rows
+        print(f"Obteniendo {total} puntos ({extra['resolution']}) en streaming")
+
+        yield '{'
+        group = None
+        for i, (path, spool) in enumerate(zip(paths, spools)):
+            # Apertura de la clave, cerrando/abriendo objetos anidados (min/max)
+            parent = path[0] if len(path) == 2 else None
+            if group and parent != group:
+                yield '}'
+            prefix = ',' if i else ''
+            if parent and parent == group:
+                yield f'{prefix}{json.dumps(path[1])}:['
+            elif parent:
+                yield f'{prefix}{json.dumps(parent)}:{{{json.dumps(path[1])}:['
+            else:
+                yield f'{prefix}{json.dumps(path[0])}:['
+            group = parent
+
+            spool.seek(0)
+            while True:
+                chunk = spool.read(read_size)
+                if not chunk:
+                    break
+                yield chunk
+            yield ']'
+        if group:
+            yield '}'
+        for key, value in extra.items():
+            yield f',{json.dumps(key)}:{json.dumps(value)}'
+        yield '}'
+    finally:
+        blocks.close()
+        for spool in spools:
+            spool.close()
@@ -0,0 +1,180 @@
+"""
+Migraciones de esquema de la API.
+
+Cada migración es una función numerada que se aplica una sola vez; las versiones
+aplicadas quedan en la tabla schema_migrations. Se ejecutan al iniciar la API
+(en lugar de db.create_all()) o a mano:
+
+    python -m api_avicola.migrations            # aplicar pendientes
+    python -m api_avicola.migrations --status   # listar estado
+
+En PostgreSQL se toma un advisory lock para que varios workers no migren a la vez,
+y los índices se crean con CREATE INDEX CONCURRENTLY para no bloquear la ingesta.
+"""
+from datetime import datetime
+import argparse
+import os
+
+from sqlalchemy import select, text
+
+from api_avicola.models import db, ROLLUP_VARIABLES
+
+# Clave arbitraria del advisory lock de PostgreSQL
+MIGRATIONS_LOCK_KEY = 815201
+
+
+def _create_tables(conn, *names):
+    tables = [db.metadata.tables[name] for name in names]
+    db.metadata.create_all(conn, tables=tables, checkfirst=True)
+
+
+def _create_index(conn, name, table, columns, where=None):
+    """CREATE INDEX IF NOT EXISTS (CONCURRENTLY on PostgreSQL)"""
+    concurrently = 'CONCURRENTLY ' if conn.dialect.name == 'postgresql' else ''
+    sql = f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})'
+    if where:
+        sql += f' WHERE {where}'
+    conn.execute(text(sql))
+
+
+def m0001_baseline(conn):
+    """Tables that used to be created by db.create_all()"""
+    _create_tables(conn, 'lecturas', 'users', 'umbrales', 'alertas', 'cache_versions')
+
+
+def m0002_time_series_indexes(conn):
+    """Indexes for the hot query shapes on lecturas and alertas"""
+    # /api/live-data (última por módulo) y /api/historical?house=...
+    _create_index(conn, 'ix_lecturas_modulo_hora', 'lecturas', 'modulo, hora')
+    # /api/historical para todas las casas
+    _create_index(conn, 'ix_lecturas_hora', 'lecturas', 'hora')
+    # Debounce de alertas: última alerta por (tipo, modulo)
+    _create_index(conn, 'ix_alertas_tipo_modulo_timestamp', 'alertas', 'tipo, modulo, "timestamp"')
+    # /api/alerts ordenado por fecha, con o sin filtro de módulo
+    _create_index(conn, 'ix_alertas_timestamp', 'alertas', '"timestamp"')
+    _create_index(conn, 'ix_alertas_modulo_timestamp', 'alertas', 'modulo, "timestamp"')
+    # /api/alerts/stats y filtros por estado
+    _create_index(conn, 'ix_alertas_estado_prioridad', 'alertas', 'estado, prioridad')
+    # Solo alertas activas (parcial): listado y conteos por prioridad
+    _create_index(conn, 'ix_alertas_active_prioridad_timestamp', 'alertas', 'prioridad, "timestamp"',
+                  where="estado = 'active'")
+
+
+def m0003_rollup_tables(conn):
+    """1m/15m/1h rollup tables, backfilled from the existing lecturas"""
+    from api_avicola.models import Lectura
+    from api_avicola.rollups import ROLLUPS, update_rollups
+
+    _create_tables(conn, 'lecturas_1m', 'lecturas_15m', 'lecturas_1h')
+    for name in ('lecturas_1m', 'lecturas_15m', 'lecturas_1h'):
+        # La PK (modulo, bucket) sirve a las consultas por casa; este índice al rango sin casa
+        _create_index(conn, f'ix_{name}_bucket', name, 'bucket')
+
+    # Backfill en una transacción: se vacían primero, así un reintento no duplica conteos
+    columns = [Lectura.__table__.c[name] for name in ('modulo', 'hora') + ROLLUP_VARIABLES]
+    total = 0
+    with conn.engine.begin() as tx:
+        for table, _ in ROLLUPS.values():
+            tx.execute(table.delete())
+        result = tx.execution_options(yield_per=50000).execute(select(*columns))
+        for partition in result.mappings().partitions():
+            update_rollups(tx, [dict(row) for row in partition], tx.dialect.name)
+            total += len(partition)
+    print(f"    rollups backfilled from {total} lecturas")
+
+
+def m0004_alert_change_versions(conn):
+    """alertas.version and deletion tombstones for GET /api/alerts?since="""
+    from sqlalchemy import inspect
+
+    if 'version' not in {column['name'] for column in inspect(conn).get_columns('alertas')}:
+        # Las alertas existentes quedan con version NULL: anteriores a cualquier delta
+        conn.execute(text('ALTER TABLE alertas ADD COLUMN version INTEGER'))
+    _create_tables(conn, 'alertas_eliminadas')
+    _create_index(conn, 'ix_alertas_version', 'alertas', 'version')
+
+
+def m0005_tombstone_timestamps(conn):
+    """alertas_eliminadas.eliminada_en, so old tombstones can be pruned"""
+    from sqlalchemy import inspect
+
+    if 'eliminada_en' not in {column['name'] for column in inspect(conn).get_columns('alertas_eliminadas')}:
+        conn.execute(text('ALTER TABLE alertas_eliminadas ADD COLUMN eliminada_en TIMESTAMP'))
+    # Las lápidas existentes cuentan desde ahora: se conservan una ventana completa
+    conn.execute(text('UPDATE alertas_eliminadas SET eliminada_en = :now WHERE eliminada_en IS NULL'),
+                 {'now': datetime.utcnow()})
+    _create_index(conn, 'ix_alertas_eliminadas_eliminada_en', 'alertas_eliminadas', 'eliminada_en')
+
+
+# (versión, función). Agregar siempre al final; nunca reordenar ni editar una ya publicada
+MIGRATIONS = [
+    (1, m0001_baseline),
+    (2, m0002_time_series_indexes),
+    (3, m0003_rollup_tables),
+    (4, m0004_alert_change_versions),
+    (5, m0005_tombstone_timestamps),
+]
+
+
+def _ensure_migrations_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_migrations_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def upgrade(engine):
+    """Apply every pending migration; return the list of versions applied"""
+    is_postgres = engine.dialect.name == 'postgresql'
+    applied = []
+    # AUTOCOMMIT: CREATE INDEX CONCURRENTLY no puede ir dentro de una transacción
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if is_postgres:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATIONS_LOCK_KEY})
+        try:
+            _ensure_migrations_table(conn)
+            done = {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+            for version, migration in MIGRATIONS:
+                if version in done:
+                    continue
+                print(f"Applying migration {version:04d} {migration.__name__}...")
+                migration(conn)
+                conn.execute(
+                    text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                    {'v': version, 'n': migration.__name__, 't': datetime.utcnow()}
+                )
+                applied.append(version)
+        finally:
+            if is_postgres:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATIONS_LOCK_KEY})
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones de esquema de la API")
+    parser.add_argument("--status", action="store_true", help="Mostrar migraciones aplicadas y pendientes")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+    load_dotenv()
+    engine = create_engine(os.getenv('DATABASE_URL'))
+
+    if args.status:
+        done = applied_versions(engine)
+        for version, migration in MIGRATIONS:
+            print(f"{version:04d} {migration.__name__}: {'applied' if version in done else 'pending'}")
+        return
+
+    applied = upgrade(engine)
+    print(f"Applied {len(applied)} migration(s)" if applied else "Schema up to date")
+
+
+if __name__ == '__main__':
+    main()
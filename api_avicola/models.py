@@ -0,0 +1,101 @@
+"""
+Modelos SQLAlchemy compartidos por la API y el suscriptor MQTT.
+
+`db` no está ligado a ninguna app: api.py lo inicializa con db.init_app(app) y el
+suscriptor (modo escritura directa) reutiliza las tablas vía Lectura.__table__.
+"""
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime
+
+db = SQLAlchemy()
+
+class Lectura(db.Model):
+    __tablename__ = 'lecturas'
+    id_lectura = db.Column(db.String, primary_key=True)
+    modulo = db.Column(db.String)
+    hora = db.Column(db.DateTime)  
+    temperatura = db.Column(db.Float)
+    humedad = db.Column(db.Float)
+    co = db.Column(db.Float)
+    co2 = db.Column(db.Float)
+    amoniaco = db.Column(db.Float)
+
+class User(db.Model):
+    __tablename__ = 'users'
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)
+    full_name = db.Column(db.String(120))
+    role = db.Column(db.String(50))
+    initials = db.Column(db.String(10))
+    profile_image_url = db.Column(db.String(500))
+    
+    def set_password(self, password):
+        """Hash the password and store it"""
+        self.password_hash = generate_password_hash(password)
+    
+    def check_password(self, password):
+        """Check if the provided password matches the hash"""
+        return check_password_hash(self.password_hash, password)
+
+class Umbral(db.Model):
+    __tablename__ = 'umbrales'
+    id = db.Column(db.Integer, primary_key=True)
+    variable = db.Column(db.String(50), unique=True, nullable=False)
+    valor_medio = db.Column(db.Float, nullable=False)
+    valor_alto = db.Column(db.Float, nullable=False)
+    valor_grave = db.Column(db.Float, nullable=False)
+
+class Alerta(db.Model):
+    __tablename__ = 'alertas'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # temperature, humidity, co, co2, amoniaco
+    prioridad = db.Column(db.String(20), nullable=False)  # critical, warning, info
+    mensaje = db.Column(db.Text, nullable=False)
+    modulo = db.Column(db.String(50), nullable=False)
+    valor_actual = db.Column(db.Float)
+    umbral = db.Column(db.Float)
+    estado = db.Column(db.String(20), default='active')  # active, acknowledged, resolved
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp_resuelto = db.Column(db.DateTime)
+    sensor = db.Column(db.String(100))
+    # Valor del contador 'alertas' en su último cambio (GET /api/alerts?since=)
+    version = db.Column(db.Integer)
+
+class AlertaEliminada(db.Model):
+    """Tombstone of a deleted alert, so delta polls can report the deletion"""
+    __tablename__ = 'alertas_eliminadas'
+    alerta_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, primary_key=True)
+    # Para podar las lápidas más viejas que ALERTS_TOMBSTONE_RETENTION
+    eliminada_en = db.Column(db.DateTime)
+
+class CacheVersion(db.Model):
+    """Version counters used to invalidate in-process caches across workers"""
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Variables agregadas en las tablas de rollup
+ROLLUP_VARIABLES = ('temperatura', 'humedad', 'co', 'co2', 'amoniaco')
+
+def _rollup_table(name):
+    """min/max/sum/count per variable for one (modulo, bucket); n = readings in the bucket"""
+    columns = [
+        db.Column('modulo', db.String, primary_key=True),
+        db.Column('bucket', db.DateTime, primary_key=True),
+        db.Column('n', db.Integer, nullable=False)
+    ]
+    for variable in ROLLUP_VARIABLES:
+        columns += [
+            db.Column(f'{variable}_min', db.Float),
+            db.Column(f'{variable}_max', db.Float),
+            db.Column(f'{variable}_sum', db.Float),
+            db.Column(f'{variable}_count', db.Integer)
+        ]
+    return db.Table(name, *columns)
+
+lecturas_1m = _rollup_table('lecturas_1m')
+lecturas_15m = _rollup_table('lecturas_15m')
+lecturas_1h = _rollup_table('lecturas_1h')
@@ -1,25 +1,84 @@
 
 from datetime import datetime
 import paho.mqtt.client as mqtt
-import requests, json, uuid, time, os
+import json, uuid, time, os
+import signal, threading, zlib
+
+from api_avicola.forwarder import Forwarder, HttpSink
+from api_avicola.reassembler import Reassembler, SENSOR_COLUMNS
+from api_avicola.spool import Spool
 
 # environment variables
 API_URL = os.getenv('API_URL', 'http://localhost:5000/lecturas')
+# Endpoint de inserción por lotes usado por el forwarder
+API_BATCH_URL = os.getenv('API_BATCH_URL', API_URL.rstrip('/') + '/batch')
+# http: envía a la API (por defecto) | db: escribe directo en la tabla lecturas
+SUBSCRIBER_MODE = os.getenv('SUBSCRIBER_MODE', 'http')
 MQTT_BROKER = os.getenv('MQTT_BROKER', 'localhost')
 MQTT_PORT = int(os.getenv('MQTT_PORT', '1883'))
 # Por defecto escuchamos todos los módulos y tanto esquema viejo como nuevo
 # - Esquema viejo: sensor/modulo1/temperatura, sensor/modulo1/humedad, etc.
 # - Esquema nuevo: sensor/modulo1/data (JSON con todos los valores)
 MQTT_TOPIC = os.getenv('MQTT_TOPIC', 'sensor/#')
+# Suscripción compartida entre varios procesos (ver api_avicola/subscriber_supervisor.py).
+# Vacío: un solo cliente escucha MQTT_TOPIC.
+MQTT_SHARE_GROUP = os.getenv('MQTT_SHARE_GROUP', '')
+MQTT_WORKERS = int(os.getenv('MQTT_WORKERS', '1'))
+MQTT_WORKER_INDEX = int(os.getenv('MQTT_WORKER_INDEX', '0'))
+# Módulos del esquema viejo que se reparten por hash entre los workers (ej. "1-64" o "1,2,5-8")
+MQTT_LEGACY_MODULES = os.getenv('MQTT_LEGACY_MODULES', '1-64')
+LEGACY_SENSORS = tuple(SENSOR_COLUMNS)
+
+
+# Spool en disco para lotes que no se pudieron entregar (vacío = desactivado)
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'mqtt_spool')
+# Cola + hilo de envío, reensamblado del esquema viejo y spool; se crean en start()
+forwarder = None
+reassembler = None
+spool = None
+def module_owner(module_raw, workers=MQTT_WORKERS):
+    """Index of the worker that handles a module ('modulo3'), the same in every process"""
+    return zlib.crc32(module_raw.encode()) % workers
+
+def _parse_modules(spec):
+    numbers = []
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-', 1)
+            numbers.extend(range(int(first), int(last) + 1))
+        elif part:
+            numbers.append(int(part))
+    return numbers
+
+def subscriptions(group=MQTT_SHARE_GROUP, workers=MQTT_WORKERS, index=MQTT_WORKER_INDEX):
+    """(topic filter, qos) list for this process
+
+    With a share group, JSON readings (sensor/<modulo>/data, one complete reading per
+    message) go through the shared subscription and the broker balances them across
+    workers. The old per-sensor topics must reach the same process to be reassembled
+    in order, so each module is owned by one worker (module_owner) that subscribes to
+    its topics directly.
+    """
+    if not group:
+        return [(MQTT_TOPIC, 0)]
+    topics = [(f'$share/{group}/sensor/+/data', 0)]
+    for number in _parse_modules(MQTT_LEGACY_MODULES):
+        module_raw = f'modulo{number}'
+        if module_owner(module_raw, workers) == index:
+            topics.extend((f'sensor/{module_raw}/{sensor}', 0) for sensor in LEGACY_SENSORS)
+    return topics
 
-
-current_readings = {}
-last_reading_time = None
 def on_connect(client, userdata, flags, rc):
     print(f"Conected to MQTT broker: {rc}")
     if rc == 0:
-        client.subscribe(MQTT_TOPIC)
-        print("Topic:  ", MQTT_TOPIC)
+        topics = subscriptions()
+        client.subscribe(topics)
+        if MQTT_SHARE_GROUP:
+            print(f"Topic:   $share/{MQTT_SHARE_GROUP}/sensor/+/data + {len(topics) - 1} legacy "
+                  f"(worker {MQTT_WORKER_INDEX + 1}/{MQTT_WORKERS})")
+        else:
+            print("Topic:  ", MQTT_TOPIC)
     else:
         print(f" Error de conexión MQTT: {rc}")
 
@@ -60,21 +119,10 @@ def on_message(client, userdata, message):
 
                 print(f"[JSON] Recibido desde {topic}: {lectura_json}")
 
-                try:
-                    response = requests.post(API_URL, json=lectura_json, timeout=5)
-                    if response.status_code == 200:
-                        print(f"✅ Lectura JSON ENVIADA a BD: {lectura_json['id_lectura']}")
-                    else:
-                        print(f"❌ Error API (HTTP {response.status_code}): {response.text}")
-                except requests.exceptions.ConnectionError:
-                    print("❌ ERROR: No se pudo conectar a la API en http://localhost:5000")
-                    print("   💡 Verifica que la API esté ejecutándose")
-                except requests.exceptions.Timeout:
-                    print("❌ ERROR: Timeout al conectar con la API")
-                except Exception as e:
-                    print(f"❌ ERROR enviando a API (JSON): {e}")
-
-                # Para mensajes JSON no usamos el buffer ni cleanup
+                # Encolar sin bloquear el hilo de red de paho
+                submit(lectura_json)
+
+                # Los mensajes JSON ya traen la lectura completa: no pasan por el reensamblado
                 return
         except json.JSONDecodeError:
             # No es JSON, seguimos con el flujo antiguo
@@ -99,101 +147,74 @@ def on_message(client, userdata, message):
         module_num = module_raw.replace('modulo', '')  # '1'
         module_id = f'M{module_num}'  # Formato M1, M2, etc.
 
-        current_time = datetime.now()
-        # ID único que incluye módulo y timestamp para evitar conflictos
-        reading_id = f"{module_id}_{int(current_time.timestamp()) // 1}"
-
-        if reading_id not in current_readings:
-            current_readings[reading_id] = {
-                'id_lectura': str(uuid.uuid4()),
-                'modulo': module_id,  # Usar el módulo extraído del topic
-                'hora': current_time.isoformat(),
-                'temperatura': 0.0,
-                'humedad': 0.0,
-                'co': 0.0,
-                'co2': 0.0,
-                'amoniaco': 0.0,
-                'count': 0  # Contador de sensores recibidos
-            }
-
-        # Actualizar el valor correspondiente y aumentar contador
-        reading = current_readings[reading_id]
-        if sensor_type == 'temperatura':
-            reading['temperatura'] = value
-            reading['count'] += 1
-        elif sensor_type == 'humedad':
-            reading['humedad'] = value
-            reading['count'] += 1
-        elif sensor_type == 'co':
-            reading['co'] = value
-            reading['count'] += 1
-        elif sensor_type == 'nh3':
-            reading['amoniaco'] = value
-            reading['count'] += 1
-        elif sensor_type == 'co2':
-            reading['co2'] = value
-            reading['count'] += 1
-
-        if reading['count'] >= 5:
-            print(f"Sending to API: \n{reading}")
-            
-            # Enviar a la API via POST
-            try:
-                response = requests.post(API_URL, json=reading, timeout=5)
-                if response.status_code == 200:
-                    print(f"✅ Lectura ENVIADA EXITOSAMENTE a BD: {reading['id_lectura']}")
-                    print(f"   📊 Datos: Temp={reading['temperatura']}°C, Hum={reading['humedad']}%, NH3={reading['amoniaco']}ppm, CO2={reading['co2']}ppm")
-                    
-                    # ✅ LIMPIAR: Eliminar lectura procesada
-                    if reading_id in current_readings:
-                        del current_readings[reading_id]
-                        print(f"🧹 Lectura {reading_id} eliminada del buffer")
-                else:
-                    print(f"❌ Error API (HTTP {response.status_code}): {response.text}")
-            except requests.exceptions.ConnectionError:
-                print("❌ ERROR: No se pudo conectar a la API en http://localhost:5000")
-                print("   💡 Verifica que la API esté ejecutándose")
-            except requests.exceptions.Timeout:
-                print("❌ ERROR: Timeout al conectar con la API")
-            except Exception as e:
-                print(f"❌ ERROR enviando a API: {e}")
-
-        # ✅ MEJORADO: Limpiar lecturas antiguas (> 30 segundos)
-        cleanup_old_readings()
-
-    except Exception:
-        # Cualquier error inesperado se ignora para no tumbar el subscriber
-        pass
-
-def cleanup_old_readings():
-    """Clear old readings from buffer"""
-    current_time = datetime.now().timestamp()
-    keys_to_delete = []
-    
-    for reading_id, reading_data in current_readings.items():
-        # El reading_id está basado en timestamp, calcular antigüedad
-        reading_timestamp = int(reading_id) * 5
-        if current_time - reading_timestamp > 30:  # Más de 30 segundos
-            keys_to_delete.append(reading_id)
-    
-    for key in keys_to_delete:
-        print(f"Deleting old values: {key}")
-        del current_readings[key]
+        # Juntar por módulo; la lectura sale completa o parcial al vencer la ventana
+        reassembler.add(module_id, sensor_type, value)
+
+    except Exception as e:
+        # Un error inesperado no debe tumbar el subscriber, pero tampoco pasar en silencio
+        print(f"❌ Error procesando {message.topic}: {e}")
+
+def submit(lectura):
+    """Queue a reading on the forwarder, logging it if the queue dropped it"""
+    if not forwarder.submit(lectura):
+        print(f"⚠️ Cola llena, lectura descartada: {lectura['id_lectura']}")
+
+def create_sink():
+    """Build the forwarder sink for SUBSCRIBER_MODE"""
+    if SUBSCRIBER_MODE == 'db':
+        from api_avicola.db_writer import DatabaseSink, DATABASE_URL
+        from api_avicola.alert_engine import DirectAlertEvaluator
+        sink = DatabaseSink()
+        # En modo db la API no ve las inserciones: las alertas se evalúan aquí mismo
+        sink.after_write = DirectAlertEvaluator(DATABASE_URL)
+        print(f"    DB WRITER: {sink.engine.dialect.name} ({'COPY' if sink.use_copy else 'multi-row INSERT'})")
+        return sink
+    if SUBSCRIBER_MODE != 'http':
+        raise ValueError(f"Unknown SUBSCRIBER_MODE '{SUBSCRIBER_MODE}' (use http or db)")
+    return HttpSink(API_BATCH_URL)
+
+def setup(sink=None):
+    """Build the forwarder, spool and reassembler that on_message feeds (sink: create_sink())"""
+    global forwarder, reassembler, spool
+    sink = sink or create_sink()
+    forwarder = Forwarder(sink)
+    if SPOOL_DIR:
+        spool = Spool(SPOOL_DIR)
+        forwarder.on_failure = spool.append
+        spool.start(sink)
+        print(f"    SPOOL: {SPOOL_DIR} (pendientes: {spool.stats()['depth']}, replay={spool.replay_rate}/s)")
+    forwarder.start()
+    reassembler = Reassembler(submit)
+    reassembler.start()
+    print(f"    REASSEMBLER: window={reassembler.window}s, max_pending={reassembler.max_pending}")
+    print(f"    FORWARDER: batch={forwarder.batch_size}, flush={forwarder.flush_interval}s, "
+          f"queue={forwarder.max_queue}, policy={forwarder.drop_policy}")
 
 def start():
     print(" STARTING MQTT SUBSCRIBER MODULE")
     print(" MQTT CONFIGURATION:")
     print(f"    API_URL: {API_URL}")
+    print(f"    API_BATCH_URL: {API_BATCH_URL}")
+    print(f"    SUBSCRIBER_MODE: {SUBSCRIBER_MODE}")
     print(f"    MQTT_BROKER: {MQTT_BROKER}")
     print(f"    MQTT_PORT: {MQTT_PORT}")
     print(f"    MQTT_TOPIC: {MQTT_TOPIC}")
+    if MQTT_SHARE_GROUP:
+        print(f"    MQTT_SHARE_GROUP: {MQTT_SHARE_GROUP} (worker {MQTT_WORKER_INDEX + 1}/{MQTT_WORKERS})")
+
+    setup()
 
-    
     try:
-        client = mqtt.Client()
+        # Client id propio por worker: dos clientes con el mismo id se desconectan entre sí
+        client_id = f'avicola-{MQTT_SHARE_GROUP}-{MQTT_WORKER_INDEX}' if MQTT_SHARE_GROUP else ''
+        client = mqtt.Client(client_id=client_id)
         client.on_connect = on_connect
         client.on_message = on_message
 
+        if threading.current_thread() is threading.main_thread():
+            # SIGTERM (docker stop): salir del loop y vaciar el forwarder en stop()
+            signal.signal(signal.SIGTERM, lambda signum, frame: client.disconnect())
+
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
         client.loop_forever()
         
@@ -201,9 +222,24 @@ def start():
         print("ERROR: MQTT connection refused")
     except Exception as e:
         print(f"ERROR: MQTT configuration error {e}")
+    finally:
+        stop()
 
 def stop():
     print("🛑 Deteniendo suscriptor MQTT...")
+    if reassembler:
+        # Las lecturas a medio juntar salen como parciales antes de vaciar la cola
+        reassembler.stop()
+        print(f"📈 Reassembler stats: {reassembler.stats()}")
+    if spool:
+        # Primero el replay: comparte el sink que forwarder.stop() cierra
+        spool.stop()
+    if forwarder:
+        # Vaciar lo que quede en la cola antes de salir; lo que falle va al spool (fsync por lote)
+        forwarder.stop()
+        print(f"📈 Forwarder stats: {forwarder.stats()}")
+    if spool:
+        print(f"📈 Spool stats: {spool.stats()}")
 
 if __name__ == "__main__":
     start()
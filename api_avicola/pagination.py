@@ -0,0 +1,52 @@
+"""
+Paginación por cursor (keyset) para /api/alerts y /api/historical.
+
+Un cursor es la clave de orden de la última fila entregada (por ejemplo
+(timestamp, id) en alertas), codificada como JSON en base64 url-safe. La página
+siguiente filtra "después de esa clave" en lugar de usar OFFSET, así cualquier
+página cuesta lo mismo que la primera: el índice arranca directo en la clave.
+"""
+from datetime import datetime
+import base64
+import binascii
+import json
+
+
+def encode_cursor(*values):
+    """Opaque token for a sort key (datetimes are kept as ISO strings)"""
+    key = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Sort key list from a token produced by encode_cursor; ValueError if malformed"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError('Invalid cursor')
+    return key
+
+
+def parse_timestamp(value):
+    """Datetime stored in a cursor"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def after(columns, key, descending=False):
+    """Keyset condition "row comes after key" for an ORDER BY over columns
+
+    Written as `first >= k0 AND (first > k0 OR (...))` so the leading column can
+    drive an index range scan on databases without row-value comparisons.
+    """
+    first, rest = columns[0], columns[1:]
+    first_key = key[0]
+    if not rest:
+        return first < first_key if descending else first > first_key
+    strict = first < first_key if descending else first > first_key
+    bound = first <= first_key if descending else first >= first_key
+    return bound & (strict | after(rest, key[1:], descending))
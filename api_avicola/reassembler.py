@@ -0,0 +1,171 @@
+"""
+Reensamblado de lecturas del firmware viejo (un topic por sensor).
+
+El firmware viejo publica cada valor por separado en sensor/moduloX/<sensor>.
+Reassembler junta los valores de un módulo en una lectura pendiente y la emite:
+
+- completa, apenas llegan los cinco sensores;
+- parcial (los sensores faltantes en None), cuando pasan REASSEMBLY_WINDOW
+  segundos desde el primer valor, cuando llega otra vez un sensor que la lectura
+  ya tiene (empezó el ciclo siguiente) o cuando hay más de REASSEMBLY_MAX_PENDING
+  módulos pendientes (se emite la más vieja).
+
+Hay a lo sumo una lectura pendiente por módulo. Como la ventana es la misma para
+todas, el orden de llegada es el orden de vencimiento: las pendientes viven en un
+OrderedDict y vencerlas es sacar del principio, O(1) por lectura.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+import uuid
+import os
+
+# environment variables
+REASSEMBLY_WINDOW = float(os.getenv('REASSEMBLY_WINDOW', '5'))
+REASSEMBLY_MAX_PENDING = int(os.getenv('REASSEMBLY_MAX_PENDING', '1024'))
+# Lecturas parciales con menos sensores que esto se descartan en lugar de emitirse
+REASSEMBLY_MIN_SENSORS = int(os.getenv('REASSEMBLY_MIN_SENSORS', '1'))
+
+# Sensor del topic -> columna de lecturas
+SENSOR_COLUMNS = {
+    'temperatura': 'temperatura',
+    'humedad': 'humedad',
+    'co': 'co',
+    'co2': 'co2',
+    'nh3': 'amoniaco',
+}
+
+
+class Reassembler:
+    """Per-module windowed reassembly of per-sensor values into readings
+
+    Readings are handed to `emit` (e.g. Forwarder.submit) outside the lock.
+    """
+
+    def __init__(self, emit, window=REASSEMBLY_WINDOW, max_pending=REASSEMBLY_MAX_PENDING,
+                 min_sensors=REASSEMBLY_MIN_SENSORS):
+        self.emit = emit
+        self.window = window
+        self.max_pending = max_pending
+        self.min_sensors = min_sensors
+
+        self._pending = OrderedDict()   # modulo -> (deadline, lectura, sensores recibidos)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._counters = {
+            'complete': 0,
+            'partial': 0,
+            'expired': 0,
+            'superseded': 0,
+            'evicted': 0,
+            'discarded': 0,
+        }
+
+    def add(self, module_id, sensor, value, now=None):
+        """Add one sensor value; return False if the sensor is unknown"""
+        column = SENSOR_COLUMNS.get(sensor)
+        if column is None:
+            return False
+        now = time.monotonic() if now is None else now
+        ready = []
+        with self._lock:
+            self._expire(now, ready)
+
+            entry = self._pending.get(module_id)
+            if entry is not None and column in entry[2]:
+                # El sensor se repite: la lectura anterior no se va a completar
+                del self._pending[module_id]
+                self._counters['superseded'] += 1
+                self._partial(entry, ready)
+                entry = None
+
+            if entry is None:
+                lectura = {
+                    'id_lectura': str(uuid.uuid4()),
+                    'modulo': module_id,
+                    'hora': datetime.now().isoformat(),
+                    **{name: None for name in SENSOR_COLUMNS.values()},
+                }
+                entry = (now + self.window, lectura, set())
+                self._pending[module_id] = entry
+                if len(self._pending) > self.max_pending:
+                    self._counters['evicted'] += 1
+                    self._partial(self._pending.popitem(last=False)[1], ready)
+
+            entry[1][column] = value
+            entry[2].add(column)
+            if len(entry[2]) == len(SENSOR_COLUMNS):
+                del self._pending[module_id]
+                self._counters['complete'] += 1
+                ready.append(entry[1])
+
+        for lectura in ready:
+            self.emit(lectura)
+        return True
+
+    def expire(self, now=None):
+        """Emit every pending reading whose window has elapsed"""
+        ready = []
+        with self._lock:
+            self._expire(time.monotonic() if now is None else now, ready)
+        for lectura in ready:
+            self.emit(lectura)
+
+    def flush(self):
+        """Emit everything still pending as partial readings"""
+        ready = []
+        with self._lock:
+            while self._pending:
+                self._partial(self._pending.popitem(last=False)[1], ready)
+        for lectura in ready:
+            self.emit(lectura)
+
+    def _expire(self, now, ready):
+        while self._pending:
+            entry = next(iter(self._pending.values()))
+            if entry[0] > now:
+                break
+            self._pending.popitem(last=False)
+            self._counters['expired'] += 1
+            self._partial(entry, ready)
+
+    def _partial(self, entry, ready):
+        if len(entry[2]) < self.min_sensors:
+            self._counters['discarded'] += 1
+            return
+        self._counters['partial'] += 1
+        ready.append(entry[1])
+
+    # ------------------------------------------------------------------
+    # Vencimiento en segundo plano (sin mensajes nuevos nadie llamaría a expire)
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='mqtt-reassembler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the expiry thread and flush what is still pending"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        interval = min(self.window / 2, 1.0)
+        while not self._stop_event.wait(interval):
+            self.expire()
+
+    def stats(self):
+        """Snapshot of counters and pending readings"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._pending)
+            stats['max_pending'] = self.max_pending
+            stats['window'] = self.window
+        return stats
@@ -0,0 +1,90 @@
+"""
+Rollups de lecturas a 1 minuto, 15 minutos y 1 hora.
+
+Se mantienen de forma incremental: cada lote ingresado se agrega en Python por
+(modulo, bucket) y se aplica con un upsert (INSERT ... ON CONFLICT DO UPDATE) en la
+misma transacción que inserta las lecturas. Las filas van ordenadas por (modulo,
+bucket) y las tablas siempre de 1m a 1h, así todas las transacciones toman los
+bloqueos en el mismo orden.
+"""
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from api_avicola.models import ROLLUP_VARIABLES, lecturas_1m, lecturas_15m, lecturas_1h
+
+# resolución -> (tabla, segundos por bucket); de la más fina a la más gruesa
+ROLLUPS = {
+    '1m': (lecturas_1m, 60),
+    '15m': (lecturas_15m, 900),
+    '1h': (lecturas_1h, 3600),
+}
+
+
+def bucket_start(hora, seconds):
+    """Floor a naive datetime to the start of its bucket"""
+    if seconds == 60:
+        return hora.replace(second=0, microsecond=0)
+    minutes = seconds // 60
+    return hora.replace(minute=hora.minute - hora.minute % minutes, second=0, microsecond=0)
+
+
+def aggregate(rows, seconds):
+    """Group reading rows into rollup rows for one resolution, sorted by (modulo, bucket)"""
+    buckets = {}
+    for row in rows:
+        if row.get('hora') is None:
+            continue
+        key = (row['modulo'], bucket_start(row['hora'], seconds))
+        acc = buckets.get(key)
+        if acc is None:
+            acc = {'modulo': key[0], 'bucket': key[1], 'n': 0}
+            for variable in ROLLUP_VARIABLES:
+                acc[f'{variable}_min'] = None
+                acc[f'{variable}_max'] = None
+                acc[f'{variable}_sum'] = 0.0
+                acc[f'{variable}_count'] = 0
+            buckets[key] = acc
+        acc['n'] += 1
+        for variable in ROLLUP_VARIABLES:
+            valor = row.get(variable)
+            if valor is None:
+                continue
+            if acc[f'{variable}_min'] is None or valor < acc[f'{variable}_min']:
+                acc[f'{variable}_min'] = valor
+            if acc[f'{variable}_max'] is None or valor > acc[f'{variable}_max']:
+                acc[f'{variable}_max'] = valor
+            acc[f'{variable}_sum'] += valor
+            acc[f'{variable}_count'] += 1
+    # Orden fijo: dos lotes concurrentes bloquean las filas del rollup en el mismo
+    # orden y no pueden quedar en deadlock (PostgreSQL)
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def _least(a, b):
+    # Portable (PostgreSQL y SQLite) e ignorando NULL, como LEAST() en PostgreSQL
+    return case((a.is_(None), b), (b.is_(None), a), (a < b, a), else_=b)
+
+
+def _greatest(a, b):
+    return case((a.is_(None), b), (b.is_(None), a), (a > b, a), else_=b)
+
+
+def _upsert(table, dialect_name):
+    dialect_insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+    stmt = dialect_insert(table)
+    excluded = stmt.excluded
+    values = {'n': table.c.n + excluded.n}
+    for variable in ROLLUP_VARIABLES:
+        values[f'{variable}_min'] = _least(table.c[f'{variable}_min'], excluded[f'{variable}_min'])
+        values[f'{variable}_max'] = _greatest(table.c[f'{variable}_max'], excluded[f'{variable}_max'])
+        values[f'{variable}_sum'] = func.coalesce(table.c[f'{variable}_sum'], 0) + excluded[f'{variable}_sum']
+        values[f'{variable}_count'] = func.coalesce(table.c[f'{variable}_count'], 0) + excluded[f'{variable}_count']
+    return stmt.on_conflict_do_update(index_elements=['modulo', 'bucket'], set_=values)
+
+
+def update_rollups(executor, rows, dialect_name):
+    """Fold freshly inserted readings into every rollup table (executor: Session or Connection)"""
+    if not rows:
+        return
+    for table, seconds in ROLLUPS.values():
+        executor.execute(_upsert(table, dialect_name), aggregate(rows, seconds))
@@ -0,0 +1,281 @@
+"""
+Spool en disco para lecturas que no se pudieron entregar (API o BD caída).
+
+Las lecturas se agregan (append-only, JSON por línea) a archivos de segmento
+`<seq>.seg` con un fsync por lote. Un hilo de replay reenvía los segmentos cerrados
+en bloques cuando el backend vuelve, limitado a SPOOL_REPLAY_RATE lecturas/s.
+El progreso de cada segmento se guarda en `<seq>.ack` para no duplicar tras un reinicio.
+
+Solo SinkError (backend caído) pausa el replay. Si el sink rechaza un bloque por
+otro motivo (p. ej. una restricción de la BD), se reenvía lectura por lectura y
+las que siguen fallando se apartan en `<seq>.rejected` para que el spool avance.
+"""
+import threading
+import json
+import time
+import os
+
+from api_avicola.forwarder import SinkError
+
+# environment variables
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'mqtt_spool')
+SPOOL_SEGMENT_RECORDS = int(os.getenv('SPOOL_SEGMENT_RECORDS', '10000'))
+SPOOL_REPLAY_RATE = float(os.getenv('SPOOL_REPLAY_RATE', '500'))  # lecturas/s
+SPOOL_REPLAY_BATCH = int(os.getenv('SPOOL_REPLAY_BATCH', '200'))
+SPOOL_RETRY_INTERVAL = float(os.getenv('SPOOL_RETRY_INTERVAL', '5'))
+SPOOL_STATS_INTERVAL = float(os.getenv('SPOOL_STATS_INTERVAL', '60'))
+
+
+class Spool:
+    """Append-only segment files plus a rate-limited replay thread"""
+
+    def __init__(self, directory=SPOOL_DIR, segment_records=SPOOL_SEGMENT_RECORDS,
+                 replay_rate=SPOOL_REPLAY_RATE, replay_batch=SPOOL_REPLAY_BATCH,
+                 retry_interval=SPOOL_RETRY_INTERVAL, stats_interval=SPOOL_STATS_INTERVAL):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.replay_rate = replay_rate
+        self.replay_batch = replay_batch
+        self.retry_interval = retry_interval
+        self.stats_interval = stats_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+        self._active = None          # archivo abierto para append
+        self._active_name = None
+        self._active_records = 0
+
+        segments = self._segments()
+        self._next_seq = int(segments[-1].split('.')[0]) + 1 if segments else 1
+        self._counters = {
+            'depth': sum(self._count_records(name) - self._read_ack(name) for name in segments),
+            'spooled': 0,
+            'replayed': 0,
+            'rejected': 0,
+            'corrupt': 0,
+            'quarantined': 0,
+            'replay_errors': 0,
+            'segments_done': 0,
+        }
+        self._replay_window = (time.monotonic(), 0)
+        self._replay_rate_now = 0.0
+
+    # ------------------------------------------------------------------
+    # Archivos de segmento
+    # ------------------------------------------------------------------
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.seg'))
+
+    def _count_records(self, name):
+        with open(self._path(name), 'rb') as f:
+            return sum(1 for line in f if line.strip())
+
+    def _read_ack(self, name):
+        try:
+            with open(self._path(name[:-4] + '.ack')) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _quarantine(self, name, lectura, error):
+        """Append a reading the sink refuses to <seq>.rejected (JSON per line, with the error)"""
+        line = json.dumps({'lectura': lectura, 'error': str(error)}, default=str) + '\n'
+        with open(self._path(name[:-4] + '.rejected'), 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._counters['quarantined'] += 1
+
+    def _write_ack(self, name, count):
+        tmp = self._path(name[:-4] + '.ack.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(name[:-4] + '.ack'))
+
+    def _seal_active(self):
+        """Close the active segment so the replay thread can consume it"""
+        if self._active:
+            self._active.close()
+            self._active = None
+            self._active_name = None
+            self._active_records = 0
+
+    # ------------------------------------------------------------------
+    # Escritura (hilo del forwarder)
+    # ------------------------------------------------------------------
+    def append(self, batch):
+        """Persist a failed batch: one write and one fsync for the whole batch"""
+        if not batch:
+            return
+        data = ''.join(json.dumps(lectura, default=str) + '\n' for lectura in batch).encode()
+        with self._lock:
+            if self._active is None:
+                self._active_name = f"{self._next_seq:012d}.seg"
+                self._next_seq += 1
+                self._active = open(self._path(self._active_name), 'ab')
+            self._active.write(data)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active_records += len(batch)
+            self._counters['spooled'] += len(batch)
+            self._counters['depth'] += len(batch)
+            if self._active_records >= self.segment_records:
+                self._seal_active()
+        print(f"💾 {len(batch)} lecturas guardadas en spool (pendientes: {self._counters['depth']})")
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # Replay (hilo propio)
+    # ------------------------------------------------------------------
+    def start(self, sink):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(sink,), name='mqtt-spool-replay', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._lock:
+            self._seal_active()
+
+    def _run(self, sink):
+        last_stats = time.monotonic()
+        retry_after = 0.0
+        while self._running:
+            wait = 0.1
+            if time.monotonic() >= retry_after:
+                with self._lock:
+                    if self._counters['depth'] > 0 and not self._segments_closed():
+                        self._seal_active()
+                    segments = self._segments_closed()
+
+                for name in segments:
+                    if not self._running:
+                        break
+                    if not self._replay_segment(sink, name):
+                        # Backend caído: no reintentar antes de retry_interval
+                        retry_after = time.monotonic() + self.retry_interval
+                        break
+                if not segments:
+                    wait = self.retry_interval
+            else:
+                wait = retry_after - time.monotonic()
+
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                if self._counters['depth'] or self._counters['replayed']:
+                    print(f"📈 Spool stats: {self.stats()}")
+
+            self._wakeup.wait(max(wait, 0.01))
+            self._wakeup.clear()
+
+    def _segments_closed(self):
+        return [name for name in self._segments() if name != self._active_name]
+
+    def _replay_segment(self, sink, name):
+        """Replay one closed segment; return False if the backend is still unavailable"""
+        acked = self._read_ack(name)
+        with open(self._path(name), 'rb') as f:
+            lines = [line for line in f if line.strip()]
+
+        position = acked
+        while position < len(lines) and self._running:
+            chunk_lines = lines[position:position + self.replay_batch]
+            chunk = []
+            for line in chunk_lines:
+                try:
+                    chunk.append(json.loads(line))
+                except ValueError:
+                    # Línea truncada por un corte de energía durante la escritura
+                    self._counters['corrupt'] += 1
+
+            started = time.monotonic()
+            if chunk:
+                try:
+                    rejected = sink.send(chunk) or 0
+                except SinkError as e:
+                    self._counters['replay_errors'] += 1
+                    print(f"⏸️ Replay del spool en pausa, backend no disponible: {e}")
+                    return False
+                except Exception as e:
+                    # Error permanente: reintentarlo igual no avanzaría nunca
+                    self._counters['replay_errors'] += 1
+                    print(f"❌ Bloque rechazado en replay del spool, reenviando de a una lectura: {e}")
+                    rejected = self._replay_one_by_one(sink, name, chunk)
+                    if rejected is None:
+                        return False
+                self._counters['rejected'] += rejected
+                self._record_replayed(len(chunk) - rejected)
+
+            position += len(chunk_lines)
+            self._write_ack(name, position)
+            with self._lock:
+                self._counters['depth'] = max(0, self._counters['depth'] - len(chunk_lines))
+
+            # Limitar el ritmo de replay para no saturar la BD
+            if self.replay_rate > 0:
+                min_duration = len(chunk_lines) / self.replay_rate
+                elapsed = time.monotonic() - started
+                if elapsed < min_duration:
+                    time.sleep(min_duration - elapsed)
+
+        if position >= len(lines):
+            os.remove(self._path(name))
+            ack_path = self._path(name[:-4] + '.ack')
+            if os.path.exists(ack_path):
+                os.remove(ack_path)
+            self._counters['segments_done'] += 1
+        return True
+
+    def _replay_one_by_one(self, sink, name, chunk):
+        """Send a refused chunk one reading at a time; None if the backend went down meanwhile
+
+        The sink skips ids it already wrote, so starting the chunk over after a
+        pause is safe.
+        """
+        rejected = 0
+        for lectura in chunk:
+            try:
+                rejected += sink.send([lectura]) or 0
+            except SinkError as e:
+                print(f"⏸️ Replay del spool en pausa, backend no disponible: {e}")
+                return None
+            except Exception as e:
+                print(f"❌ Lectura apartada en {name[:-4]}.rejected: {e}")
+                self._quarantine(name, lectura, e)
+                rejected += 1
+        return rejected
+
+    def _record_replayed(self, count):
+        self._counters['replayed'] += count
+        window_start, window_count = self._replay_window
+        if time.monotonic() - window_start > 60:
+            # Ventana vieja (spool inactivo): empezar a medir de nuevo
+            window_start, window_count = time.monotonic(), 0
+        window_count += count
+        elapsed = time.monotonic() - window_start
+        if elapsed >= 5:
+            self._replay_rate_now = window_count / elapsed
+            self._replay_window = (time.monotonic(), 0)
+        else:
+            self._replay_window = (window_start, window_count)
+
+    def stats(self):
+        """Spool depth and replay throughput"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['segments'] = len(self._segments())
+            stats['replay_rate'] = round(self._replay_rate_now, 1)
+        return stats
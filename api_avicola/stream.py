@@ -0,0 +1,192 @@
+"""
+Stream de eventos (Server-Sent Events) para lecturas nuevas y alertas nuevas o cambiadas.
+
+Un único hilo "watcher" por proceso detecta cambios (caché de última lectura y
+alertas con `version` mayor a la última enviada) y los publica a las colas de los
+clientes suscritos. Cada evento se serializa una sola vez. Con un worker gevent
+(gunicorn -k gevent, el default de serving.py) cada conexión inactiva es un
+greenlet, no un hilo. Cada worker acepta a lo sumo STREAM_MAX_CLIENTS streams; el
+resto recibe 503 y el navegador sigue con polling. Con gthread serving.py baja ese
+límite a la mitad de los hilos, para que los streams no dejen sin hilos a la
+ingesta ni a /health.
+"""
+import itertools
+import threading
+import json
+import queue
+import time
+import os
+
+from sqlalchemy import func
+
+# environment variables
+STREAM_POLL_INTERVAL = float(os.getenv('STREAM_POLL_INTERVAL', '1'))
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))
+STREAM_CLIENT_QUEUE = int(os.getenv('STREAM_CLIENT_QUEUE', '100'))
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', '500'))
+
+# Tipos de evento; un cliente puede pedir solo algunos (GET /api/stream?events=alerta)
+STREAM_EVENTS = ('lectura', 'alerta')
+
+
+class Subscription:
+    """One connected client: a bounded queue of pre-encoded SSE frames"""
+
+    def __init__(self, modulo, events=None, max_queue=STREAM_CLIENT_QUEUE):
+        self.modulo = modulo
+        self.events = frozenset(events or STREAM_EVENTS)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def wants(self, modulo, event):
+        return event in self.events and (self.modulo in (None, 'all') or self.modulo == modulo)
+
+    def put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            # Cliente lento: se descarta el evento más viejo
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            self.queue.put_nowait(frame)
+
+    def frames(self, heartbeat=STREAM_HEARTBEAT):
+        """Blocking generator of SSE frames, with a comment line as keepalive"""
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                frame = self.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if frame is None:
+                return  # stream cerrado (apagado del worker)
+            yield frame
+
+
+def encode_event(event, data, event_id=None):
+    frame = f'event: {event}\n'
+    if event_id is not None:
+        frame += f'id: {event_id}\n'
+    return frame + f'data: {json.dumps(data, default=str)}\n\n'
+
+
+class EventStream:
+    """Fan-out of new readings and alerts to SSE subscribers"""
+
+    def __init__(self, app, live_cache, lectura_payload, alerta_payload, alert_model,
+                 poll_interval=STREAM_POLL_INTERVAL, max_clients=STREAM_MAX_CLIENTS):
+        self.app = app
+        self.live_cache = live_cache
+        self.lectura_payload = lectura_payload
+        self.alerta_payload = alerta_payload
+        self.alert_model = alert_model
+        self.poll_interval = poll_interval
+        self.max_clients = max_clients
+
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_lectura = {}      # modulo -> id_lectura ya publicado
+        self._last_alert_version = None
+        self._event_ids = itertools.count(1)
+
+    # ------------------------------------------------------------------
+    # Suscripciones
+    # ------------------------------------------------------------------
+    def subscribe(self, modulo=None, events=None):
+        """New subscription, or None when this worker already holds max_clients streams
+
+        events: iterable of STREAM_EVENTS to receive (None = all of them).
+        """
+        subscription = Subscription(modulo, events)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_clients:
+                return None
+            self._subscriptions.add(subscription)
+        self._ensure_started()
+        # Estado inicial: la última lectura conocida del módulo
+        for modulo_actual, row in self.live_cache.snapshot().items():
+            if subscription.wants(modulo_actual, 'lectura'):
+                subscription.put(encode_event('lectura', self.lectura_payload(row)))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def close(self):
+        """End every open stream (graceful shutdown); clients reconnect by themselves"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(None)
+
+    def notify(self):
+        """Wake the watcher right away (called after a local ingest or alert)"""
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # Watcher
+    # ------------------------------------------------------------------
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='sse-watcher', daemon=True)
+                    self._thread.start()
+
+    def _publish(self, modulo, event, frame):
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.wants(modulo, event)]
+        for subscription in subscriptions:
+            subscription.put(frame)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if not self.client_count():
+                # Sin clientes no se consulta nada; al volver se parte del estado actual
+                self._last_alert_version = None
+                self._last_lectura = {}
+                continue
+            try:
+                with self.app.app_context():
+                    self._poll()
+            except Exception as e:
+                print(f"Error in SSE watcher: {e}")
+                time.sleep(self.poll_interval)
+
+    def _poll(self):
+        Alerta = self.alert_model
+        if self._last_alert_version is None:
+            # Primer ciclo con clientes: tomar el estado actual como punto de partida
+            self._last_lectura = {modulo: row['id_lectura'] for modulo, row in self.live_cache.snapshot().items()}
+            self._last_alert_version = Alerta.query.with_entities(func.max(Alerta.version)).scalar() or 0
+            return
+
+        for modulo, row in self.live_cache.snapshot().items():
+            if self._last_lectura.get(modulo) != row['id_lectura']:
+                self._last_lectura[modulo] = row['id_lectura']
+                self._publish(modulo, 'lectura', encode_event('lectura', self.lectura_payload(row), next(self._event_ids)))
+
+        # Por version y no por id: el id se asigna al INSERT y una alerta con id menor
+        # puede confirmarse después (otro worker, el suscriptor en modo db); la version
+        # sale del contador 'alertas', bloqueado hasta el commit, así que sigue el orden
+        # de commit. También llegan las alertas que cambiaron de estado (un cambio masivo
+        # de más de 500 alertas publica solo las primeras; a los clientes les basta un aviso).
+        cambiadas = Alerta.query.filter(Alerta.version > self._last_alert_version).order_by(
+            Alerta.version, Alerta.id
+        ).limit(500).all()
+        for alerta in cambiadas:
+            self._last_alert_version = alerta.version
+            self._publish(alerta.modulo, 'alerta', encode_event('alerta', self.alerta_payload(alerta), next(self._event_ids)))
@@ -0,0 +1,126 @@
+"""
+Supervisor de suscriptores MQTT: MQTT_WORKERS procesos en una suscripción compartida.
+
+Cada worker es un `python -m api_avicola.mqtt_subscriber` con su propio índice
+(MQTT_WORKER_INDEX), client id y spool (SPOOL_DIR/worker-<i>), todos en el grupo
+MQTT_SHARE_GROUP: el broker reparte entre ellos las lecturas JSON y cada módulo
+del esquema viejo queda fijo en un worker (ver subscriptions() en mqtt_subscriber).
+
+Si un worker termina se reinicia con el mismo índice, esperando entre intentos
+desde SUPERVISOR_RESTART_DELAY hasta SUPERVISOR_MAX_RESTART_DELAY segundos (el
+retardo vuelve al mínimo cuando el worker duró más de un minuto). Con SIGTERM o
+SIGINT se reenvía SIGTERM a los workers, que vacían su forwarder antes de salir.
+"""
+import subprocess
+import signal
+import sys
+import time
+import os
+
+from api_avicola.mqtt_subscriber import MQTT_SHARE_GROUP, MQTT_WORKERS, SPOOL_DIR
+
+# environment variables
+SUPERVISOR_RESTART_DELAY = float(os.getenv('SUPERVISOR_RESTART_DELAY', '1'))
+SUPERVISOR_MAX_RESTART_DELAY = float(os.getenv('SUPERVISOR_MAX_RESTART_DELAY', '30'))
+SUPERVISOR_STOP_TIMEOUT = float(os.getenv('SUPERVISOR_STOP_TIMEOUT', '20'))
+
+DEFAULT_SHARE_GROUP = 'avicola-ingest'
+# Un worker que duró más que esto se considera sano: el retardo de reinicio vuelve al mínimo
+HEALTHY_UPTIME = 60
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Worker:
+    """One subscriber process and its restart state"""
+
+    def __init__(self, index, restart_delay=SUPERVISOR_RESTART_DELAY):
+        self.index = index
+        self.process = None
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.delay = restart_delay
+        self.restarts = 0
+
+
+class Supervisor:
+    """Starts, restarts and stops the subscriber worker processes"""
+
+    def __init__(self, workers=MQTT_WORKERS, group=MQTT_SHARE_GROUP or DEFAULT_SHARE_GROUP,
+                 restart_delay=SUPERVISOR_RESTART_DELAY, max_restart_delay=SUPERVISOR_MAX_RESTART_DELAY,
+                 stop_timeout=SUPERVISOR_STOP_TIMEOUT):
+        self.group = group
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+        self.workers = [Worker(index, restart_delay) for index in range(workers)]
+        self._stopping = False
+
+    def _environment(self, index):
+        env = dict(os.environ,
+                   MQTT_SHARE_GROUP=self.group,
+                   MQTT_WORKERS=str(len(self.workers)),
+                   MQTT_WORKER_INDEX=str(index))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+        if SPOOL_DIR:
+            # Cada worker con su spool: los segmentos no se comparten entre procesos
+            env['SPOOL_DIR'] = os.path.join(SPOOL_DIR, f'worker-{index}')
+        return env
+
+    def _spawn(self, worker):
+        worker.process = subprocess.Popen([sys.executable, '-m', 'api_avicola.mqtt_subscriber'],
+                                          env=self._environment(worker.index))
+        worker.started_at = time.monotonic()
+        print(f"▶️ Worker MQTT {worker.index + 1}/{len(self.workers)} iniciado (pid {worker.process.pid})")
+
+    def _check(self, worker, now):
+        if worker.process is None:
+            if now >= worker.restart_at:
+                self._spawn(worker)
+            return
+        code = worker.process.poll()
+        if code is None:
+            return
+        # Terminó solo: reiniciar con retardo creciente
+        if now - worker.started_at > HEALTHY_UPTIME:
+            worker.delay = self.restart_delay
+        print(f"⚠️ Worker MQTT {worker.index + 1} terminó (código {code}); reinicio en {worker.delay:.0f}s")
+        worker.process = None
+        worker.restart_at = now + worker.delay
+        worker.delay = min(worker.delay * 2, self.max_restart_delay)
+        worker.restarts += 1
+
+    def stop(self, signum=None, frame=None):
+        self._stopping = True
+
+    def run(self):
+        """Supervise until SIGTERM/SIGINT, then stop the workers gracefully"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        print(f" MQTT SUPERVISOR: {len(self.workers)} workers en $share/{self.group}")
+        while not self._stopping:
+            now = time.monotonic()
+            for worker in self.workers:
+                self._check(worker, now)
+            time.sleep(0.5)
+        self._shutdown()
+
+    def _shutdown(self):
+        print("🛑 Deteniendo workers MQTT...")
+        running = [w.process for w in self.workers if w.process is not None and w.process.poll() is None]
+        for process in running:
+            process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + self.stop_timeout
+        for process in running:
+            try:
+                process.wait(timeout=max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        print(f"📈 Reinicios por worker: {[w.restarts for w in self.workers]}")
+
+
+def start():
+    Supervisor().run()
+
+
+if __name__ == "__main__":
+    start()
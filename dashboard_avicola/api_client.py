@@ -0,0 +1,100 @@
+"""
+Cliente del dashboard hacia la API principal.
+
+Todos los proxies comparten una requests.Session con pool de conexiones keep-alive
+(API_POOL_SIZE por host, 10 por defecto). Cuando la API corre en el mismo proceso
+(main.py llama a use_local_app), los requests se despachan directo a la app WSGI
+de la API, sin HTTP ni sockets.
+
+En ambos casos get() devuelve un Response de werkzeug con el status, los headers y
+el cuerpo de la API sin tocar (compresión incluida), que se lee en streaming: una
+vista puede devolverlo tal cual sin parsear ni volver a serializar el JSON.
+"""
+import contextvars
+import json
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from werkzeug.wrappers import Response
+
+API_STREAM_CHUNK = 64 * 1024
+# Headers de la respuesta de la API que se reenvían (los hop-by-hop no)
+PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Encoding', 'Vary',
+                       'ETag', 'Cache-Control', 'Last-Modified')
+
+
+def _relay(upstream):
+    """Raw upstream body (still compressed) in chunks; frees the connection at the end"""
+    try:
+        yield from upstream.raw.stream(API_STREAM_CHUNK, decode_content=False)
+    finally:
+        # Leído completo, la conexión ya volvió al pool; si no, se cierra
+        upstream.close()
+
+
+def _isolated(context, app_iter):
+    """Iterate a local app's body inside its own contextvars context
+
+    The API's streamed responses keep their Flask contexts pushed between chunks;
+    running every step in a separate context keeps them off the dashboard's stack.
+    """
+    iterator = iter(app_iter)
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        if hasattr(app_iter, 'close'):
+            context.run(app_iter.close)
+
+
+class ApiClient:
+    """GET requests to the API over a pooled session, or in-process when attached"""
+
+    def __init__(self, base_url=None, pool_size=None):
+        # Se leen al crear el cliente (después de load_dotenv en dashboard.py)
+        base_url = base_url or os.getenv('API_BASE_URL', 'http://localhost:5000')
+        pool_size = pool_size or int(os.getenv('API_POOL_SIZE', '10'))
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.local_app = None
+
+    def use_local_app(self, app):
+        """Dispatch to this WSGI app (the API's Flask app) instead of HTTP"""
+        self.local_app = app
+
+    def get(self, path, params=None, headers=None, timeout=10):
+        """Streaming werkzeug Response for GET path on the API (body untouched)
+
+        Without an explicit Accept-Encoding the body comes uncompressed.
+        """
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'identity')
+        if self.local_app is not None:
+            environ = EnvironBuilder(path=path, query_string=params, headers=headers).get_environ()
+            context = contextvars.Context()
+            app_iter, status, response_headers = context.run(run_wsgi_app, self.local_app, environ)
+            return Response(_isolated(context, app_iter), status=status, headers=response_headers)
+
+        upstream = self.session.get(f'{self.base_url}{path}', params=params, headers=headers,
+                                    timeout=timeout, stream=True)
+        passthrough = [(name, upstream.headers[name]) for name in PASSTHROUGH_HEADERS if name in upstream.headers]
+        return Response(_relay(upstream), status=upstream.status_code, headers=passthrough)
+
+    def get_json(self, path, params=None, headers=None, timeout=10):
+        """(status code, parsed JSON or None, response headers)"""
+        response = self.get(path, params, headers, timeout)
+        try:
+            body = response.get_data()
+        finally:
+            response.close()
+        data = json.loads(body) if body and response.mimetype == 'application/json' else None
+        return response.status_code, data, response.headers
@@ -5,7 +5,6 @@ from flask_cors import CORS, cross_origin
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 import os
-import requests
 import json
 from datetime import datetime
 
@@ -14,6 +13,9 @@ from datetime import datetime
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+from dashboard_avicola.api_client import ApiClient
+from dashboard_avicola.user_cache import UserCache
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -26,7 +28,7 @@ limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["1000 per day", "200 per hour"],
-    storage_uri="memory://"
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
 )
 
 @app.after_request
@@ -40,6 +42,9 @@ def add_security_headers(response):
 db = SQLAlchemy(app)
 CORS(app)
 
+# Pooled keep-alive session to the API (in-process when main.py attaches the API app)
+api_client = ApiClient()
+
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
@@ -73,26 +78,24 @@ except Exception as e:
     print(f"Base de datos no inicializada aún: {e}")
     pass  # La API creará las tablas al iniciar
 
+# Usuarios ya cargados y flag "hay usuarios" (ver dashboard_avicola/user_cache.py)
+user_cache = UserCache(db, User)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 def get_live_data():
     """Obtiene datos en tiempo real desde la API del dashboard"""
     try:
-        # Usar API_BASE_URL para endpoints del dashboard
-        api_url = os.getenv('API_BASE_URL', 'http://localhost:5000')
-        
         # Agregar timestamp para evitar cacheo
         import time
         timestamp = int(time.time())
-        url = f'{api_url}/api/live-data?t={timestamp}'
         
-        response = requests.get(url, timeout=5)
-        print(f"🔍 Estado API Dashboard: {response.status_code} - URL: {url}")
+        status, data, _ = api_client.get_json('/api/live-data', params={'t': timestamp}, timeout=5)
+        print(f"🔍 Estado API Dashboard: {status} - URL: /api/live-data?t={timestamp}")
         
-        if response.status_code == 200:
-            data = response.json()
+        if status == 200:
             print(f"📊 Datos recibidos del API: {data}")
             
             # Verifica que sea un objeto válido
@@ -104,41 +107,40 @@ def get_live_data():
                 print("⚠️ Datos inválidos recibidos - campos faltantes")
                 return None
         else:
-            print(f"❌ Error HTTP: {response.status_code}")
+            print(f"❌ Error HTTP: {status}")
             return None
             
     except Exception as e:
         print(f"❌ Error obteniendo datos del API: {e}")
         return None
 
-def get_historical_data_from_api(range_param, from_date=None, to_date=None, house_param=None):
-    """Obtiene datos históricos desde la API principal"""
-    try:
-        api_url = os.getenv('API_BASE_URL', 'http://localhost:5000')
-        url = f'{api_url}/api/historical?range={range_param}'
-        if from_date and to_date:
-            url += f'&from={from_date}&to={to_date}'
-        if house_param:
-            url += f'&house={house_param}'
-        
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"❌ Error HTTP obteniendo histórico: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ Error obteniendo datos históricos: {e}")
-        return None
+def get_historical_data_from_api(range_param, from_date=None, to_date=None, house_param=None, extra_params=None, headers=None):
+    """Respuesta de /api/historical de la API principal, en streaming y sin re-serializar"""
+    params = {'range': range_param}
+    if from_date and to_date:
+        params.update({'from': from_date, 'to': to_date})
+    if house_param:
+        params['house'] = house_param
+    params.update(extra_params or {})
+    return api_client.get('/api/historical', params=params, headers=headers)
+
+# Última respuesta de /api/umbrales; se revalida con If-None-Match (304 si no cambió)
+_umbrales_cache = {'etag': None, 'data': []}
 
 def get_umbrales_from_api():
     """Obtiene umbrales desde la API principal"""
     try:
-        api_url = os.getenv('API_BASE_URL', 'http://localhost:5000')
-        url = f'{api_url}/api/umbrales'
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            return response.json()
+        headers = {}
+        if _umbrales_cache['etag']:
+            headers['If-None-Match'] = f'"{_umbrales_cache["etag"]}"'
+        status, data, response_headers = api_client.get_json('/api/umbrales', headers=headers, timeout=5)
+        if status == 304:
+            return _umbrales_cache['data']
+        if status == 200:
+            etag = response_headers.get('ETag')
+            _umbrales_cache['etag'] = etag.strip('"') if etag else None
+            _umbrales_cache['data'] = data
+            return data
         return []
     except Exception as e:
         print(f"❌ Error obteniendo umbrales: {e}")
@@ -200,7 +202,9 @@ def register():
             new_user.set_password(password)
             
             db.session.add(new_user)
+            user_cache.bump()
             db.session.commit()
+            user_cache.invalidate()
             
             flash('Usuario registrado exitosamente. Ahora puede iniciar sesión.')
             return redirect('/login')
@@ -213,8 +217,7 @@ def register():
     
     # Verificar si ya hay usuarios
     try:
-        user_count = User.query.count()
-        if user_count > 0:
+        if user_cache.users_exist():
             flash('Ya existen usuarios registrados. Use el formulario de login.')
             return redirect('/login')
     except:
@@ -236,8 +239,7 @@ def logout():
 def dashboard():
     # Verificar si hay usuarios registrados
     try:
-        user_count = User.query.count()
-        if user_count == 0:
+        if not user_cache.users_exist():
             flash('No hay usuarios registrados. Contacte al administrador.')
             return redirect('/login')
     except:
@@ -264,6 +266,8 @@ def dashboard():
     return render_template('dashboard.html', user_data=user_data)
 
 
+HISTORICAL_PASSTHROUGH_PARAMS = ('resolution', 'points', 'max_points', 'downsample', 'format', 'limit', 'cursor')
+
 @app.route('/api/historical')
 def api_historical():
     """Endpoint proxy para datos históricos - funciona desde cualquier dispositivo"""
@@ -272,22 +276,13 @@ def api_historical():
         from_date = request.args.get('from', None)
         to_date = request.args.get('to', None)
         house_param = request.args.get('house', None)
+        # Resolución y reducción de puntos se pasan tal cual a la API
+        extra_params = {key: request.args[key] for key in HISTORICAL_PASSTHROUGH_PARAMS if key in request.args}
         
-        data = get_historical_data_from_api(range_param, from_date, to_date, house_param)
+        # Formato y compresión los negocia la API con los headers del navegador
+        headers = {key: request.headers[key] for key in ('Accept', 'Accept-Encoding') if key in request.headers}
         
-        if data:
-            return jsonify(data)
-        else:
-            return jsonify({
-                "timestamps": [],
-                "house": [],
-                "temperature": [],
-                "humidity": [],
-                "ammonia": [],
-                "co": [],
-                "co2": [],
-                "error": "No hay datos disponibles"
-            })
+        return get_historical_data_from_api(range_param, from_date, to_date, house_param, extra_params, headers)
             
     except Exception as e:
         print(f"Error api_historical: {e}")
@@ -300,14 +295,22 @@ def api_historical():
             "co": [],
             "co2": [],
             "error": str(e)
-        }), 500
+        }), 502
 
 @app.route('/api/umbrales')
 def api_umbrales():
     """Endpoint proxy para umbrales"""
     try:
         data = get_umbrales_from_api()
-        return jsonify(data)
+        etag = _umbrales_cache['etag']
+        if etag and request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(data)
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -394,8 +397,25 @@ def reports():
     }
     return render_template('reports.html', active='reports', user_data=user_data)
 
+@app.route('/health')
+@limiter.exempt
+def health():
+    """Health check for docker-compose: the worker answers and the database is reachable"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        return jsonify({'status': 'ok'})
+    except Exception as e:
+        print(f"❌ Health check: {e}")
+        return jsonify({'status': 'error', 'error': str(e)}), 503
+
+def after_fork():
+    """Drop the database connections inherited from the gunicorn master"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
 # En dashboard_avicola.py, modifica la función start:
 def start(port=5001, host='0.0.0.0'):
+    """Development server (production: run_dashboard.py, see serving.py)"""
     if not os.path.exists('templates'):
         os.makedirs('templates')
     app.run(debug=True, port=port, host=host, use_reloader=False)
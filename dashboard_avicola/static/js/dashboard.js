@@ -2,6 +2,9 @@
 let temperatureChart, humidityChart, ammoniaChart, coChart, co2Chart;
 let lastRealUpdate = null;
 
+// Máximo de puntos por serie pedidos a /api/historical (el servidor reduce con LTTB)
+const HISTORICAL_MAX_POINTS = 2000;
+
 // =========================================================
 // CONFIGURACIÓN DE CALIBRACIÓN - QUERÉTARO)
 // =========================================================
@@ -522,9 +525,10 @@ function clearAllCharts() {
 function updateChart(chart, labels, data) {
   if (!chart || !labels || !data || labels.length === 0) return;
 
-  const dataPoints = labels.map((ts, index) => ({
+  // labels/data pueden ser arrays JSON o typed arrays del formato columnar (NaN = null)
+  const dataPoints = Array.from(labels, (ts, index) => ({
     x: parseTimestamp(ts),
-    y: data[index] !== null ? data[index] : null
+    y: data[index] !== null && !Number.isNaN(data[index]) ? data[index] : null
   })).filter(point => point.y !== null);
 
   if (dataPoints.length === 0) return;
@@ -569,8 +573,9 @@ function setupRangeSelector() {
   // Add module selector event listener
   if (moduleSelect) {
     moduleSelect.addEventListener('change', () => {
-      // Update live data immediately
+      // Update live data immediately and resubscribe the stream to the new module
       updateLiveData();
+      startLiveStream();
       
       // Update historical data
       const range = rangeSelect.value;
@@ -594,8 +599,82 @@ function getBaseUrl() {
     : window.location.origin;
 }
 
+// Formato binario columnar de /api/historical (ver api_avicola/encoding.py)
+const COLUMNAR_TYPE = 'application/vnd.avicola.columnar';
+
+async function readHistoricalResponse(res) {
+  const contentType = res.headers.get('Content-Type') || '';
+  if (contentType.startsWith(COLUMNAR_TYPE)) {
+    return decodeColumnar(await res.arrayBuffer());
+  }
+  return res.json();
+}
+
+function decodeColumnar(buffer) {
+  const view = new DataView(buffer);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== 'AVC1') throw new Error('Formato columnar desconocido');
+
+  const headerLength = view.getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+  const base = Math.ceil((8 + headerLength) / 8) * 8;
+  const rows = header.rows;
+  const data = Object.assign({}, header.meta);
+
+  for (const column of header.columns) {
+    const offset = base + column.offset;
+    let values;
+    switch (column.type) {
+      case 'delta_int32': {
+        // Epoch ms acumulando diferencias; las horas son de pared, como las cadenas ISO del JSON
+        const deltas = new Int32Array(buffer, offset, rows);
+        values = new Float64Array(rows);
+        let t = header.t0;
+        for (let i = 0; i < rows; i++) {
+          t += deltas[i];
+          values[i] = t;
+        }
+        break;
+      }
+      case 'float64':
+        values = new Float64Array(buffer, offset, rows).slice();
+        break;
+      case 'dict_uint8':
+        values = Array.from(new Uint8Array(buffer, offset, rows), code => header.houses[code]);
+        break;
+      case 'dict_uint16':
+        values = Array.from(new Uint16Array(buffer, offset, rows), code => header.houses[code]);
+        break;
+      case 'float32':
+        values = new Float32Array(buffer, offset, rows);
+        break;
+      case 'uint32':
+        values = new Uint32Array(buffer, offset, rows);
+        break;
+      default:
+        throw new Error(`Tipo de columna desconocido: ${column.type}`);
+    }
+
+    if (column.name === 'timestamps') {
+      // Epoch "de pared" -> hora local equivalente a new Date('YYYY-MM-DDTHH:MM:SS')
+      for (let i = 0; i < values.length; i++) {
+        values[i] += new Date(values[i]).getTimezoneOffset() * 60000;
+      }
+    }
+
+    const [group, name] = column.name.split('.');
+    if (name) {
+      data[group] = data[group] || {};
+      data[group][name] = values;
+    } else {
+      data[group] = values;
+    }
+  }
+  return data;
+}
+
 async function fetchHistoricalData(range, from = null, to = null) {
-  let url = `${getBaseUrl()}/api/historical?range=${range}`;
+  let url = `${getBaseUrl()}/api/historical?range=${range}&max_points=${HISTORICAL_MAX_POINTS}`;
   if (from && to) url += `&from=${from}&to=${to}`;
 
   // Add module parameter
@@ -609,9 +688,9 @@ async function fetchHistoricalData(range, from = null, to = null) {
   console.log(`Final URL: ${url}`);
   
   try {
-    const res = await fetch(url);
+    const res = await fetch(url, { headers: { 'Accept': `${COLUMNAR_TYPE}, application/json;q=0.9` } });
     if (!res.ok) throw new Error(`HTTP ${res.status}`);
-    const data = await res.json();
+    const data = await readHistoricalResponse(res);
     console.log(`Data received:`, data);
     return data;
   } catch (err) {
@@ -698,13 +777,13 @@ async function fetchAllModulesData(range, from = null, to = null) {
   const allData = {};
   
   for (const module of modules) {
-    let url = `${getBaseUrl()}/api/historical?range=${range}&house=${module}`;
+    let url = `${getBaseUrl()}/api/historical?range=${range}&house=${module}&max_points=${HISTORICAL_MAX_POINTS}`;
     if (from && to) url += `&from=${from}&to=${to}`;
     
     try {
-      const res = await fetch(url);
+      const res = await fetch(url, { headers: { 'Accept': `${COLUMNAR_TYPE}, application/json;q=0.9` } });
       if (res.ok) {
-        const data = await res.json();
+        const data = await readHistoricalResponse(res);
         if (data && data.timestamps && data.timestamps.length > 0) {
           allData[module] = data;
         }
@@ -744,30 +823,69 @@ async function updateLiveData() {
     if (!res.ok) throw new Error(`HTTP ${res.status}`);
 
     const data = await res.json();
-    updateMetricCards(data);
+    renderLiveData(data);
+  } catch (err) {
+    console.error('Error actualizando live data:', err);
+  }
+}
 
-    if (data && data.timestamp) {
-      const lastTs = parseTimestamp(data.timestamp);
-      lastRealUpdate = lastTs;
+function renderLiveData(data) {
+  updateMetricCards(data);
 
-      const dateStr = lastTs.toLocaleDateString('es-MX', {
-        year: 'numeric', month: '2-digit', day: '2-digit'
-      });
-      const timeStr = lastTs.toLocaleTimeString('es-MX', {
-        hour: '2-digit', minute: '2-digit', second: '2-digit'
-      });
+  if (data && data.timestamp) {
+    const lastTs = parseTimestamp(data.timestamp);
+    lastRealUpdate = lastTs;
 
-      document.getElementById('lastUpdate').textContent = `${dateStr} ${timeStr}`;
+    const dateStr = lastTs.toLocaleDateString('es-MX', {
+      year: 'numeric', month: '2-digit', day: '2-digit'
+    });
+    const timeStr = lastTs.toLocaleTimeString('es-MX', {
+      hour: '2-digit', minute: '2-digit', second: '2-digit'
+    });
 
-      const timeAgoEl = document.getElementById('lastUpdateTime');
-      const diff = (Date.now() - lastTs.getTime()) / 1000;
-      timeAgoEl.textContent = diff > 5 ? `(${formatTimeAgo(lastTs)})` : '';
-    }
-  } catch (err) {
-    console.error('Error actualizando live data:', err);
+    document.getElementById('lastUpdate').textContent = `${dateStr} ${timeStr}`;
+
+    const timeAgoEl = document.getElementById('lastUpdateTime');
+    const diff = (Date.now() - lastTs.getTime()) / 1000;
+    timeAgoEl.textContent = diff > 5 ? `(${formatTimeAgo(lastTs)})` : '';
   }
 }
 
+// =========================================================
+// STREAM EN TIEMPO REAL (SSE) CON RESPALDO POR POLLING
+// =========================================================
+
+let liveStream = null;
+let liveStreamOpen = false;
+
+function startLiveStream() {
+  if (!window.EventSource) return;  // Navegador sin SSE: queda el polling
+
+  if (liveStream) liveStream.close();
+  liveStreamOpen = false;
+
+  const moduleSelect = document.getElementById('moduleSelect');
+  const module = moduleSelect ? moduleSelect.value : 'M1';
+  liveStream = new EventSource(`${getBaseUrl()}/api/stream?modulo=${module}`);
+
+  liveStream.onopen = () => { liveStreamOpen = true; };
+  liveStream.onerror = () => {
+    // EventSource reintenta solo; mientras tanto vuelve el polling
+    liveStreamOpen = false;
+    // Un 503 (límite de streams del worker) lo cierra del todo: reintentar más tarde
+    if (liveStream.readyState === EventSource.CLOSED) {
+      setTimeout(startLiveStream, 30000);
+    }
+  };
+  liveStream.addEventListener('lectura', (event) => {
+    try {
+      renderLiveData(JSON.parse(event.data));
+    } catch (err) {
+      console.error('Error procesando evento de lectura:', err);
+    }
+  });
+}
+
 // =========================================================
 // MONITOREO DE CONEXIÓN
 // =========================================================
@@ -818,9 +936,12 @@ function createHistoricalStatus() {
 
 document.addEventListener('DOMContentLoaded', initializeDashboard);
 
-// Live data cada 1 segundo
+// Live data por SSE; el polling cada 5 s solo corre si el stream no está conectado
 // La actualización coincide con el firmware (5s) para ahorrar recursos
-setInterval(updateLiveData, 5000); // 5000ms = 5 segundos
+document.addEventListener('DOMContentLoaded', startLiveStream);
+setInterval(() => {
+  if (!liveStreamOpen) updateLiveData();
+}, 5000); // 5000ms = 5 segundos
 
 // Histórico cada 10 segundos
 setInterval(() => {
@@ -0,0 +1,134 @@
+"""
+Caché de usuarios para la sesión del dashboard (Flask-Login).
+
+UserCache guarda los usuarios ya cargados por load_user (LRU de USER_CACHE_SIZE
+entradas, cada una válida USER_CACHE_TTL segundos) y un flag "hay usuarios" para
+/dashboard y /register, así cargar una página no cuesta consultas extra.
+
+Los cambios de usuarios (registro en el dashboard, /api/register y PUT
+/api/user/<id> en la API) incrementan el contador 'users' de cache_versions. Cada
+proceso lo consulta como mucho cada USER_CACHE_CHECK_INTERVAL segundos y vacía su
+caché si cambió; el proceso que hizo el cambio lo vacía en el acto. Si la tabla
+cache_versions todavía no existe (BD sin migrar por la API) la versión es
+desconocida y el caché se saltea: cada llamada va a la BD.
+"""
+from collections import OrderedDict
+import threading
+import time
+import os
+
+from sqlalchemy import column, select, table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+# environment variables
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '256'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+USER_CACHE_CHECK_INTERVAL = float(os.getenv('USER_CACHE_CHECK_INTERVAL', '5'))
+
+USERS_VERSION_NAME = 'users'
+
+# Tabla de contadores de la API (api_avicola.models.CacheVersion), sin registrar un modelo
+cache_versions = table('cache_versions', column('name'), column('version'))
+
+
+class UserCache:
+    """TTL/LRU cache of detached User objects plus a cached "users exist" flag"""
+
+    VERSION_NAME = USERS_VERSION_NAME
+
+    def __init__(self, db, user_model, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL,
+                 check_interval=USER_CACHE_CHECK_INTERVAL):
+        self.db = db
+        self.user_model = user_model
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._users = OrderedDict()   # id -> (user, loaded_at)
+        self._exists = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _read_version(self):
+        """Current 'users' version, or None while cache_versions does not exist"""
+        try:
+            version = self.db.session.scalar(
+                select(cache_versions.c.version).where(cache_versions.c.name == self.VERSION_NAME)
+            )
+        except (OperationalError, ProgrammingError):
+            # Tabla faltante (SQLite: OperationalError, PostgreSQL: ProgrammingError);
+            # en PostgreSQL la transacción queda abortada hasta el rollback
+            self.db.session.rollback()
+            return None
+        return version or 0
+
+    def _refresh(self):
+        """Drop everything if another process bumped the version (checked at most every check_interval)
+
+        Return False when the version is unknown: the caller must not use the cache.
+        """
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return True
+        version = self._read_version()
+        with self._lock:
+            if version != self._version:
+                self._users.clear()
+                self._exists = None
+                self._version = version
+            self._checked_at = now
+        return version is not None
+
+    def get(self, user_id):
+        """User by id (None if it does not exist), from the cache when still fresh"""
+        if not self._refresh():
+            return self.db.session.get(self.user_model, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._users.move_to_end(user_id)
+                return entry[0]
+
+        user = self.db.session.get(self.user_model, user_id)
+        if user is None:
+            return None
+        # Separado de la sesión: sus atributos quedan cargados entre requests
+        self.db.session.expunge(user)
+        with self._lock:
+            self._users[user_id] = (user, now)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        return user
+
+    def users_exist(self):
+        """Whether at least one user is registered"""
+        if not self._refresh():
+            return self.db.session.query(self.user_model.query.exists()).scalar()
+        if self._exists is None:
+            self._exists = self.db.session.query(self.user_model.query.exists()).scalar()
+        return self._exists
+
+    def bump(self):
+        """Increment the 'users' version in the current transaction (caller commits)"""
+        # Un solo upsert, como bump_version en la API: sin carrera al crear la fila
+        dialect_name = self.db.session.get_bind().dialect.name
+        dialect_insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(cache_versions).values(name=self.VERSION_NAME, version=1)
+        try:
+            # Savepoint: sin cache_versions no hay cachés que avisar, y el registro sigue
+            with self.db.session.begin_nested():
+                self.db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=['name'], set_={'version': cache_versions.c.version + 1}
+                ))
+        except (OperationalError, ProgrammingError) as e:
+            print(f"Users cache version not bumped (cache_versions missing?): {e}")
+
+    def invalidate(self):
+        """Drop every cached user now; other processes follow the version"""
+        with self._lock:
+            self._users.clear()
+            self._exists = None
+            self._version = None
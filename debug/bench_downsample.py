@@ -0,0 +1,67 @@
+"""
+Benchmark de reducción de puntos (api_avicola/downsample.py).
+
+Genera una serie sintética con ruido y un pico aislado, la reduce con LTTB y
+minmax, y verifica que el pico sobreviva. También mide downsample() completo
+sobre un resultado columnar de 5 variables y varias casas.
+
+    python debug/bench_downsample.py --points 1000000 --max-points 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from api_avicola import downsample
+
+SERIES = ['temperature', 'humidity', 'ammonia', 'co', 'co2']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de LTTB / minmax")
+    parser.add_argument("--points", type=int, default=1000000, help="Puntos de entrada")
+    parser.add_argument("--max-points", type=int, default=2000, help="Puntos de salida")
+    parser.add_argument("--modules", type=int, default=5, help="Casas en el resultado columnar")
+    return parser.parse_args()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(42)
+    n = args.points
+    x = np.arange(n, dtype=np.float64) * 5
+    y = 28 + 3 * np.sin(x / 5000) + rng.normal(0, 0.2, n)
+    spike = n // 3
+    y[spike] = 45.0  # alarma aislada: no debe desaparecer
+
+    print(f"Serie de {n:,} puntos -> {args.max_points:,}")
+    for name in downsample.METHODS:
+        idx, elapsed_ms = timed(downsample.select_indices, x, y, args.max_points, name)
+        print(f"  {name:7s} {elapsed_ms:8.1f} ms  {len(idx):,} puntos  pico conservado: {spike in idx}")
+
+    # Columnas como arrays, igual que las arma query_historical antes de reducir
+    groups = np.arange(n) % args.modules
+    data = {
+        'timestamps': np.arange(n),
+        'house': np.array([f'M{i % args.modules + 1}' for i in range(n)], dtype=object),
+    }
+    for key in SERIES:
+        data[key] = y.copy()
+    _, elapsed_ms = timed(downsample.downsample, data, args.max_points, SERIES, x, groups)
+    print(f"Resultado columnar ({len(SERIES)} variables, {args.modules} casas): {elapsed_ms:.1f} ms, "
+          f"{data['downsampled']['from']:,} -> {data['downsampled']['to']:,} filas, "
+          f"pico conservado: {45.0 in data['temperature']}")
+
+
+if __name__ == '__main__':
+    main()
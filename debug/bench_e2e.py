@@ -0,0 +1,345 @@
+"""
+Benchmark de punta a punta de la ingesta: MQTT -> suscriptor -> API -> BD.
+
+Todo corre en un proceso y contra una BD temporal (SQLite, o --database-url):
+
+- la API real (api_avicola.api) servida por werkzeug en un puerto libre;
+- el suscriptor real (on_message, reassembler, forwarder) en modo http o db;
+- en lugar del broker, LocalBroker: una cola y un hilo de entrega que llama a
+  on_message como lo haría el hilo de red de paho (sin Mosquitto).
+
+N módulos virtuales publican JSON del firmware a --rate lecturas/s cada uno
+durante --duration segundos (los módulos virtuales de debug/simulation.py).
+Al final informa lecturas/s sostenidas, latencia publicación -> commit
+(p50/p95/p99; el sink vuelve después del commit de la API), costo de la
+evaluación de alertas y crecimiento de la BD.
+
+    python debug/bench_e2e.py --modules 200 --rate 1 --duration 30 --output results.json
+    python debug/bench_e2e.py --modules 200 --baseline results.json   # exit 1 si empeora
+
+Los resultados (JSON) incluyen el commit de git para comparar entre versiones.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from simulation import VirtualModule
+
+# Métricas comparadas con --baseline: (clave, más alto es mejor)
+REGRESSION_METRICS = (
+    ('readings_per_s', True),
+    ('latency_ms.p95', False),
+    ('alerts.ms_per_call', False),
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de punta a punta de la ingesta")
+    parser.add_argument("--modules", type=int, default=100, help="Módulos virtuales")
+    parser.add_argument("--rate", type=float, default=1.0, help="Lecturas por segundo por módulo")
+    parser.add_argument("--duration", type=float, default=20, help="Segundos de carga")
+    parser.add_argument("--mode", choices=('http', 'db'), default='http', help="SUBSCRIBER_MODE del suscriptor")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de los valores simulados")
+    parser.add_argument("--database-url", default=None, help="BD a usar (por defecto SQLite temporal)")
+    parser.add_argument("--output", default=None, help="Guardar resultados en este archivo JSON")
+    parser.add_argument("--baseline", default=None, help="Resultados anteriores (JSON) para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Empeoramiento relativo tolerado frente a --baseline")
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class LocalBroker:
+    """Broker stand-in: published messages are delivered in order by one thread"""
+
+    def __init__(self, on_message):
+        self.on_message = on_message
+        self.queue = queue.Queue()
+        self.current = threading.local()
+        self.delivered = 0
+        self._thread = threading.Thread(target=self._run, name='local-broker', daemon=True)
+        self._thread.start()
+
+    def publish(self, topic, payload):
+        self.queue.put((topic, payload.encode(), time.perf_counter()))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            topic, payload, published_at = item
+            # El suscriptor lee la hora de publicación al encolar la lectura (TimedSink)
+            self.current.published_at = published_at
+            self.on_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+            self.delivered += 1
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+
+class TimedSink:
+    """Wraps the subscriber's sink and records publish -> commit latency per reading"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.published = {}
+        self.latencies = []
+        self.committed = 0
+        self.last_commit = None
+        self._lock = threading.Lock()
+
+    def track(self, lectura, published_at):
+        with self._lock:
+            self.published[lectura['id_lectura']] = published_at
+
+    def send(self, batch):
+        rejected = self.sink.send(batch)
+        now = time.perf_counter()
+        with self._lock:
+            for lectura in batch:
+                published_at = self.published.pop(lectura['id_lectura'], None)
+                if published_at is not None:
+                    self.latencies.append(now - published_at)
+            self.committed += len(batch) - (rejected or 0)
+            self.last_commit = now
+        return rejected
+
+    def close(self):
+        close = getattr(self.sink, 'close', None)
+        if close:
+            close()
+
+
+class AlertTimer:
+    """Wraps AlertEngine.evaluate to measure the alert evaluation cost"""
+
+    def __init__(self, engine):
+        self.evaluate = engine.evaluate
+        self.calls = 0
+        self.readings = 0
+        self.seconds = 0.0
+        self.created = 0
+        engine.evaluate = self
+
+    def __call__(self, lecturas):
+        lecturas = list(lecturas)
+        start = time.perf_counter()
+        try:
+            nuevas = self.evaluate(lecturas)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.calls += 1
+            self.readings += len(lecturas)
+        self.created += len(nuevas or [])
+        return nuevas
+
+
+def database_stats(db):
+    """Row counts and on-disk size of the scratch database"""
+    from sqlalchemy import text
+    counts = {}
+    for table in ('lecturas', 'lecturas_1m', 'lecturas_15m', 'lecturas_1h', 'alertas'):
+        counts[table] = db.session.execute(text(f'SELECT COUNT(*) FROM {table}')).scalar()
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        size = db.session.execute(text('SELECT pg_database_size(current_database())')).scalar()
+    else:
+        path = engine.url.database
+        size = sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+    return counts, size, engine.dialect.name
+
+
+def start_api(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='api', daemon=True).start()
+    return server
+
+
+def drive(broker, modules, rate, duration):
+    """Publish every module once per 1/rate seconds; return (published, seconds behind schedule)"""
+    period = 1.0 / rate
+    start = time.perf_counter()
+    published = 0
+    lag = 0.0
+    tick = 0
+    while tick * period < duration:
+        deadline = start + tick * period
+        now = time.perf_counter()
+        if now < deadline:
+            time.sleep(deadline - now)
+        else:
+            lag = max(lag, now - deadline)
+        for module in modules:
+            for topic, payload in module.tick():
+                broker.publish(topic, payload)
+                published += 1
+        tick += 1
+    return published, lag
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(results, dotted):
+    for key in dotted.split('.'):
+        results = results.get(key) if isinstance(results, dict) else None
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a previous run: list of messages"""
+    regressions = []
+    for key, higher_is_better in REGRESSION_METRICS:
+        current, previous = lookup(results, key), lookup(baseline, key)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        print(f"  {key:<22} {previous:>12,.2f} -> {current:>12,.2f} ({change:+.1%})")
+        if worse > tolerance:
+            regressions.append(f"{key} empeoró {worse:.1%} (tolerancia {tolerance:.0%})")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix='bench_e2e_')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    os.environ['SUBSCRIBER_MODE'] = args.mode
+    os.environ['SPOOL_DIR'] = ''
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api_avicola import api
+        from api_avicola.models import db
+        server = start_api(api.app)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        # El suscriptor lee sus URLs del entorno al importarse
+        os.environ['API_URL'] = f'{base_url}/lecturas'
+        from api_avicola import mqtt_subscriber
+
+        api.app.test_client().post('/api/umbrales/init')
+        with api.app.app_context():
+            rows_before, size_before, dialect = database_stats(db)
+
+        target = mqtt_subscriber.create_sink()
+        # En modo db las alertas se evalúan en el suscriptor (DirectAlertEvaluator)
+        alert_timer = AlertTimer(target.after_write.alert_engine if args.mode == 'db' else api.alert_engine)
+        sink = TimedSink(target)
+        mqtt_subscriber.setup(sink)
+        broker = LocalBroker(mqtt_subscriber.on_message)
+        # La hora de publicación viaja con la lectura hasta el sink
+        submit = mqtt_subscriber.forwarder.submit
+        mqtt_subscriber.forwarder.submit = lambda lectura: (
+            sink.track(lectura, getattr(broker.current, 'published_at', time.perf_counter())), submit(lectura)
+        )[1]
+
+    modules = [VirtualModule(number, args.seed) for number in range(1, args.modules + 1)]
+    print(f"Carga: {args.modules} módulos x {args.rate} lecturas/s durante {args.duration}s "
+          f"(modo {args.mode}, {os.environ['DATABASE_URL']})")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        published, lag = drive(broker, modules, args.rate, args.duration)
+        # Esperar a que se entregue todo (o a que deje de avanzar)
+        last_progress, last_committed = time.perf_counter(), -1
+        while sink.committed < published and time.perf_counter() - last_progress < 10:
+            if sink.committed != last_committed:
+                last_progress, last_committed = time.perf_counter(), sink.committed
+            time.sleep(0.1)
+        broker.close()
+        mqtt_subscriber.stop()
+        forwarder_stats = mqtt_subscriber.forwarder.stats()
+        with api.app.app_context():
+            rows_after, size_after, _ = database_stats(db)
+        server.shutdown()
+
+    elapsed = (sink.last_commit or time.perf_counter()) - start
+    latencies_ms = [latency * 1000 for latency in sink.latencies]
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'params': {
+            'modules': args.modules, 'rate': args.rate, 'duration': args.duration, 'mode': args.mode,
+            'seed': args.seed, 'database': dialect,
+            'batch_size': mqtt_subscriber.forwarder.batch_size,
+            'flush_interval': mqtt_subscriber.forwarder.flush_interval,
+        },
+        'offered_per_s': round(args.modules * args.rate, 2),
+        'published': published,
+        'committed': sink.committed,
+        'dropped': forwarder_stats['dropped'],
+        'publisher_max_lag_s': round(lag, 3),
+        'readings_per_s': round(sink.committed / elapsed, 2) if elapsed > 0 else None,
+        'latency_ms': {name: round(percentile(latencies_ms, fraction), 2) if latencies_ms else None
+                       for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+        'alerts': {
+            'calls': alert_timer.calls,
+            'readings': alert_timer.readings,
+            'created': alert_timer.created,
+            'seconds': round(alert_timer.seconds, 3),
+            'ms_per_call': round(alert_timer.seconds * 1000 / alert_timer.calls, 3) if alert_timer.calls else None,
+            'us_per_reading': round(alert_timer.seconds * 1e6 / alert_timer.readings, 2) if alert_timer.readings else None,
+        },
+        'db_growth': {
+            'rows': {table: rows_after[table] - rows_before[table] for table in rows_after},
+            'bytes': size_after - size_before,
+            'bytes_per_reading': round((size_after - size_before) / sink.committed, 1) if sink.committed else None,
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparación con {args.baseline} (commit {baseline.get('commit')}):")
+        if baseline.get('params') != results['params']:
+            print("  ⚠️ Parámetros distintos a la línea base; la comparación puede no ser válida")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            for message in regressions:
+                print(f"❌ {message}")
+            sys.exit(1)
+        print("✅ Sin regresiones")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark de /api/historical: tiempo y memoria pico según el tamaño del rango.
+
+Siembra N lecturas en una BD temporal (SQLite o --database-url) y pide el rango
+crudo completo dos veces: en streaming (sin max_points) y por la ruta en memoria
+(query_historical). La memoria pico se mide con tracemalloc; en streaming debe
+mantenerse casi constante al crecer N. Al final compara bytes transferidos y
+tiempo de servidor por formato (JSON / columnar, sin comprimir, gzip y brotli) y
+el tiempo de un request repetido con el caché de bloques frío y caliente.
+
+    python debug/bench_historical.py --readings 100000 200000 400000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de /api/historical")
+    parser.add_argument("--readings", type=int, nargs='+', default=[100000, 200000, 400000],
+                        help="Tamaños de rango (lecturas) a medir")
+    parser.add_argument("--modules", type=int, default=10, help="Módulos simulados")
+    parser.add_argument("--database-url", default=None, help="BD a usar (por defecto SQLite temporal)")
+    return parser.parse_args()
+
+
+def seed(db, Lectura, n, modules, offset):
+    """Noisy readings (2 decimals, like the firmware) plus their rollups"""
+    from api_avicola.rollups import update_rollups
+    from api_avicola.cache import HistoricalCache, bump_version
+
+    rng = random.Random(offset)
+    dialect = db.session.get_bind().dialect.name
+    start = datetime.now() - timedelta(days=80)
+    rows = []
+    for i in range(offset, offset + n):
+        rows.append({
+            'id_lectura': uuid.uuid4().hex,
+            'modulo': f'M{i % modules + 1}',
+            'hora': start + timedelta(seconds=5 * (i // modules)),
+            'temperatura': round(rng.gauss(28, 2), 2),
+            'humedad': round(rng.gauss(65, 5), 2),
+            'co': round(rng.uniform(0, 20), 2),
+            'co2': round(rng.gauss(900, 150), 2),
+            'amoniaco': None if i % 7 == 0 else round(rng.uniform(0, 30), 2)
+        })
+        if len(rows) == 50000:
+            db.session.execute(db.insert(Lectura), rows)
+            update_rollups(db.session, rows, dialect)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(Lectura), rows)
+        update_rollups(db.session, rows, dialect)
+    # Son lecturas tardías (bloques ya cerrados): como en la ingesta, invalidan el caché histórico
+    bump_version(HistoricalCache.VERSION_NAME)
+    db.session.commit()
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix='bench_historical_')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api_avicola.api import app, historical_cache
+        from api_avicola.models import db, Lectura
+        from api_avicola import historical
+
+    client = app.test_client()
+    seeded = 0
+    print(f"{'lecturas':>10} {'modo':>10} {'tiempo':>9} {'mem. pico':>11} {'bytes':>12}")
+    for n in sorted(args.readings):
+        with app.app_context():
+            seed(db, Lectura, n - seeded, args.modules, seeded)
+        # Sin esto el stream del tamaño siguiente leería los bloques cacheados del anterior
+        historical_cache.invalidate()
+        seeded = n
+
+        def streamed():
+            response = client.get('/api/historical?range=90d&resolution=raw')
+            return sum(len(chunk) for chunk in response.response)
+
+        def in_memory():
+            with app.app_context():
+                return len(app.json.dumps(historical.query_historical('90d', resolution='raw')))
+
+        for name, fn in (('stream', streamed), ('memoria', in_memory)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, peak, size = measure(fn)
+            print(f"{n:>10,} {name:>10} {elapsed:>8.2f}s {peak / 2**20:>9.1f}MB {size:>12,}")
+
+    compare_formats(client, '/api/historical?range=90d&resolution=raw')
+    compare_formats(client, '/api/historical?range=90d&resolution=1m')
+    compare_cache(client, ('/api/historical?range=7d&resolution=raw',
+                           '/api/historical?range=90d&resolution=1m',
+                           '/api/historical?range=90d&resolution=15m'))
+
+
+def compare_cache(client, urls):
+    from api_avicola.api import historical_cache
+
+    print(f"\n{'url':>44} {'frío':>9} {'caliente':>9}")
+    for url in urls:
+        timings = []
+        historical_cache.invalidate()
+        for _ in range(2):
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = client.get(url, headers={'Accept-Encoding': 'identity'})
+                sum(len(chunk) for chunk in response.response)
+            timings.append(time.perf_counter() - t0)
+        print(f"{url:>44} {timings[0]:>8.2f}s {timings[1]:>8.2f}s")
+    print(client.get('/api/historical/cache').get_json())
+
+
+def compare_formats(client, url):
+    print(f"\n{url}")
+    print(f"{'formato':>10} {'encoding':>9} {'tiempo':>9} {'bytes':>12} {'reducción':>10}")
+    accept_columnar = 'application/vnd.avicola.columnar, application/json;q=0.9'
+    baseline = None
+    for name, accept in (('json', 'application/json'), ('columnar', accept_columnar)):
+        for content_encoding in ('identity', 'gzip', 'br'):
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = client.get(url, headers={'Accept': accept, 'Accept-Encoding': content_encoding})
+                size = sum(len(chunk) for chunk in response.response)
+            elapsed = time.perf_counter() - t0
+            if response.headers.get('Content-Encoding', 'identity') != content_encoding:
+                continue  # p. ej. brotli no instalado
+            baseline = baseline or size
+            print(f"{name:>10} {content_encoding:>9} {elapsed:>8.2f}s {size:>12,} {baseline / size:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: POST /lecturas (una lectura por request) vs POST /lecturas/batch
+
+Usa el cliente de pruebas de Flask contra una BD SQLite temporal (o DATABASE_URL
+si se pasa --database-url), así mide solo el costo del endpoint, sin red.
+
+    python debug/bench_ingest.py --readings 500 --batch-size 200
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta de lecturas")
+    parser.add_argument("--readings", type=int, default=500, help="Lecturas por escenario")
+    parser.add_argument("--batch-size", type=int, default=200, help="Lecturas por request en modo batch")
+    parser.add_argument("--modules", type=int, default=40, help="Módulos simulados")
+    parser.add_argument("--database-url", default=None, help="BD a usar (por defecto SQLite temporal)")
+    return parser.parse_args()
+
+
+def make_readings(count, modules, start):
+    readings = []
+    for i in range(count):
+        readings.append({
+            'id_lectura': str(uuid.uuid4()),
+            'modulo': f'M{i % modules + 1}',
+            'hora': (start + timedelta(seconds=i)).isoformat(),
+            'temperatura': 26.0 + (i % 7) * 0.1,
+            'humedad': 55.0,
+            'co': 5.0,
+            'co2': 900.0,
+            'amoniaco': 12.0
+        })
+    return readings
+
+
+def bench_single(client, readings):
+    start = time.perf_counter()
+    for reading in readings:
+        response = client.post('/lecturas', json=reading)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return time.perf_counter() - start
+
+
+def bench_batch(client, readings, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch_size):
+        response = client.post('/lecturas/batch', json=readings[i:i + batch_size])
+        assert response.status_code == 200, response.get_data(as_text=True)
+        assert response.get_json()['failed'] == 0
+    return time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix='bench_ingest_')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+    from api_avicola import api
+
+    client = api.app.test_client()
+    client.post('/api/umbrales/init')
+
+    now = datetime.now()
+    single = make_readings(args.readings, args.modules, now)
+    batch = make_readings(args.readings, args.modules, now + timedelta(days=1))
+
+    # Los endpoints imprimen por cada lectura; no medir la consola
+    with contextlib.redirect_stdout(io.StringIO()):
+        t_single = bench_single(client, single)
+        t_batch = bench_batch(client, batch, args.batch_size)
+
+    rate_single = args.readings / t_single
+    rate_batch = args.readings / t_batch
+    print(f"DATABASE_URL: {os.environ['DATABASE_URL']}")
+    print(f"POST /lecturas        {args.readings} lecturas en {t_single:.2f}s -> {rate_single:,.0f} lecturas/s")
+    print(f"POST /lecturas/batch  {args.readings} lecturas en {t_batch:.2f}s -> {rate_batch:,.0f} lecturas/s "
+          f"(lotes de {args.batch_size})")
+    print(f"Speedup: {rate_batch / rate_single:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
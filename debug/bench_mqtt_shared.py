@@ -0,0 +1,184 @@
+"""
+Benchmark del suscriptor MQTT con suscripción compartida (1, 2, 4... workers).
+
+Necesita un broker local con $share (Mosquitto >= 1.6):
+
+    mosquitto -p 1883 &
+    python debug/bench_mqtt_shared.py --workers 1 2 4 --messages 50000
+
+Por cada cantidad de workers levanta run_mqtt.py (MQTT_WORKERS=n, su propio grupo)
+apuntando a un sumidero HTTP local que imita POST /lecturas/batch, publica
+--messages lecturas JSON en sensor/moduloX/data lo más rápido posible y mide
+lecturas/s hasta que el sumidero las recibió todas. Después publica --legacy-rounds
+rondas del esquema viejo (un valor por sensor) y verifica que cada módulo se
+reensambla completo y en orden: la temperatura lleva el número de ronda.
+
+En JSON la temperatura lleva también un número de secuencia por módulo; las
+inversiones entre workers son esperables (el broker reparte round-robin) y se
+informan solo como referencia.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import paho.mqtt.client as mqtt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from api_avicola.mqtt_subscriber import LEGACY_SENSORS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark del suscriptor MQTT compartido")
+    parser.add_argument("--broker", default="localhost", help="Broker MQTT")
+    parser.add_argument("--port", type=int, default=1883, help="Puerto del broker")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4], help="Cantidades de workers a medir")
+    parser.add_argument("--messages", type=int, default=20000, help="Lecturas JSON por escenario")
+    parser.add_argument("--modules", type=int, default=64, help="Módulos simulados")
+    parser.add_argument("--legacy-rounds", type=int, default=3, help="Rondas del esquema viejo (1 por segundo)")
+    parser.add_argument("--sink-port", type=int, default=5099, help="Puerto del sumidero HTTP")
+    parser.add_argument("--timeout", type=float, default=120, help="Espera máxima por escenario (s)")
+    return parser.parse_args()
+
+
+class Sink:
+    """Counts the readings POSTed by the workers and tracks per-module order"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+            self.last = defaultdict(lambda: -1.0)
+            self.inversions = 0
+            self.incomplete = 0
+
+    def add(self, batch):
+        with self.lock:
+            for reading in batch:
+                self.count += 1
+                sequence = reading.get('temperatura') or 0.0
+                if sequence < self.last[reading['modulo']]:
+                    self.inversions += 1
+                self.last[reading['modulo']] = max(sequence, self.last[reading['modulo']])
+                if None in (reading.get('humedad'), reading.get('co'), reading.get('co2'), reading.get('amoniaco')):
+                    self.incomplete += 1
+
+    def serve(self, port):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                batch = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                sink.add(batch)
+                body = json.dumps({'results': [], 'failed': 0}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def start_subscribers(args, workers):
+    env = dict(os.environ,
+               MQTT_BROKER=args.broker,
+               MQTT_PORT=str(args.port),
+               MQTT_WORKERS=str(workers),
+               MQTT_SHARE_GROUP=f'bench{workers}',
+               MQTT_LEGACY_MODULES=f'1-{args.modules}',
+               SUBSCRIBER_MODE='http',
+               API_BATCH_URL=f'http://127.0.0.1:{args.sink_port}/lecturas/batch',
+               SPOOL_DIR='')
+    return subprocess.Popen([sys.executable, os.path.join(ROOT, 'run_mqtt.py')], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_for(sink, expected, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if sink.count >= expected:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run_scenario(args, sink, publisher, workers):
+    process = start_subscribers(args, workers)
+    try:
+        # Dar tiempo a que todos los workers se suscriban
+        time.sleep(2 + workers * 0.5)
+
+        sink.reset()
+        sequence = defaultdict(int)
+        t0 = time.perf_counter()
+        for i in range(args.messages):
+            module = i % args.modules + 1
+            sequence[module] += 1
+            payload = {'temp': float(sequence[module]), 'hum': 60.0, 'co': 5.0, 'co2': 800.0, 'nh3': 3.0}
+            publisher.publish(f'sensor/modulo{module}/data', json.dumps(payload))
+        delivered = wait_for(sink, args.messages, args.timeout)
+        elapsed = time.perf_counter() - t0
+        json_result = (sink.count, elapsed, sink.inversions)
+
+        sink.reset()
+        for round_number in range(1, args.legacy_rounds + 1):
+            for module in range(1, args.modules + 1):
+                for sensor in LEGACY_SENSORS:
+                    value = round_number if sensor == 'temperatura' else 1.0
+                    publisher.publish(f'sensor/modulo{module}/{sensor}', str(value))
+            time.sleep(1.05)
+        wait_for(sink, args.legacy_rounds * args.modules, 10)
+        legacy_result = (sink.count, sink.inversions, sink.incomplete)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    count, elapsed, inversions = json_result
+    legacy_count, legacy_inversions, legacy_incomplete = legacy_result
+    print(f"{workers:>8} {count:>9,} {count / elapsed:>10,.0f}/s {inversions:>11,} "
+          f"{legacy_count:>8,}/{args.legacy_rounds * args.modules:<6,} {legacy_inversions:>6} {legacy_incomplete:>10}"
+          + ("" if delivered else "  (timeout)"))
+
+
+def main():
+    args = parse_args()
+    sink = Sink()
+    server = sink.serve(args.sink_port)
+
+    publisher = mqtt.Client(client_id='avicola-bench-publisher')
+    publisher.connect(args.broker, args.port)
+    publisher.loop_start()
+
+    print(f"{'workers':>8} {'lecturas':>9} {'ritmo':>12} {'inversiones':>11} "
+          f"{'viejo recibidas':>15} {'orden':>6} {'incompletas':>10}")
+    try:
+        for workers in args.workers:
+            run_scenario(args, sink, publisher, workers)
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Regresión de planes de consulta para lecturas/alertas.
+
+Crea una BD de prueba (SQLite temporal o --database-url), aplica las migraciones,
+siembra millones de lecturas y alertas, y verifica con EXPLAIN que cada consulta
+caliente de la API use el índice esperado. Sale con código 1 si alguna no lo usa.
+
+    python debug/check_query_plans.py --lecturas 2000000 --alertas 200000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select, text
+
+from api_avicola import migrations
+from api_avicola.models import Lectura, Alerta, lecturas_1m
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Verifica que las consultas calientes usen índices")
+    parser.add_argument("--lecturas", type=int, default=2000000, help="Lecturas a sembrar")
+    parser.add_argument("--alertas", type=int, default=200000, help="Alertas a sembrar")
+    parser.add_argument("--modules", type=int, default=10, help="Módulos simulados")
+    parser.add_argument("--database-url", default=None, help="BD de prueba (por defecto SQLite temporal)")
+    return parser.parse_args()
+
+
+def seed(engine, n_lecturas, n_alertas, modules):
+    start = datetime.now() - timedelta(seconds=5 * n_lecturas // modules)
+    chunk = 50000
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for offset in range(0, n_lecturas, chunk):
+            rows = []
+            for i in range(offset, min(offset + chunk, n_lecturas)):
+                rows.append({
+                    'id_lectura': uuid.UUID(int=rng.getrandbits(128)).hex,
+                    'modulo': f'M{i % modules + 1}',
+                    'hora': start + timedelta(seconds=5 * (i // modules)),
+                    'temperatura': 25 + rng.random() * 10,
+                    'humedad': 50 + rng.random() * 30,
+                    'co': rng.random() * 20,
+                    'co2': 600 + rng.random() * 1500,
+                    'amoniaco': rng.random() * 40
+                })
+            conn.execute(insert(Lectura.__table__), rows)
+
+        tipos = ['temperatura', 'humedad', 'co', 'co2', 'amoniaco']
+        estados = ['active'] * 1 + ['acknowledged'] * 4 + ['resolved'] * 15
+        for offset in range(0, n_alertas, chunk):
+            rows = []
+            for i in range(offset, min(offset + chunk, n_alertas)):
+                rows.append({
+                    'tipo': rng.choice(tipos),
+                    'prioridad': rng.choice(['critical', 'warning', 'warning']),
+                    'mensaje': 'seed',
+                    'modulo': f'M{rng.randint(1, modules)}',
+                    'valor_actual': 1.0,
+                    'umbral': 1.0,
+                    'estado': rng.choice(estados),
+                    'timestamp': start + timedelta(seconds=30 * i)
+                })
+            conn.execute(insert(Alerta.__table__), rows)
+    if engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('ANALYZE lecturas'))
+            conn.execute(text('ANALYZE alertas'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+
+
+def hot_queries():
+    """(nombre, consulta, índice esperado) con la misma forma que usan los endpoints
+
+    El índice puede ser una tupla cuando el nombre depende del motor (p. ej. la PK).
+    """
+    since = datetime.now() - timedelta(hours=24)
+    latest = select(Lectura.modulo, func.max(Lectura.hora).label('hora')).group_by(Lectura.modulo).subquery()
+    return [
+        ('live-data: última lectura del módulo',
+         select(Lectura).where(Lectura.modulo == 'M1').order_by(Lectura.hora.desc()).limit(1),
+         'ix_lecturas_modulo_hora'),
+        ('live cache warm: última lectura por módulo',
+         select(Lectura).join(latest, (Lectura.modulo == latest.c.modulo) & (Lectura.hora == latest.c.hora)),
+         'ix_lecturas_modulo_hora'),
+        ('live cache catch-up: lecturas recientes',
+         select(Lectura).where(Lectura.hora > datetime.now() - timedelta(minutes=5)),
+         'ix_lecturas_hora'),
+        ('historical: rango, todas las casas',
+         select(Lectura).where(Lectura.hora >= since).order_by(Lectura.hora),
+         'ix_lecturas_hora'),
+        ('historical: rango + casa',
+         select(Lectura).where(Lectura.hora >= since, Lectura.modulo == 'M3').order_by(Lectura.hora),
+         'ix_lecturas_modulo_hora'),
+        ('historical 1m: rango, todas las casas',
+         select(lecturas_1m).where(lecturas_1m.c.bucket >= since).order_by(lecturas_1m.c.bucket),
+         'ix_lecturas_1m_bucket'),
+        ('historical 1m: rango + casa',
+         select(lecturas_1m).where(lecturas_1m.c.bucket >= since, lecturas_1m.c.modulo == 'M3')
+         .order_by(lecturas_1m.c.bucket),
+         ('lecturas_1m_pkey', 'sqlite_autoindex_lecturas_1m_1')),
+        ('alerts: debounce (tipo, modulo)',
+         select(Alerta).where(Alerta.tipo == 'co2', Alerta.modulo == 'M2').order_by(Alerta.timestamp.desc()).limit(1),
+         'ix_alertas_tipo_modulo_timestamp'),
+        ('alerts: listado reciente',
+         select(Alerta).order_by(Alerta.timestamp.desc()).limit(100),
+         'ix_alertas_timestamp'),
+        ('alerts: listado por módulo',
+         select(Alerta).where(Alerta.modulo == 'M4').order_by(Alerta.timestamp.desc()).limit(100),
+         'ix_alertas_modulo_timestamp'),
+        ('alerts: activas críticas',
+         select(Alerta).where(Alerta.prioridad == 'critical', Alerta.estado == 'active')
+         .order_by(Alerta.timestamp.desc()).limit(100),
+         'ix_alertas_active_prioridad_timestamp'),
+        ('alert stats: resueltas',
+         select(func.count()).select_from(Alerta).where(Alerta.estado == 'resolved'),
+         'ix_alertas_estado_prioridad'),
+    ]
+
+
+def explain(conn, query):
+    sql = str(query.compile(conn, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'postgresql':
+        rows = conn.execute(text(f'EXPLAIN {sql}'))
+    else:
+        rows = conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def main():
+    args = parse_args()
+    url = args.database_url
+    if not url:
+        tmp_dir = tempfile.mkdtemp(prefix='query_plans_')
+        url = f"sqlite:///{os.path.join(tmp_dir, 'plans.db')}"
+    engine = create_engine(url)
+
+    migrations.upgrade(engine)
+    t0 = time.perf_counter()
+    seed(engine, args.lecturas, args.alertas, args.modules)
+    print(f"Sembradas {args.lecturas:,} lecturas y {args.alertas:,} alertas en {time.perf_counter() - t0:.1f}s ({url})\n")
+
+    failures = 0
+    with engine.connect() as conn:
+        for name, query, index in hot_queries():
+            plan = explain(conn, query)
+            t0 = time.perf_counter()
+            conn.execute(query).fetchall()
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            ok = any(name in plan for name in (index if isinstance(index, tuple) else (index,)))
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {name} ({elapsed_ms:.1f} ms) -> esperado {index}")
+            if not ok:
+                print('     ' + plan.replace('\n', '\n     '))
+
+    if failures:
+        print(f"\n{failures} consulta(s) sin el índice esperado")
+        sys.exit(1)
+    print("\nTodas las consultas usan el índice esperado")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,75 @@
-import paho.mqtt.client as mqtt
-import time
+"""
+Generador de carga MQTT: módulos virtuales que publican como el firmware real.
+
+Cada módulo virtual imita a firmware_modulo_iot_json: cada --interval segundos
+(SEND_INTERVAL del firmware, 5 s) publica en sensor/moduloN/data el mismo JSON
+(temp/hum con un decimal, co/nh3 en crudo del ADC con co_raw/nh3_raw, co2/tvoc,
+null cuando el sensor falla y el bloque stats con sus contadores acumulados).
+Con --schema legacy publica en cambio un valor por sensor en
+sensor/moduloN/{temperatura,humedad,co,co2,nh3} como el firmware viejo (los
+sensores que fallan no publican; el suscriptor necesita MQTT_TOPIC=sensor/#).
+
+    python debug/simulation.py --modules 500 --processes 4 --seed 7
+    python debug/simulation.py --modules 200 --schema legacy --null-rate 0.05 \\
+        --burst-rate 0.01 --disconnect-rate 0.002 --duration 600
+
+Los módulos se reparten entre --processes procesos (uno por núcleo escala a
+miles de módulos); dentro de cada proceso cada módulo es una tarea asyncio con
+su propio horario, desfasado al azar como equipos que arrancaron en distintos
+momentos, y todos comparten una conexión MQTT.
+
+Todo el azar de un módulo sale de Random(f'{seed}:{número}'): con la misma
+semilla cada módulo publica la misma secuencia de mensajes, sin importar en qué
+proceso cae ni cuántos procesos haya. Fallas inyectables, por envío:
+
+- --null-rate: cada sensor (DHT22, MQ-7, MQ-137, CCS811) falla con esa
+  probabilidad y sus campos van en null, igual que en el firmware;
+- --burst-rate: el módulo manda --burst-size lecturas seguidas (reintentos,
+  reloj adelantado);
+- --disconnect-rate: el módulo se desconecta --disconnect-seconds; el firmware
+  no guarda lecturas, las de ese lapso se pierden.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import queue
 import random
+import signal
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+# environment variables
+MQTT_BROKER = os.getenv('MQTT_BROKER', 'localhost')
+MQTT_PORT = int(os.getenv('MQTT_PORT', '1883'))
+SIM_MODULES = int(os.getenv('SIM_MODULES', '3'))
+SIM_SEED = int(os.getenv('SIM_SEED', '1'))
 
-# Valores iniciales realistas
-temperature = 28.0
-humidity = 55.0
-ammonia = 20.0
-co2 = 900.0
+# SEND_INTERVAL del firmware (ms -> s)
+SEND_INTERVAL = 5.0
+# Rango válido del ADC para MQ-7/MQ-137 en el firmware
+ADC_VALID = (10, 4000)
+ADC_MAX = 4095
+# Clave del JSON -> sensor del topic del firmware viejo
+LEGACY_TOPICS = {
+    'temp': 'temperatura',
+    'hum': 'humedad',
+    'co': 'co',
+    'co2': 'co2',
+    'nh3': 'nh3',
+}
+# Cada cuánto informa cada proceso (s)
+REPORT_INTERVAL = 10
 
-# Cliente MQTT (se inicializa en start())
-client = None
 
 # Función para generar variaciones suaves
-def smooth_variation(value, min_val, max_val, max_step):
+def smooth_variation(value, min_val, max_val, max_step, rng=random):
     # Variación suave entre -max_step y +max_step
-    step = random.uniform(-max_step, max_step)
+    step = rng.uniform(-max_step, max_step)
     value += step
 
     # Limitar dentro del rango
@@ -23,61 +78,293 @@ def smooth_variation(value, min_val, max_val, max_step):
 
     return round(value, 2)
 
-def start():
-    global temperature, humidity, ammonia, co2, client
-    
-    print("🎮 Iniciando Simulación de Lecturas MQTT...")
-    print("🔌 Conectando a broker MQTT en localhost:1883...")
-    
+
+class Faults:
+    """Fault injection probabilities, evaluated per send"""
+
+    def __init__(self, null_rate=0.0, burst_rate=0.0, burst_size=5, disconnect_rate=0.0,
+                 disconnect_seconds=60.0):
+        self.null_rate = null_rate
+        self.burst_rate = burst_rate
+        self.burst_size = burst_size
+        self.disconnect_rate = disconnect_rate
+        self.disconnect_seconds = disconnect_seconds
+
+
+class VirtualModule:
+    """One barn module: firmware payloads from its own seeded random stream"""
+
+    def __init__(self, number, seed=SIM_SEED, faults=None, schema='json', interval=SEND_INTERVAL):
+        self.number = number
+        self.schema = schema
+        self.faults = faults or Faults()
+        self.rng = random.Random(f'{seed}:{number}')
+        self.topic = f'sensor/modulo{number}/data'
+        # Desconexión medida en envíos para que la secuencia no dependa del reloj
+        self.offline_sends = math.ceil(self.faults.disconnect_seconds / interval)
+        self.offline = 0
+
+        rng = self.rng
+        self.values = {'temp': rng.uniform(26, 32), 'hum': rng.uniform(45, 70), 'co': rng.uniform(80, 400),
+                       'nh3': rng.uniform(150, 900), 'co2': rng.uniform(450, 2000), 'tvoc': rng.uniform(0, 300)}
+        # Contadores acumulados del firmware (bloque stats)
+        self.successful_reads = 0
+        self.failed_reads = 0
+        self.zero_readings = 0
+        # Contadores de la simulación
+        self.counters = {'readings': 0, 'messages': 0, 'null_sensors': 0, 'bursts': 0,
+                         'disconnects': 0, 'lost': 0}
+
+    def _fails(self):
+        return self.faults.null_rate and self.rng.random() < self.faults.null_rate
+
+    def _adc(self, value):
+        """Raw ADC reading, out of the valid range when the sensor fails"""
+        if self._fails():
+            self.counters['null_sensors'] += 1
+            return self.rng.choice((0, self.rng.randint(1, ADC_VALID[0] - 1), ADC_MAX))
+        return int(value)
+
+    def read(self):
+        """One reading in the firmware JSON schema (createSensorJSON)"""
+        rng = self.rng
+        v = self.values
+        v['temp'] = smooth_variation(v['temp'], 26, 32, 0.15, rng)
+        v['hum'] = smooth_variation(v['hum'], 45, 70, 0.5, rng)
+        v['co'] = smooth_variation(v['co'], 10, 1500, 4, rng)
+        v['nh3'] = smooth_variation(v['nh3'], 10, 2500, 6, rng)
+        v['co2'] = smooth_variation(v['co2'], 400, 5000, 5, rng)
+        v['tvoc'] = smooth_variation(v['tvoc'], 0, 1200, 2, rng)
+
+        doc = {}
+        has_valid_data = False
+
+        # DHT22: si falla, temp y hum en null (el firmware no cuenta los éxitos del DHT)
+        if self._fails():
+            self.counters['null_sensors'] += 1
+            doc['temp'] = doc['hum'] = None
+            self.failed_reads += 1
+        else:
+            doc['temp'] = round(v['temp'], 1)
+            doc['hum'] = round(v['hum'], 1)
+            has_valid_data = True
+
+        # MQ-7 (CO) y MQ-137 (NH3): valor crudo del ADC, null fuera de rango
+        for key in ('co', 'nh3'):
+            raw = self._adc(v[key])
+            doc[f'{key}_raw'] = raw
+            if ADC_VALID[0] <= raw <= ADC_VALID[1]:
+                doc[key] = raw
+                has_valid_data = True
+                self.successful_reads += 1
+            else:
+                doc[key] = None
+                if raw < ADC_VALID[0]:
+                    self.zero_readings += 1
+                self.failed_reads += 1
+
+        # CCS811 (CO2 y TVOC)
+        if self._fails():
+            self.counters['null_sensors'] += 1
+            doc['co2'] = doc['tvoc'] = None
+            self.failed_reads += 1
+        else:
+            doc['co2'] = int(v['co2'])
+            doc['tvoc'] = int(v['tvoc'])
+            has_valid_data = True
+            self.successful_reads += 1
+
+        doc['stats'] = {
+            'successful_reads': self.successful_reads,
+            'failed_reads': self.failed_reads,
+            'zero_readings': self.zero_readings,
+            'has_valid_data': has_valid_data,
+        }
+        self.counters['readings'] += 1
+        return doc
+
+    def messages(self, doc):
+        """(topic, payload) pairs for one reading in this module's schema"""
+        if self.schema == 'legacy':
+            return [(f'sensor/modulo{self.number}/{sensor}', str(doc[key]))
+                    for key, sensor in LEGACY_TOPICS.items() if doc[key] is not None]
+        return [(self.topic, json.dumps(doc, separators=(',', ':')))]
+
+    def tick(self):
+        """Messages for one send interval, after applying bursts and disconnects"""
+        faults = self.faults
+        if self.offline:
+            # Desconectado: el firmware sigue leyendo pero no publica
+            self.offline -= 1
+            self.read()
+            self.counters['lost'] += 1
+            return []
+        if faults.disconnect_rate and self.rng.random() < faults.disconnect_rate:
+            self.counters['disconnects'] += 1
+            self.offline = self.offline_sends
+            return self.tick()
+
+        count = 1
+        if faults.burst_rate and self.rng.random() < faults.burst_rate:
+            self.counters['bursts'] += 1
+            count = faults.burst_size
+        messages = []
+        for _ in range(count):
+            messages.extend(self.messages(self.read()))
+        self.counters['messages'] += len(messages)
+        return messages
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generador de carga MQTT con módulos virtuales")
+    parser.add_argument("--broker", default=MQTT_BROKER, help="Broker MQTT")
+    parser.add_argument("--port", type=int, default=MQTT_PORT, help="Puerto del broker")
+    parser.add_argument("--modules", type=int, default=SIM_MODULES, help="Módulos virtuales")
+    parser.add_argument("--first-module", type=int, default=1, help="Número del primer módulo")
+    parser.add_argument("--processes", type=int, default=1, help="Procesos entre los que se reparten los módulos")
+    parser.add_argument("--interval", type=float, default=SEND_INTERVAL, help="Segundos entre envíos de cada módulo")
+    parser.add_argument("--schema", choices=('json', 'legacy'), default='json', help="Esquema de topics")
+    parser.add_argument("--seed", type=int, default=SIM_SEED, help="Semilla (misma semilla, mismos mensajes)")
+    parser.add_argument("--duration", type=float, default=0, help="Segundos de simulación (0 = hasta Ctrl+C)")
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=0, help="QoS de publicación")
+    parser.add_argument("--null-rate", type=float, default=0.0, help="Probabilidad de falla por sensor y envío")
+    parser.add_argument("--burst-rate", type=float, default=0.0, help="Probabilidad de ráfaga por envío")
+    parser.add_argument("--burst-size", type=int, default=5, help="Lecturas por ráfaga")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Probabilidad de desconexión por envío")
+    parser.add_argument("--disconnect-seconds", type=float, default=60.0, help="Duración de cada desconexión")
+    return parser.parse_args()
+
+
+def connect(options, name):
+    client = mqtt.Client(client_id=f'avicola-sim-{options.seed}-{name}')
+    client.connect(options.broker, options.port, 60)
+    client.loop_start()
+    return client
+
+
+async def run_module(module, client, options, totals):
+    loop = asyncio.get_running_loop()
+    # Desfase inicial determinista: los equipos no arrancan todos juntos
+    next_at = loop.time() + module.rng.uniform(0, options.interval)
+    while True:
+        await asyncio.sleep(max(next_at - loop.time(), 0))
+        for topic, payload in module.tick():
+            client.publish(topic, payload, qos=options.qos)
+            totals['bytes'] += len(payload)
+        # Horario absoluto: el ritmo no se corre aunque el proceso se atrase
+        next_at += options.interval
+
+
+async def run_modules(modules, client, options, stop, name):
+    totals = {'bytes': 0}
+    tasks = [asyncio.create_task(run_module(module, client, options, totals)) for module in modules]
+    start = last_report = time.monotonic()
+    last_messages = 0
     try:
-        # Crear y conectar cliente MQTT
-        client = mqtt.Client()
-        client.connect("localhost", 1883, 60)
-        print("✅ Conectado al broker MQTT correctamente")
-        
-        # Iniciar loop en background para mantener la conexión
-        client.loop_start()
-        
-    except ConnectionRefusedError:
-        print("❌ ERROR: No se pudo conectar al broker MQTT")
-        print("   💡 El broker MQTT no está ejecutándose en localhost:1883")
-        print("   💡 Para instalar Mosquitto en Windows:")
-        print("      - Descarga desde: https://mosquitto.org/download/")
-        print("      - O usa Docker: docker run -it -p 1883:1883 eclipse-mosquitto")
-        print("   ⚠️  La simulación no se ejecutará sin un broker MQTT")
-        return
-    except Exception as e:
-        print(f"❌ ERROR conectando al broker MQTT: {e}")
-        print("   ⚠️  La simulación no se ejecutará sin un broker MQTT")
-        return
-
-    print("📡 Publicando datos de sensores simulados...")
-    print("   (Presiona Ctrl+C para detener)\n")
+        while not stop.is_set():
+            now = time.monotonic()
+            if options.duration and now - start >= options.duration:
+                break
+            if now - last_report >= REPORT_INTERVAL:
+                messages = sum(m.counters['messages'] for m in modules)
+                print(f"📡 [{name}] {len(modules)} módulos, {messages:,} mensajes "
+                      f"({(messages - last_messages) / (now - last_report):,.0f}/s)", flush=True)
+                last_report, last_messages = now, messages
+            await asyncio.sleep(0.2)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return totals['bytes'], time.monotonic() - start
+
 
+def run_worker(numbers, options, stop, results=None, name='p0'):
+    """Simulate the given module numbers on one MQTT connection; return the totals"""
+    if results is not None:
+        # Proceso hijo: Ctrl+C lo maneja el padre, que avisa por `stop`
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    faults = Faults(options.null_rate, options.burst_rate, options.burst_size,
+                    options.disconnect_rate, options.disconnect_seconds)
+    modules = [VirtualModule(number, options.seed, faults, options.schema, options.interval) for number in numbers]
+    totals = {'modules': len(modules), 'bytes': 0, 'seconds': 0.0}
     try:
-        while True:
-            # Cambios suaves por parámetro
-            temperature = smooth_variation(temperature, 26, 32, 0.15)  # ±0.15 °C
-            humidity    = smooth_variation(humidity, 45, 70, 0.5)     # ±0.5 %
-            ammonia     = smooth_variation(ammonia, 10, 40, 0.2)      # ±0.2 ppm
-            co2         = smooth_variation(co2, 600, 2000, 5)         # ±5 ppm
-
-            # Publicar
-            if client:
-                client.publish("avicola/temp", temperature)
-                client.publish("avicola/humedad", humidity)
-                client.publish("avicola/amoniaco", ammonia)
-                client.publish("avicola/co2", co2)
-
-            print(f"📊 T={temperature}°C H={humidity}% NH3={ammonia}ppm CO2={co2}ppm")
-
-            time.sleep(2)
-    except KeyboardInterrupt:
-        print("\n🛑 Deteniendo simulación...")
-        if client:
+        client = connect(options, name)
+    except (ConnectionRefusedError, OSError) as e:
+        print(f"❌ [{name}] No se pudo conectar al broker MQTT {options.broker}:{options.port}: {e}")
+        totals['error'] = str(e)
+    else:
+        try:
+            totals['bytes'], totals['seconds'] = asyncio.run(run_modules(modules, client, options, stop, name))
+        finally:
             client.loop_stop()
             client.disconnect()
-        print("✅ Simulación detenida correctamente")
+    for module in modules:
+        for key, value in module.counters.items():
+            totals[key] = totals.get(key, 0) + value
+    if results is not None:
+        results.put(totals)
+    return totals
+
+
+def simulate(options, stop=None):
+    """Run the load generator until options.duration elapses or stop is set; return the totals"""
+    numbers = list(range(options.first_module, options.first_module + options.modules))
+    processes = max(1, min(options.processes, len(numbers)))
+    print(f"🎮 Simulando {len(numbers)} módulos ({options.schema}) en {processes} proceso(s), "
+          f"1 envío cada {options.interval:g}s (~{len(numbers) / options.interval:,.0f} lecturas/s), "
+          f"semilla {options.seed}, broker {options.broker}:{options.port}")
+
+    if processes == 1:
+        stop = stop or threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        parts = [run_worker(numbers, options, stop)]
+    else:
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=run_worker, args=(numbers[i::processes], options, stop, results, f'p{i}'),
+                                           daemon=True)
+                   for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        parts = []
+        while len(parts) < processes:
+            try:
+                parts.append(results.get(timeout=0.5))
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    break
+            except KeyboardInterrupt:
+                print("\n🛑 Deteniendo simulación...")
+                stop.set()
+        for worker in workers:
+            worker.join()
+
+    totals = {'errors': sum('error' in part for part in parts)}
+    for part in parts:
+        for key, value in part.items():
+            if key != 'seconds' and isinstance(value, (int, float)):
+                totals[key] = totals.get(key, 0) + value
+    seconds = totals['seconds'] = max((part['seconds'] for part in parts), default=0)
+    print(f"✅ {totals.get('messages', 0):,} mensajes ({totals.get('messages', 0) / (seconds or 1):,.0f}/s), "
+          f"{totals.get('readings', 0):,} lecturas, {totals.get('bytes', 0) / 1e6:,.1f} MB en {seconds:,.0f}s; "
+          f"fallas: {totals.get('null_sensors', 0):,} sensores en null, {totals.get('bursts', 0):,} ráfagas, "
+          f"{totals.get('disconnects', 0):,} desconexiones ({totals.get('lost', 0):,} envíos perdidos)")
+    return totals
+
+
+def start():
+    """Simulation used by main.py -s: SIM_MODULES modules in JSON on the local broker"""
+    print("🎮 Iniciando Simulación de Lecturas MQTT...")
+    options = argparse.Namespace(broker=MQTT_BROKER, port=MQTT_PORT, modules=SIM_MODULES, first_module=1,
+                                 processes=1, interval=SEND_INTERVAL, schema='json', seed=SIM_SEED,
+                                 duration=0, qos=0, null_rate=0.0, burst_rate=0.0, burst_size=5,
+                                 disconnect_rate=0.0, disconnect_seconds=60.0)
+    totals = simulate(options)
+    if totals['errors']:
+        print("   💡 El broker MQTT no está ejecutándose")
+        print("   💡 Con Docker: docker run -it -p 1883:1883 eclipse-mosquitto")
+
 
 if __name__ == '__main__':
-    start()
+    simulate(parse_args())
@@ -1,7 +1,8 @@
-import time, threading, argparse
-from api_avicola import api, mqtt_subscriber
-from dashboard_avicola import dashboard 
-from debug import simulation
+import time, threading, argparse, os, signal, subprocess, sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Servicios del modo producción: cada uno en su proceso
+SERVICES = ('run_api.py', 'run_dashboard.py', 'run_mqtt.py')
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -12,10 +13,49 @@ def parse_args():
         action="store_true",
         help="Enables MQTT simulation"
     )
+    parser.add_argument(
+        "-p", "--production",
+        action="store_true",
+        help="Runs each service in its own process (API and dashboard under gunicorn)"
+    )
     return parser.parse_args()
 
+def run_production(use_simulation: bool = False):
+    """Supervises API, dashboard and subscriber processes; SIGTERM/Ctrl+C stops them gracefully"""
+    from serving import WEB_GRACEFUL_TIMEOUT
+
+    print("Starting POULTRY MONITORING SYSTEM (production)...")
+    processes = [subprocess.Popen([sys.executable, os.path.join(ROOT, script)]) for script in SERVICES]
+    stopping = threading.Event()
+
+    def stop(signum=None, frame=None):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if use_simulation:
+        threading.Thread(target=run_simulation, daemon=True).start()
+
+    # Si un servicio termina solo, se detiene el resto (el orquestador lo reinicia)
+    while not stopping.is_set() and all(p.poll() is None for p in processes):
+        stopping.wait(1)
+
+    print("\nStopping all services...")
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + WEB_GRACEFUL_TIMEOUT + 5
+    for process in processes:
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            process.kill()
+    print("System stopped successfully")
+    return max((p.returncode or 0) for p in processes)
+
 def run_api():
     """Runs the API Flask"""
+    from api_avicola import api
     print("Starting API...")
     try:
         api.start(port=5000, host='0.0.0.0')  
@@ -24,6 +64,7 @@ def run_api():
 
 def run_dashboard():
     """Runs the Dashboard Flask"""
+    from dashboard_avicola import dashboard
     print("Starting DASHBOARD...")
     try:
         dashboard.start(port=5001, host='0.0.0.0') 
@@ -32,6 +73,7 @@ def run_dashboard():
 
 def run_mqtt_subscriber():
     """Runs the MQTT subscriber"""
+    from api_avicola import mqtt_subscriber
     print("Starting MQTT SUBSCRIBER...")
     try:
         mqtt_subscriber.start()
@@ -40,6 +82,7 @@ def run_mqtt_subscriber():
 
 def run_simulation():
     """Runs the simulation"""
+    from debug import simulation
     print("Starting SIMULATION...")
     try:
         simulation.start()
@@ -48,10 +91,16 @@ def run_simulation():
 
 
 def main(use_simulation: bool = False):
+    # Imported here so the production supervisor does not load the apps itself
+    from api_avicola import api
+    from dashboard_avicola import dashboard
 
     print("Starting POULTRY MONITORING SYSTEM...")
     print(f"Mode: {'SIMULATED' if use_simulation else 'REAL'}")
 
+    # API and dashboard share the process: the dashboard proxies call the API app directly
+    dashboard.api_client.use_local_app(api.app)
+
     # Start threads 
     api_thread = threading.Thread(target=run_api, daemon=True)
     dashboard_thread = threading.Thread(target=run_dashboard, daemon=True)
@@ -80,5 +129,7 @@ def main(use_simulation: bool = False):
 
 if __name__ == "__main__":
     args = parse_args()
+    if args.production:
+        sys.exit(run_production(use_simulation=args.simulated))
     # default mode = real 
     main(use_simulation=args.simulated)
@@ -1,15 +1,32 @@
+import argparse
 import sys
 import os
 
 # Agregar el directorio raíz al path para importar módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from api_avicola import api
+import serving
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="API Service")
+    parser.add_argument("--dev", action="store_true", help="Servidor de desarrollo de Flask en vez de gunicorn")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting API Service...")
     try:
-        api.start(port=5000, host='0.0.0.0')
+        # Antes de importar la app (worker gevent)
+        if not args.dev:
+            serving.patch_for_worker_class()
+        from api_avicola import api
+
+        if args.dev:
+            api.start(port=5000, host='0.0.0.0')
+        else:
+            serving.serve(api.app, 'api', port=5000, after_fork=api.after_fork, on_shutdown=api.on_shutdown)
     except Exception as e:
         print(f"Error starting API: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
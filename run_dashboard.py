@@ -1,15 +1,32 @@
+import argparse
 import sys
 import os
 
 # Agregar el directorio raíz al path para importar módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from dashboard_avicola import dashboard
+import serving
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dashboard Service")
+    parser.add_argument("--dev", action="store_true", help="Servidor de desarrollo de Flask en vez de gunicorn")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting Dashboard Service...")
     try:
-        dashboard.start(port=5001, host='0.0.0.0')
+        # Antes de importar la app (worker gevent)
+        if not args.dev:
+            serving.patch_for_worker_class()
+        from dashboard_avicola import dashboard
+
+        if args.dev:
+            dashboard.start(port=5001, host='0.0.0.0')
+        else:
+            serving.serve(dashboard.app, 'dashboard', port=5001, after_fork=dashboard.after_fork)
     except Exception as e:
         print(f"Error starting Dashboard: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
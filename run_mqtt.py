@@ -4,12 +4,16 @@ import os
 # Agregar el directorio raíz al path para importar módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from api_avicola import mqtt_subscriber
+from api_avicola import mqtt_subscriber, subscriber_supervisor
 
 if __name__ == "__main__":
     print("Starting MQTT Subscriber Service...")
     try:
-        mqtt_subscriber.start()
+        if mqtt_subscriber.MQTT_WORKERS > 1:
+            # Varios procesos en una suscripción compartida
+            subscriber_supervisor.start()
+        else:
+            mqtt_subscriber.start()
     except Exception as e:
         print(f"Error starting MQTT Subscriber: {e}")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Servidor WSGI de producción (gunicorn) para la API y el dashboard.
+
+Pre-fork: el proceso master importa la app una sola vez (migraciones y arranque
+corren una vez) y hace fork de WEB_WORKERS procesos. Por defecto cada worker es
+gevent: cada request, y cada cliente SSE de /api/stream que queda abierto, es un
+greenlet y no ocupa un hilo (con psycogreen las consultas a PostgreSQL ceden el
+control). Con WEB_WORKER_CLASS=gthread cada worker atiende con WEB_THREADS hilos y
+un stream abierto retiene un hilo, así que se limitan a la mitad de los hilos por
+worker (STREAM_MAX_CLIENTS). Después del fork cada worker descarta las conexiones
+a la BD heredadas del master (hook after_fork de la app).
+
+Apagado: con SIGTERM el master deja de aceptar conexiones y espera hasta
+WEB_GRACEFUL_TIMEOUT segundos a que terminen los requests en curso. Los streams
+sin fin (SSE) se cierran al recibir la señal (hook on_shutdown de la app) para no
+retener el apagado; el navegador reconecta solo a otro worker.
+
+Estado entre workers: los cachés en proceso se invalidan con los contadores de
+cache_versions (api_avicola/cache.py, dashboard_avicola/user_cache.py). El rate
+limiting usa RATELIMIT_STORAGE_URI: con memory:// cada worker cuenta por separado,
+en producción conviene redis://.
+"""
+import multiprocessing
+import signal
+import os
+
+from dotenv import load_dotenv
+
+# Se carga antes de importar las apps: la configuración del servidor también puede venir del .env
+load_dotenv()
+
+# environment variables
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+WEB_THREADS = int(os.getenv('WEB_THREADS', '8'))
+WEB_WORKER_CLASS = os.getenv('WEB_WORKER_CLASS', 'gevent')
+WEB_WORKER_CONNECTIONS = int(os.getenv('WEB_WORKER_CONNECTIONS', '1000'))
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', '60'))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', '5'))
+# Reciclar cada worker tras N requests (0 = nunca)
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', '0'))
+RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+
+
+def patch_for_worker_class():
+    """Monkey-patch for the gevent worker; must run before the app is imported"""
+    if WEB_WORKER_CLASS == 'gthread':
+        # Cada stream SSE retiene un hilo: dejar siempre hilos libres para el resto
+        os.environ.setdefault('STREAM_MAX_CLIENTS', str(max(WEB_THREADS // 2, 1)))
+    if WEB_WORKER_CLASS != 'gevent':
+        return
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        print("⚠️ psycogreen no instalado: las consultas a PostgreSQL bloquean el worker gevent")
+    else:
+        patch_psycopg()
+
+
+def _options(bind, name, after_fork, on_shutdown):
+    def post_fork(server, worker):
+        if after_fork:
+            after_fork()
+
+    def post_worker_init(worker):
+        if not on_shutdown:
+            return
+        handle_exit = signal.getsignal(signal.SIGTERM)
+        if handle_exit != worker.handle_exit:
+            return  # el worker maneja las señales por su cuenta (p. ej. gevent)
+
+        def graceful(signum, frame):
+            on_shutdown()
+            handle_exit(signum, frame)
+        signal.signal(signal.SIGTERM, graceful)
+        signal.siginterrupt(signal.SIGTERM, False)
+
+    options = {
+        'bind': bind,
+        'proc_name': name,
+        'workers': WEB_WORKERS,
+        'worker_class': WEB_WORKER_CLASS,
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'keepalive': WEB_KEEPALIVE,
+        'max_requests': WEB_MAX_REQUESTS,
+        'max_requests_jitter': WEB_MAX_REQUESTS // 10,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+    }
+    if WEB_WORKER_CLASS == 'gthread':
+        options['threads'] = WEB_THREADS
+    else:
+        options['worker_connections'] = WEB_WORKER_CONNECTIONS
+    return options
+
+
+def serve(app, name, port, host='0.0.0.0', after_fork=None, on_shutdown=None):
+    """Run a Flask app under gunicorn until the master gets SIGTERM/SIGINT"""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in _options(f'{host}:{port}', name, after_fork, on_shutdown).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    if WEB_WORKERS > 1 and RATELIMIT_STORAGE_URI.startswith('memory'):
+        print(f"⚠️ {name}: rate limiting en memoria con {WEB_WORKERS} workers (cada worker cuenta aparte)")
+    print(f"{name}: gunicorn {WEB_WORKER_CLASS} en {host}:{port}, workers={WEB_WORKERS}"
+          + (f", threads={WEB_THREADS}" if WEB_WORKER_CLASS == 'gthread' else ''))
+    Server().run()
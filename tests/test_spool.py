@@ -0,0 +1,79 @@
+"""Spool replay against the direct database writer (SQLite)."""
+from datetime import datetime
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from api_avicola import migrations
+from api_avicola.db_writer import DatabaseSink
+from api_avicola.spool import Spool
+
+
+def lectura(n):
+    return {'id_lectura': f'm1-{n}', 'modulo': '1', 'hora': datetime(2026, 1, 1, 0, n).isoformat(),
+            'temperatura': 20.0 + n}
+
+
+def replay(spool, sink, timeout=10):
+    """Run the replay thread until the spool is empty"""
+    spool.start(sink)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = spool.stats()
+        if stats['depth'] == 0 and stats['segments'] == 0:
+            break
+        time.sleep(0.05)
+    spool.stop()
+    return spool.stats()
+
+
+@pytest.fixture
+def sink(tmp_path):
+    url = f"sqlite:///{tmp_path / 'avicola.db'}"
+    migrations.upgrade(create_engine(url))
+    sink = DatabaseSink(url)
+    yield sink
+    sink.close()
+
+
+def scalar(sink, sql):
+    with sink.engine.connect() as conn:
+        return conn.execute(text(sql)).scalar()
+
+
+def test_replay_skips_ids_already_written(sink, tmp_path):
+    # Caída entre sink.send y _write_ack: el lote ya está en la BD y vuelve a salir del spool
+    sink.send([lectura(1), lectura(2)])
+    spool = Spool(str(tmp_path / 'spool'), replay_rate=0, retry_interval=0.1, stats_interval=0)
+    spool.append([lectura(1), lectura(2), lectura(3)])
+
+    stats = replay(spool, sink)
+
+    assert stats['segments'] == 0
+    assert stats['replayed'] == 1
+    assert stats['rejected'] == 2
+    assert scalar(sink, 'SELECT COUNT(*) FROM lecturas') == 3
+    # Los rollups no cuentan dos veces las lecturas repetidas
+    assert scalar(sink, 'SELECT SUM(n) FROM lecturas_1m') == 3
+
+
+def test_replay_quarantines_rows_the_sink_refuses(sink, tmp_path):
+    class RefusingSink:
+        def send(self, batch):
+            if any(item['id_lectura'] == 'm1-2' for item in batch):
+                raise ValueError('value out of range')
+            return sink.send(batch)
+
+    directory = tmp_path / 'spool'
+    spool = Spool(str(directory), replay_rate=0, retry_interval=0.1, stats_interval=0)
+    spool.append([lectura(1), lectura(2), lectura(3)])
+
+    stats = replay(spool, RefusingSink())
+
+    assert stats['segments'] == 0
+    assert stats['quarantined'] == 1
+    assert scalar(sink, 'SELECT COUNT(*) FROM lecturas') == 2
+    rejected = list(directory.glob('*.rejected'))
+    assert len(rejected) == 1
+    assert 'm1-2' in rejected[0].read_text()